@@ -0,0 +1,8 @@
+int main() {
+  int x, y = 3;
+  float z = 4.5;
+  x = y + 5;
+  z = (float)x;
+  y = (int)z;
+  return 0;
+}
\ No newline at end of file
@@ -0,0 +1,9 @@
+int main () {
+    float f[] = {1.0, 2.5, 5.0};
+    char s[] = "xpto";
+    int v[3][2] = {{1,3}, {2,6}, {3,9}};
+    int i = 1, j = 0;
+    print("Isto é um teste:", s[j+2]);
+    print(f[i], v[i][j]);
+    return 0;
+}
\ No newline at end of file
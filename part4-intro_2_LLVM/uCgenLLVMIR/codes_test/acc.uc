@@ -0,0 +1,14 @@
+int acc(int n, int a) {
+    int r;
+    if (n == 0)
+        return a;
+    r = acc(n - 1, a + n);
+    return r;
+}
+
+int main() {
+    int r;
+    r = acc(100, 0);
+    print(r);
+    return 0;
+}
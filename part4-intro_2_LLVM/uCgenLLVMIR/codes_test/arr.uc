@@ -0,0 +1,16 @@
+int main() {
+    int v[10];
+    int i, t;
+    float f = 1.5;
+    char c[] = "hello";
+    for (i = 0; i < 10; i++)
+        v[i] = i * i;
+    t = 0;
+    for (i = 0; i < 10; i++)
+        t = t + v[i];
+    print(t, " ", f, " ", c[1]);
+    print();
+    f = f * 2.0;
+    print(f);
+    return t;
+}
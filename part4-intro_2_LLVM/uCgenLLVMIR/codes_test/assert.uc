@@ -0,0 +1,5 @@
+int main() {
+    int x = 3;
+    assert x == 4;
+    return 0;
+}
@@ -0,0 +1,47 @@
+int main() {
+    int i, s = 0;
+    for (i = 0; i < 4000; i++) {
+        if (i % 41 == 0) s = s + 0;
+        if (i % 41 == 1) s = s + 1;
+        if (i % 41 == 2) s = s + 2;
+        if (i % 41 == 3) s = s + 3;
+        if (i % 41 == 4) s = s + 4;
+        if (i % 41 == 5) s = s + 5;
+        if (i % 41 == 6) s = s + 6;
+        if (i % 41 == 7) s = s + 7;
+        if (i % 41 == 8) s = s + 8;
+        if (i % 41 == 9) s = s + 9;
+        if (i % 41 == 10) s = s + 10;
+        if (i % 41 == 11) s = s + 11;
+        if (i % 41 == 12) s = s + 12;
+        if (i % 41 == 13) s = s + 13;
+        if (i % 41 == 14) s = s + 14;
+        if (i % 41 == 15) s = s + 15;
+        if (i % 41 == 16) s = s + 16;
+        if (i % 41 == 17) s = s + 17;
+        if (i % 41 == 18) s = s + 18;
+        if (i % 41 == 19) s = s + 19;
+        if (i % 41 == 20) s = s + 20;
+        if (i % 41 == 21) s = s + 21;
+        if (i % 41 == 22) s = s + 22;
+        if (i % 41 == 23) s = s + 23;
+        if (i % 41 == 24) s = s + 24;
+        if (i % 41 == 25) s = s + 25;
+        if (i % 41 == 26) s = s + 26;
+        if (i % 41 == 27) s = s + 27;
+        if (i % 41 == 28) s = s + 28;
+        if (i % 41 == 29) s = s + 29;
+        if (i % 41 == 30) s = s + 30;
+        if (i % 41 == 31) s = s + 31;
+        if (i % 41 == 32) s = s + 32;
+        if (i % 41 == 33) s = s + 33;
+        if (i % 41 == 34) s = s + 34;
+        if (i % 41 == 35) s = s + 35;
+        if (i % 41 == 36) s = s + 36;
+        if (i % 41 == 37) s = s + 37;
+        if (i % 41 == 38) s = s + 38;
+        if (i % 41 == 39) s = s + 39;
+    }
+    print(s);
+    return 0;
+}
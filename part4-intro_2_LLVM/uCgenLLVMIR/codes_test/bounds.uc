@@ -0,0 +1,9 @@
+int main() {
+    int a[3];
+    int i;
+    for (i = 0; i < 4; i++) {
+        a[i] = i;
+        print(a[i]);
+    }
+    return 0;
+}
@@ -0,0 +1,12 @@
+int fib(int n) {
+    if (n < 2)
+        return n;
+    return fib(n-1) + fib(n-2);
+}
+
+int main() {
+    int r;
+    r = fib(18);
+    print("fib = ", r);
+    return 0;
+}
@@ -0,0 +1,14 @@
+int f(int n, int acc) {
+    int x;
+    int y = 2;
+    int a[2] = {1, 2};
+    char s[2] = "ab";
+    if (n == 0) return acc + x + y;
+    x = x + 1;
+    a[0] = a[0] + 5;
+    return f(n - 1, acc + a[0] + x);
+}
+int main() {
+    print(f(3, 0));
+    return 0;
+}
@@ -0,0 +1,9 @@
+int main() {
+    int i, s;
+    s = 0;
+    for (i = 0; i < 20000; i++) {
+        s = s + i % 7;
+    }
+    print(s);
+    return 0;
+}
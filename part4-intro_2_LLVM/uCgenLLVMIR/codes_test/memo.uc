@@ -0,0 +1,31 @@
+int count = 0;
+
+int tri(int n) {
+    int s = 0, i = 0;
+    while (i < n) {
+        i = i + 1;
+        s = s + i;
+    }
+    return s;
+}
+
+int bump(int n) {
+    count = count + 1;
+    return n + count;
+}
+
+int binom(int n, int k) {
+    if (k == 0 || k == n)
+        return 1;
+    return binom(n - 1, k - 1) + binom(n - 1, k);
+}
+
+int main() {
+    int j = 0, t = 0;
+    while (j < 30) {
+        t = t + tri(2000) + bump(1);
+        j = j + 1;
+    }
+    print(t, " ", binom(16, 8), " ", count);
+    return 0;
+}
@@ -0,0 +1,20 @@
+int twice(int n) {
+    return n + n;
+}
+
+int down(int n, int acc) {
+    if (n == 0)
+        return twice(acc);
+    return down(n - 1, acc + 1);
+}
+
+int fact(int n) {
+    if (n <= 1)
+        return 1;
+    return n * fact(n - 1);
+}
+
+int main() {
+    print(down(50001, 0), " ", fact(10));
+    return down(3, 1);
+}
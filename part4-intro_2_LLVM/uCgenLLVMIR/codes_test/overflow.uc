@@ -0,0 +1,6 @@
+int main() {
+    int x = 2147483647;
+    print(x * x);
+    print(x + 1);
+    return 0;
+}
@@ -0,0 +1,11 @@
+int main() {
+    int n, i, x, s;
+    read(n);
+    s = 0;
+    for (i = 0; i < n; i++) {
+        read(x);
+        s = s + x;
+    }
+    print("sum ", s);
+    return 0;
+}
@@ -0,0 +1,10 @@
+int sum(int n, int acc) {
+    if (n == 0)
+        return acc;
+    return sum(n - 1, acc + 1);
+}
+
+int main() {
+    print(sum(100000, 0));
+    return 0;
+}
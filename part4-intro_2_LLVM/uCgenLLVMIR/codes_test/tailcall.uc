@@ -0,0 +1,12 @@
+int h(int n) {
+    return n * 2;
+}
+int g(int n) {
+    return h(n + 1);
+}
+int main() {
+    int i, s = 0;
+    for (i = 0; i < 3000; i++) s = s + g(i);
+    print(s);
+    return 0;
+}
@@ -0,0 +1,264 @@
+import atexit
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+import uc_ir
+import uc_ucb
+from uc import Compiler
+from uc_cgen import CTranslator
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CODES = os.path.join(HERE, 'codes_test')
+
+# the programs run by every engine, with the input of their .in file
+PROGRAMS = sorted(name[:-3] for name in os.listdir(CODES) if name.endswith('.uc'))
+
+# the C binaries are cached in a dir of the tests, not in ~/.cache/uc
+CACHE_DIR = tempfile.mkdtemp(prefix='uc-test-')
+atexit.register(shutil.rmtree, CACHE_DIR, True)
+
+# the Compiler of the runs in-process, that builds the parser once
+_compiler = Compiler()
+
+# exit status & output of each run of the Interpreter, the reference of the engines
+_reference = {}
+
+
+def read_program(test_name):
+    """ Return the source & the input (its .in file, if any) of codes_test/<test_name>.uc. """
+    with open(os.path.join(CODES, test_name + '.uc')) as file:
+        _code = file.read()
+    _input = ''
+    if os.path.exists(os.path.join(CODES, test_name + '.in')):
+        with open(os.path.join(CODES, test_name + '.in')) as file:
+            _input = file.read()
+    return _code, _input
+
+
+def run_engine(test_name, engine='tuple', opt=False):
+    """ Run codes_test/<test_name>.uc in-process in the engine, and return
+    (exit status, output). The exit status is the one of a process (the
+    value of main modulo 256), as the native engines can't return more.
+    """
+    _code, _input = read_program(test_name)
+    _result = _compiler.run(_code, input=_input, opt=opt, engine=engine)
+    return (_result.exit_code % 256, _result.output)
+
+
+def gencode(test_name):
+    """ Return the uCIR of codes_test/<test_name>.uc. """
+    _compiler.code = read_program(test_name)[0]
+    _compiler._do_compile(True, None, None, None, False, False, False)
+    return _compiler.gencode
+
+
+def run_uc(test_name, *options):
+    """ Run uc.py on codes_test/<test_name>.uc, with the input of its .in
+    file (if any), and return (exit status, stdout, stderr).
+    """
+    _code, _input = read_program(test_name)
+    _env = dict(os.environ, UC_CACHE_DIR=CACHE_DIR)
+    _result = subprocess.run([sys.executable, os.path.join(HERE, 'uc.py'), os.path.join(CODES, test_name + '.uc'),
+                              '-at-susy'] + list(options),
+                             input=_input, capture_output=True, text=True, cwd=HERE, env=_env, timeout=120)
+    return (_result.returncode, _result.stdout, _result.stderr)
+
+
+def reference(test_name, opt=False):
+    """ Return (exit status, output) of the program run by the Interpreter. """
+    if (test_name, opt) not in _reference:
+        _reference[(test_name, opt)] = run_engine(test_name, 'tuple', opt)
+    return _reference[(test_name, opt)]
+
+
+def check_engine(engine, run=run_engine):
+    """ Run every program in the engine, with & without -opt, and return
+    the runs whose exit status or output differ from the Interpreter.
+    """
+    _diffs = []
+    for test_name in PROGRAMS:
+        for opt in (False, True):
+            _result = run(test_name, engine, opt)
+            if _result != reference(test_name, opt):
+                _diffs.append((test_name, opt))
+                print("%s%s: %r, expected %r" % (test_name, ' -opt' if opt else '', _result,
+                                                  reference(test_name, opt)))
+    return _diffs
+
+
+def run_cli(test_name, engine, opt=False, *options):
+    """ Run the program in the engine by uc.py, as run_engine does in-process. """
+    return run_uc(test_name, '-engine=' + engine, *((['-opt'] if opt else []) + list(options)))[:2]
+
+
+#
+# Each engine against the Interpreter
+#
+def test_closure():
+    assert check_engine('closure') == []
+
+
+def test_python():
+    assert check_engine('python') == []
+
+
+def test_tiered():
+    assert check_engine('tiered') == []
+
+
+def test_tiered_threshold():
+    # every function is promoted at its first call or loop, so the calls
+    # run in the translations, or resume in them from the Interpreter
+    _run = lambda test_name, engine, opt: run_cli(test_name, engine, opt, '-tier-threshold=1')
+    assert check_engine('tiered', _run) == []
+
+
+def test_c():
+    if shutil.which(os.environ.get('CC', 'cc')) is None:
+        pytest.skip("no C compiler")
+    CTranslator.cache_dir = CACHE_DIR
+    assert check_engine('c') == []
+
+
+def test_llvm():
+    if shutil.which('lli') is None and shutil.which('clang') is None:
+        pytest.skip("no lli or clang")
+    assert check_engine('llvm', run_cli) == []
+
+
+#
+# Options of the runs
+#
+def test_limits():
+    # the engines that count the instructions stop at the same one
+    for engine in ('tuple', 'closure', 'tiered'):
+        _status, _output, _errors = run_uc('loop', '-engine=' + engine, '-max-instructions=1000')
+        assert _status == 1
+        assert 'InstructionLimit' in _output + _errors
+    _status, _output, _errors = run_uc('arr', '-max-output=5')
+    assert _status == 1
+    assert _output.startswith(reference('arr')[1][:5])
+    assert 'OutputLimit' in _output + _errors
+    # the translated code has no checkpoints, so the limit is refused
+    _status, _output, _errors = run_uc('loop', '-engine=python', '-max-instructions=1000')
+    assert _status == 1
+    assert 'error' in _output + _errors
+
+
+def test_memo():
+    # the cache of the pure functions doesn't change the output, and
+    # bump() is impure, so it runs on each call
+    for engine in ('tuple', 'closure', 'tiered'):
+        for opt in ([], ['-opt']):
+            _status, _output, _errors = run_uc('memo', '-engine=' + engine, '-memo', *opt)
+            assert (_status, _output) == reference('memo', bool(opt))
+            assert 'hits' in _errors
+    _status, _output, _errors = run_uc('memo', '-engine=python', '-memo')
+    assert _status == 1
+    assert 'error' in _output + _errors
+
+
+def test_tailcalls():
+    # the self tail calls run in constant memory in every engine, without -opt
+    for engine in ('tuple', 'closure', 'python', 'tiered'):
+        assert run_engine('tail', engine) == (0, '100000\n')
+    if shutil.which(os.environ.get('CC', 'cc')) is not None:
+        CTranslator.cache_dir = CACHE_DIR
+        assert run_engine('tail', 'c') == (0, '100000\n')
+    if shutil.which('lli') is not None or shutil.which('clang') is not None:
+        assert run_cli('tail', 'llvm') == (0, '100000\n')
+
+
+def test_profile():
+    _status, _output, _errors = run_uc('fib', '-profile')
+    assert (_status, _output) == reference('fib')
+    assert '@fib' in _errors
+    _status, _output, _errors = run_uc('fib', '-engine=python', '-profile')
+    assert _status == 1
+
+
+#
+# Precompiled programs
+#
+def test_ucb():
+    _dir = tempfile.mkdtemp(prefix='uc-ucb-')
+    try:
+        shutil.copy(os.path.join(CODES, 'fib.uc'), _dir)
+        _source = os.path.join(_dir, 'fib.uc')
+        _run = [sys.executable, os.path.join(HERE, 'uc.py'), _source, '-no-ast', '-no-ir', '-no-opt-file', '-ucb']
+        _first = subprocess.run(_run, capture_output=True, text=True, cwd=_dir)
+        assert 'Outputting the precompiled uCIR' in _first.stdout
+        assert os.path.exists(os.path.join(_dir, 'fib.ucb'))
+        _second = subprocess.run(_run, capture_output=True, text=True, cwd=_dir)
+        assert 'Loading the precompiled uCIR' in _second.stdout
+        assert _second.stdout.endswith(reference('fib')[1])
+        # the .ucb of the code without -opt is not loaded with -opt
+        _opt = subprocess.run(_run + ['-opt'], capture_output=True, text=True, cwd=_dir)
+        assert 'Outputting the precompiled uCIR' in _opt.stdout
+        assert _opt.stdout.endswith(reference('fib', True)[1])
+        # a changed source is compiled again
+        with open(_source, 'a') as file:
+            file.write('\n')
+        _changed = subprocess.run(_run + ['-opt'], capture_output=True, text=True, cwd=_dir)
+        assert 'the source changed' in _changed.stdout
+        assert _changed.stdout.endswith(reference('fib', True)[1])
+    finally:
+        shutil.rmtree(_dir)
+
+
+def test_ucb_file():
+    _source, _ = read_program('6test')
+    _code = gencode('6test')
+    _path = os.path.join(tempfile.mkdtemp(prefix='uc-ucb-'), '6test.ucb')
+    try:
+        uc_ucb.write(_code, _path, _source)
+        assert uc_ucb.read(_path, _source) == _code
+        with pytest.raises(uc_ucb.StaleProgram):
+            uc_ucb.read(_path, _source, opt=True)
+        with pytest.raises(uc_ucb.StaleProgram):
+            uc_ucb.read(_path, _source + ' ')
+        with open(_path, 'rb') as file:
+            _data = file.read()
+        with open(_path, 'wb') as file:
+            file.write(_data[:-3])
+        with pytest.raises(uc_ucb.StaleProgram):
+            uc_ucb.read(_path, _source)
+        # a count of operands or a pool id out of its range
+        _code_offset = len(_data) - 4 * uc_ucb._header.unpack_from(_data)[-1]
+        for _offset, _word in ((_code_offset, -3), (_code_offset, 1 << 20), (_code_offset + 4, -1)):
+            with open(_path, 'wb') as file:
+                file.write(_data[:_offset] + struct.pack('<i', _word) + _data[_offset + 4:])
+            with pytest.raises(uc_ucb.StaleProgram, match='corrupted'):
+                uc_ucb.read(_path, _source)
+    finally:
+        shutil.rmtree(os.path.dirname(_path))
+
+
+#
+# Batches & the compact IR
+#
+def test_batch():
+    _files = [os.path.join(CODES, test_name + '.uc') for test_name in ('fib', 'rd', 'assert', 'arr')]
+    _result = subprocess.run([sys.executable, os.path.join(HERE, 'uc.py')] + _files + ['-jobs=2'],
+                             capture_output=True, text=True, cwd=HERE)
+    assert _result.returncode == 0
+    _report = json.loads(_result.stdout)
+    for _entry in _report['files']:
+        _name = os.path.basename(_entry['file'])[:-3]
+        assert (_entry['exit_code'] % 256, _entry['output']) == reference(_name)
+
+
+def test_compact():
+    for test_name in PROGRAMS:
+        _code = gencode(test_name)
+        _ir = uc_ir.compact(_code)
+        assert uc_ir.expand(_ir) == _code
+        for _inst, _op in zip(_ir, _code):
+            assert _inst.opcode != uc_ir.UNKNOWN, _op
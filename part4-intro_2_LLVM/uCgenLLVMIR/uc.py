@@ -8,14 +8,25 @@
 # the compiler proper.
 # ============================================================
 
+import json
+import multiprocessing
+import os
 import sys
+import time
 from contextlib import contextmanager
 from uc_parser import UCParser
 from uc_sema import SemanticAnalyzer
-from uc_code import GenerateCode
-from uc_interpreter import Interpreter
+from uc_code import GenerateCode, IRWriter
+from uc_interpreter import Input, Interpreter, LimitExceeded, MemoryFault, MissingMain, Result
+from uc_closure import ClosureInterpreter
+from uc_translate import PythonTranslator
+from uc_cgen import BuildError, CTranslator
+from uc_llvm import LLVMGenerator
+from uc_profile import Profiler
+from uc_tiered import TieredInterpreter, TieredProfiler
 from uc_block import BlockGenerator
-from uc_analysis import AnalyzeOptimaze
+from uc_analysis import AnalyzeOptimaze, TailCallEliminator
+import uc_ucb
 """
 One of the most important (and difficult) parts of writing a compiler
 is reliable reporting of error messages back to the user.  This file
@@ -67,6 +78,22 @@ Use clear_errors() to clear the total number of errors.
 _subscribers = []
 _num_errors = 0
 
+# Execution engines for the uCIR, selected by -engine=<name>
+engines = {
+    'tuple': Interpreter,
+    'closure': ClosureInterpreter,
+    'python': PythonTranslator,
+    'tiered': TieredInterpreter,
+    'c': CTranslator,
+    'llvm': LLVMGenerator,
+}
+
+# Profilers of the engines that can be profiled, selected by -engine=<name>
+profilers = {
+    'tuple': Profiler,
+    'tiered': TieredProfiler,
+}
+
 
 def error(lineno, message, filename=None):
     """ Report a compiler error to all subscribers """
@@ -121,13 +148,19 @@ class Compiler:
     def __init__(self):
         self.total_errors = 0
         self.total_warnings = 0
+        self.parser = None
+        self.precompiled = False
+        self.stale = None
 
     def _parse(self, susy, ast_file, debug):
         """ Parses the source code. If ast_file != None,
             or running at susy machine,
             prints out the abstract syntax tree.
         """
-        self.parser = UCParser()
+        if self.parser is None:
+            self.parser = UCParser()
+        else:
+            self.parser.lexer.reset_lineno()
         self.ast = self.parser.parse(self.code, '', debug)
 
 
@@ -149,26 +182,73 @@ class Compiler:
         self.gen = GenerateCode()
         self.gen.visit(self.ast)
         self.gencode = self.gen.code
-        _str = ''
         if not susy and ir_file is not None:
-            for _code in self.gencode:
-                _str += f"{_code}\n"
-            ir_file.write(_str)  
+            IRWriter(ir_file).write_code(self.gencode)
         if cfg:
             self.blocks = BlockGenerator(self.gen.code)
             self.progcfg = self.blocks.get_blocks()
     
     def _opt(self, susy, opt_file, cfg, debug):
-        if cfg:
+        # the self tail calls become loops before the CFG is built
+        self.tailcalls = TailCallEliminator(self.gencode)
+        _tailcode = self.tailcalls.rewrite()
+        if cfg and not self.tailcalls.eliminated:
             self.opt = AnalyzeOptimaze(self.progcfg)
         else:
-            self.blocks = BlockGenerator(self.gen.code)
+            self.blocks = BlockGenerator(_tailcode)
             self.progcfg = self.blocks.get_blocks(False)
             self.opt = AnalyzeOptimaze(self.progcfg)
-        _code = self.opt.optmize()
-        self.optcode = self.opt.code
+        # the optimized code is streamed to opt_file as it's built
+        _writer = None
         if not susy and opt_file is not None:
-            opt_file.write(_code)
+            _writer = IRWriter(opt_file)
+        self.optcode = self.opt.optmize(_writer)
+
+    def _llvm(self, susy, llvm_file, opt):
+        """ Generate the LLVM IR module of the (optimized) uCIR. """
+        self.llvm = LLVMGenerator()
+        self.llvmcode = self.llvm.generate(self.optcode if opt else self.gencode)
+        if not susy and llvm_file is not None:
+            llvm_file.write(self.llvmcode)
+
+    def _measure(self, engine, memory_size, stack_size, options):
+        """ Runs the uCIR & the optimized uCIR with the same input, and
+            reports the instructions executed, the time & the peak size
+            of the stack of both runs, and the real speedup. The output
+            of the optimized run is the output of the program, and the
+            run fails if it differs from the output of the uCIR.
+        """
+        _input = Input().rest()
+        _runs = []
+        for _code in (self.gencode, self.optcode):
+            vm = engines[engine](input=list(_input), memory_size=memory_size, stack_size=stack_size, **options)
+            _start = time.perf_counter()
+            _result = vm.execute(_code)
+            _runs.append((_result, time.perf_counter() - _start))
+        (_gen, _gentime), (_opt, _opttime) = _runs
+
+        sys.stdout.write(_opt.output)
+        sys.stdout.flush()
+        sys.stderr.write("%-10s %14s %10s %10s\n" % ('', 'instructions', 'time', 'memory'))
+        for _name, (_result, _time) in zip(('uCIR', 'optimized'), _runs):
+            sys.stderr.write("%-10s %14s %9.3fs %10s\n" % (_name, _result.counters.get('instructions', '-'),
+                                                           _time, _result.counters.get('memory', '-')))
+        if 'instructions' in _gen.counters:
+            sys.stderr.write("instructions ratio = %.2f\n" % (_gen.counters['instructions'] /
+                                                               max(_opt.counters['instructions'], 1)))
+        self.speedup = _gentime / _opttime
+        sys.stderr.write("speedup = %.2f\n" % self.speedup)
+
+        if (_gen.exit_code, _gen.output, _gen.error) != (_opt.exit_code, _opt.output, _opt.error):
+            sys.stderr.write("error: the optimized code changed the behavior of the program\n")
+            for _name, _result in (('uCIR', _gen), ('optimized', _opt)):
+                sys.stderr.write("  %s: exit code %s, %d chars of output%s\n" % (
+                    _name, _result.exit_code, len(_result.output),
+                    ', ' + _result.error if _result.error else ''))
+            return 1
+        if _opt.error:
+            sys.stderr.write(_opt.error + "\n")
+        return _opt.exit_code
 
     def _do_compile(self, susy, ast_file, ir_file, opt_file, cfg, opt, debug):
         """ Compiles the code to the given file object. """
@@ -180,42 +260,250 @@ class Compiler:
             if opt:
                 self._opt(susy, opt_file, cfg, debug)
 
-
-    def compile(self, code, susy, ast_file, ir_file, opt_file, cfg, opt, run_ir, debug):
-        """ Compiles the given code string """
+    def _load_ucb(self, ucb_filename, opt):
+        """ Loads the (optimized) uCIR of the precompiled file, instead of
+            running the front end, if it was written for the same source
+            & opt. Otherwise, the reason is kept in self.stale and False
+            is returned, so the code must be compiled (see _dump_ucb).
+        """
+        self.precompiled = False
+        self.stale = None
+        if ucb_filename is None:
+            return False
+        try:
+            _code = uc_ucb.read(ucb_filename, self.code, opt)
+        except uc_ucb.StaleProgram as e:
+            self.stale = str(e)
+            return False
+        if opt:
+            self.optcode = _code
+        else:
+            self.gencode = _code
+        self.precompiled = True
+        return True
+
+    def _dump_ucb(self, ucb_filename, opt):
+        """ Writes the (optimized) uCIR to the precompiled file. """
+        uc_ucb.write(self.optcode if opt else self.gencode, ucb_filename, self.code, opt)
+
+
+    def compile(self, code, susy, ast_file, ir_file, opt_file, cfg, opt, run_ir, debug, engine='tuple',
+                llvm_file=None, memory_size=10000, stack_size=None, profile=False, profile_file=None,
+                measure=False, limits=None, memo_size=None, ucb_filename=None, tier_threshold=None):
+        """ Compiles the given code string. If profile is set, the code
+            runs on the Profiler, whose report is written to stderr and
+            whose JSON dump is written to profile_file (if not None).
+            If measure (and opt) is set, both the code & the optimized
+            code run, to measure the speedup (see _measure). The limits
+            of the run (max_instructions, max_time & max_output) are
+            given by the limits dict. If memo_size is set, the results of
+            the pure functions are cached (see Interpreter), and the hits
+            & misses of the cache are written to stderr. If ucb_filename
+            is set, the code is loaded from that precompiled file when it
+            was written for the same code & opt, and otherwise compiled
+            and written to it (see uc_ucb). The tiered engine promotes a
+            function after tier_threshold calls & loops, if it is set.
+        """
+        limits = limits or {}
+        _options = dict(limits)
+        if tier_threshold is not None:
+            _options['threshold'] = tier_threshold
         self.code = code
         with subscribe_errors(lambda msg: sys.stderr.write(msg+"\n")):
-            self._do_compile(susy, ast_file, ir_file, opt_file, cfg, opt, debug)
+            if self._load_ucb(ucb_filename, opt):
+                if not susy:
+                    print("Loading the precompiled uCIR from %s." % ucb_filename)
+            else:
+                self._do_compile(susy, ast_file, ir_file, opt_file, cfg, opt, debug)
+                if ucb_filename is not None and not errors_reported():
+                    if not susy:
+                        print("Outputting the precompiled uCIR to %s (%s)." % (ucb_filename, self.stale))
+                    self._dump_ucb(ucb_filename, opt)
             if errors_reported():
                 sys.stderr.write("{} error(s) encountered.".format(errors_reported()))
             else:
-                if opt:
-                    self.speedup = len(self.gencode) / len(self.optcode)
-                    sys.stderr.write("speedup = %.2f\n" % self.speedup)
+                if opt and not self.precompiled:
+                    # the static size of the code, see _measure for the speedup
+                    sys.stderr.write("code size = %d -> %d instructions\n" % (len(self.gencode), len(self.optcode)))
+                if llvm_file is not None:
+                    self._llvm(susy, llvm_file, opt)
+                if run_ir and not cfg and opt and measure:
+                    if not issubclass(engines[engine], Interpreter):
+                        sys.stderr.write("error: the %s engine can't be measured\n" % engine)
+                        return 1
+                    return self._measure(engine, memory_size, stack_size, _options)
                 if run_ir and not cfg:
-                    self.vm = Interpreter()
-                    if opt:
-                        self.vm.run(self.optcode)
+                    if profile:
+                        if engine not in profilers:
+                            sys.stderr.write("error: the %s engine can't be profiled\n" % engine)
+                            return 1
+                        self.vm = profilers[engine](memory_size=memory_size, stack_size=stack_size,
+                                                    memo_size=memo_size, **_options)
+                    elif issubclass(engines[engine], Interpreter):
+                        self.vm = engines[engine](memory_size=memory_size, stack_size=stack_size,
+                                                  memo_size=memo_size, **_options)
+                    elif limits:
+                        sys.stderr.write("error: the %s engine can't limit the run\n" % engine)
+                        return 1
+                    elif memo_size:
+                        sys.stderr.write("error: the %s engine can't cache the results\n" % engine)
+                        return 1
                     else:
-                        self.vm.run(self.gencode)
+                        self.vm = engines[engine]()
+                    if isinstance(self.vm, Interpreter):
+                        try:
+                            self.vm.check_options()
+                        except ValueError as e:
+                            # the engine can't run with these options, so nothing runs
+                            sys.stderr.write("error: %s\n" % e)
+                            return 1
+                    try:
+                        if opt:
+                            self.vm.run(self.optcode)
+                        else:
+                            self.vm.run(self.gencode)
+                    except (MemoryFault, LimitExceeded) as e:
+                        sys.stderr.write("%s: %s\n" % (type(e).__name__, e))
+                        return 1
+                    except (BuildError, MissingMain) as e:
+                        sys.stderr.write("error: %s\n" % e)
+                        return 1
+                    finally:
+                        # the program exits through SystemExit, so the
+                        # profile is written on the way out
+                        if profile:
+                            sys.stderr.write(self.vm.report())
+                            if not susy and profile_file is not None:
+                                self.vm.dump(profile_file)
+                        if memo_size:
+                            sys.stderr.write("memo: %d hits, %d misses, %d evictions\n" % (
+                                self.vm.hits, self.vm.misses, self.vm.evictions))
         return 0
 
+    def run(self, code, input=None, opt=False, engine='tuple', output=None, memory_size=10000,
+            stack_size=None, limits=None, memo_size=None, ucb_filename=None, tier_threshold=None):
+        """ Compiles the given code string and runs it in-process, with
+            the given input (see Input), returning the Result of the run
+            instead of exiting. The parser is built once by Compiler, so
+            the same Compiler can run many programs. A run stopped by
+            one of its limits returns the output & counters so far, with
+            the status of the limit (see Result). The time taken by the
+            compilation & the run is kept in self.times. The code may
+            be precompiled in ucb_filename, as in compile, and the tiered
+            engine takes tier_threshold as in compile.
+        """
+        if not issubclass(engines[engine], Interpreter):
+            raise ValueError("the %s engine can't run in-process" % engine)
+        _start = time.perf_counter()
+        self.times = {'compile': 0.0, 'run': 0.0}
+        self.code = code
+        _errors = []
+        clear_errors()
+        with subscribe_errors(_errors.append):
+            try:
+                if not self._load_ucb(ucb_filename, opt):
+                    self._do_compile(True, None, None, None, False, opt, False)
+                    if ucb_filename is not None and not errors_reported():
+                        self._dump_ucb(ucb_filename, opt)
+            except Exception as e:
+                error(None, '%s: %s' % (type(e).__name__, e))
+        self.times['compile'] = time.perf_counter() - _start
+        if errors_reported():
+            return Result(1, '', {}, '\n'.join(str(msg) for msg in _errors), 'error')
+        _start = time.perf_counter()
+        _options = dict(limits or {})
+        if tier_threshold is not None:
+            _options['threshold'] = tier_threshold
+        self.vm = engines[engine](output=output, input=input, memory_size=memory_size,
+                                  stack_size=stack_size, memo_size=memo_size, **_options)
+        _result = self.vm.execute(self.optcode if opt else self.gencode)
+        self.times['run'] = time.perf_counter() - _start
+        return _result
+
+
+# The Compiler of each worker of a batch, with its parser built once
+_batch_compiler = None
+
+
+def _batch_init():
+    global _batch_compiler
+    _batch_compiler = Compiler()
+    _batch_compiler.parser = UCParser()
+
+
+def _batch_run(task):
+    """ Compiles & runs one file of a batch, in a worker, and returns
+        its entry of the report. The input of the program is read from
+        the .in file next to the source, if there is one, and with the
+        ucb option, its code is precompiled in the .ucb file next to it.
+    """
+    source_filename, options = task
+    _start = time.perf_counter()
+    options = dict(options)
+    if options.pop('ucb', False):
+        options['ucb_filename'] = source_filename[:-3] + '.ucb'
+    _entry = {'file': source_filename}
+    try:
+        with open(source_filename, 'r') as source:
+            code = source.read()
+        _input = ''
+        if os.path.exists(source_filename[:-3] + '.in'):
+            with open(source_filename[:-3] + '.in', 'r') as input_file:
+                _input = input_file.read()
+    except OSError as e:
+        _entry.update(exit_code=1, status='error', output='', error=str(e), counters={},
+                      times={'compile': 0.0, 'run': 0.0})
+    else:
+        _result = _batch_compiler.run(code, input=_input, **options)
+        _entry.update(exit_code=_result.exit_code, status=_result.status, output=_result.output,
+                      error=_result.error, counters=_result.counters, times=dict(_batch_compiler.times))
+    _entry['times']['total'] = time.perf_counter() - _start
+    return _entry
+
+
+def run_batch(files, jobs, options):
+    """ Compiles & runs the source files in a pool of jobs processes,
+        whose workers build the parser once and then take the files one
+        at a time, and returns the report of the batch as a dict. The
+        options are given to Compiler.run for each file.
+    """
+    _start = time.perf_counter()
+    with multiprocessing.Pool(jobs, initializer=_batch_init) as pool:
+        _entries = pool.map(_batch_run, [(file, options) for file in files], chunksize=1)
+    return {'jobs': jobs,
+            'time': time.perf_counter() - _start,
+            'exit_codes': {str(code): sum(entry['exit_code'] == code for entry in _entries)
+                           for code in sorted({entry['exit_code'] for entry in _entries})},
+            'files': _entries}
+
 
 def run_compiler():
     """ Runs the command-line compiler. """
 
     if len(sys.argv) < 2:
-        print("Usage: ./uc <source-file> [-at-susy] [-no-ast] [-no-ir] [-no-run] [-cfg] [-opt] [-debug]")
+        print("Usage: ./uc <source-file> [-at-susy] [-no-ast] [-no-ir] [-no-opt-file] [-no-run] [-cfg] [-opt] [-debug] [-llvm] [-profile] [-measure] [-memory=N] [-stack=N] [-max-instructions=N] [-max-time=S] [-max-output=N] [-memo[=N]] [-jobs=N] [-ucb] [-tier-threshold=N] [-engine=tuple|closure|python|tiered|c|llvm]")
         sys.exit(1)
 
     emit_ast = True
     emit_ir = True
+    emit_opt = True
     run_ir = True
     susy = False
     debug = False
     cfg = False
     opt = False
     debug = False
+    llvm = False
+    profile = False
+    measure = False
+    engine = 'tuple'
+    memory_size = 10000
+    stack_size = None
+    limits = {}
+    memo_size = None
+    jobs = None
+    ucb = False
+    tier_threshold = None
 
     params = sys.argv[1:]
     files = sys.argv[1:]
@@ -226,6 +514,8 @@ def run_compiler():
                 emit_ast = False
             elif param == '-no-ir':
                 emit_ir = False
+            elif param == '-no-opt-file':
+                emit_opt = False
             elif param == '-at-susy':
                 susy = True
             elif param == '-no-run':
@@ -236,11 +526,69 @@ def run_compiler():
                 opt = True
             elif param == '-debug':
                 debug = True
+            elif param == '-llvm':
+                llvm = True
+            elif param == '-profile':
+                profile = True
+            elif param == '-measure':
+                # measuring the speedup needs the optimized code
+                measure = True
+                opt = True
+            elif param.startswith('-engine=') and param[8:] in engines:
+                engine = param[8:]
+            elif param.startswith('-memory=') and param[8:].isdigit():
+                memory_size = int(param[8:])
+            elif param.startswith('-stack=') and param[7:].isdigit():
+                stack_size = int(param[7:])
+            elif param.startswith('-max-instructions=') and param[18:].isdigit():
+                limits['max_instructions'] = int(param[18:])
+            elif param.startswith('-max-time=') and param[10:].replace('.', '', 1).isdigit():
+                limits['max_time'] = float(param[10:])
+            elif param.startswith('-max-output=') and param[12:].isdigit():
+                limits['max_output'] = int(param[12:])
+            elif param == '-memo':
+                memo_size = 4096
+            elif param.startswith('-memo=') and param[6:].isdigit() and int(param[6:]) > 0:
+                memo_size = int(param[6:])
+            elif param.startswith('-jobs=') and param[6:].isdigit() and int(param[6:]) > 0:
+                jobs = int(param[6:])
+            elif param == '-ucb':
+                ucb = True
+            elif param.startswith('-tier-threshold=') and param[16:].isdigit() and int(param[16:]) > 0:
+                tier_threshold = int(param[16:])
             else:
                 print("Unknown option: %s" % param)
                 sys.exit(1)
             files.remove(param)
 
+    if ucb:
+        # the front end doesn't run when the .ucb file is loaded, so there
+        # is no AST, no uCIR to write & no CFG, nor the uCIR to measure
+        if cfg or measure:
+            print("error: -ucb runs the precompiled uCIR, without -cfg or -measure")
+            sys.exit(1)
+        emit_ast = False
+        emit_ir = False
+        emit_opt = False
+
+    if tier_threshold is not None and engine != 'tiered':
+        print("error: -tier-threshold is an option of -engine=tiered")
+        sys.exit(1)
+
+    if jobs is not None:
+        # batch mode: the files are compiled & run in-process by a pool of
+        # workers, and the report of the batch is written to stdout as JSON
+        if not issubclass(engines[engine], Interpreter) or profile or measure or cfg or llvm:
+            print("error: -jobs runs the files in-process, without -profile, -measure, -cfg or -llvm")
+            sys.exit(1)
+        _options = {'opt': opt, 'engine': engine, 'memory_size': memory_size, 'stack_size': stack_size,
+                    'limits': limits, 'memo_size': memo_size, 'ucb': ucb, 'tier_threshold': tier_threshold}
+        _report = run_batch([file if file[-3:] == '.uc' else file + '.uc' for file in files], jobs, _options)
+        json.dump(_report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        sys.stderr.write("%d files in %.3fs with %d jobs\n" % (len(files), _report['time'], jobs))
+        sys.exit(0)
+
     for file in files:
         if file[-3:] == '.uc':
             source_filename = file
@@ -264,17 +612,37 @@ def run_compiler():
             open_files.append(ir_file)
 
         opt_file = None
-        if opt and not susy:
+        if opt and emit_opt and not susy:
             opt_filename = source_filename[:-3] + '.opt'
             print("Outputting the optimized uCIR to %s." % opt_filename)
             opt_file = open(opt_filename, 'w')
             open_files.append(opt_file)
 
+        llvm_file = None
+        if llvm and not susy:
+            llvm_filename = source_filename[:-3] + '.ll'
+            print("Outputting the LLVM IR to %s." % llvm_filename)
+            llvm_file = open(llvm_filename, 'w')
+            open_files.append(llvm_file)
+
+        profile_file = None
+        if profile and run_ir and not susy:
+            profile_filename = source_filename[:-3] + '.prof.json'
+            print("Outputting the profile to %s." % profile_filename)
+            profile_file = open(profile_filename, 'w')
+            open_files.append(profile_file)
+
         source = open(source_filename, 'r')
         code = source.read()
         source.close()
         
-        retval = Compiler().compile(code, susy, ast_file, ir_file, opt_file, cfg, opt, run_ir, debug)
+        ucb_filename = None
+        if ucb:
+            ucb_filename = source_filename[:-3] + '.ucb'
+
+        retval = Compiler().compile(code, susy, ast_file, ir_file, opt_file, cfg, opt, run_ir, debug, engine,
+                                    llvm_file, memory_size, stack_size, profile, profile_file, measure, limits,
+                                    memo_size, ucb_filename, tier_threshold)
 
         for f in open_files:
             f.close()
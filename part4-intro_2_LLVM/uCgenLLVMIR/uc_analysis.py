@@ -1,19 +1,21 @@
+from uc_ir import CALL, DEFINE, ELEM, GET, LABEL, PARAM, PRINT, READ, RETURN, STORE, Type
+
+
 class AnalyzeOptimaze:
 
     def __init__(self, cfg_list):
         # CFG divididas por funcoes
         self.CFGs = cfg_list
-        # codigo gerado no arquivo .opt pelo uc.py
-        self.optcode = ''
 
         # codigo gerado como tupla para ser interpretador no interpreter.py
         self.code = []
 
 
-    def optmize(self): # classe de teste por enquanto, no futuro aplica as otimizacoes e gera codigo
+    def optmize(self, writer=None): # classe de teste por enquanto, no futuro aplica as otimizacoes e gera codigo
         """ .realiza as otimizacoes no codigo alterando o valor no bloco
             .atravessa cada bloco armazenando o novo codigo
-            .retorna o novo codigo em forma de string para emitir no arquivo .opt
+            .escreve o novo codigo no writer (um IRWriter do arquivo .opt), se houver
+            .retorna o novo codigo em forma de lista de tuplas
         """
         
         #realiza o constant propagation
@@ -22,23 +24,26 @@ class AnalyzeOptimaze:
         #realiza o deadcode elimination
         self.deadcode()
 
-        # funcao que atravessa os blocos armazenando as intrucoes no self.optcode e self.code
-        self.opt_fileandcode()
+        # funcao que atravessa os blocos armazenando as intrucoes no self.code e no writer
+        self.opt_fileandcode(writer)
 
-        return self.optcode
+        return self.code
 
 
-    def opt_fileandcode(self):
+    def opt_fileandcode(self, writer=None):
         """ .acessa todos os blocos e sintetiza em um codigo
             .armazena as tuplas no self.code para ser interpretado
-            .retorna o codigo em forma de string, para ser escrito no .opt
+            .escreve cada instrucao no writer, para ser escrito no .opt, sem montar o texto todo
         """
         for block in self.CFGs:
             while block:
                 for instr in block.instructions:
                     self.code.append(instr[1])
-                    self.optcode += f"{str(instr[1])}\n"
+                    if writer is not None:
+                        writer.write(instr[1])
                 block = block.next_block
+        if writer is not None:
+            writer.flush()
 
 
     ############################
@@ -321,8 +326,9 @@ class AnalyzeOptimaze:
             # OUT[n] = GEN[n] Union (IN[n] -KILL[n])
             _inout[n][1] = list(set(_gen[n]) | set([v for v in _inout[n][0] if v not in _kill[n]]))
 
-            # if (OUT[n] changed)
-            if _inout[n][1] != _oldout:
+            # if (OUT[n] changed), as sets: the order of the list depends on
+            # the hashes of the vars, and a new order is not a change
+            if set(_inout[n][1]) != set(_oldout):
                 # for all nodes s in successors(n) 
                 for s in succ[n]:
                     # Changed = Changed U { s }
@@ -426,8 +432,8 @@ class AnalyzeOptimaze:
             auxin.clear()
             # in[n] := gen[n] U (out[n] - kill[n])
             cfg_inout[n][0] = list(set(cfg_genkill[n][0]) | set([v for v in cfg_inout[n][1] if v not in cfg_genkill[n][1]]))
-            # if(old_in != in[n])
-            if old_in != cfg_inout[n][0]:
+            # if(old_in != in[n]), as sets (see reachingDefinitions)
+            if set(old_in) != set(cfg_inout[n][0]):
                 for m in pred[n]:
                     worklist.append(m)
 
@@ -520,3 +526,213 @@ class AnalyzeOptimaze:
         return kill
 
 
+
+
+class TailCallEliminator:
+    """ Rewrites the self tail calls of the uCIR into loops. GenerateCode
+        translates return f(...) into the params, the call, the store of
+        its value in the return register and a jump to a label, followed
+        by the load & the return of the register:
+
+             ('param_int', '%13'), ('param_int', '%17'),
+             ('call', '@sum', '%21'),
+             ('store_int', '%21', '%2'),
+             ('jump', '%22'),
+             ('22',),
+             ('load_int', '%2', '%23'),
+             ('return_int', '%23')
+
+        When f is the function itself, the params are stored in the vars
+        that the function stores its params in when it starts, and the
+        call & the store are replaced by a jump to a label put right after
+        these stores. So the function loops instead of recursing, and runs
+        in constant memory. The label & the return that follow the jump
+        are left alone (they are dead code for the optimizer).
+
+        The locals are allocated after the label, so each loop allocates
+        them again, as a call would do, and the allocs zero them in the
+        engines. But the optimizer doesn't take an alloc for a store, and
+        it would carry the value of a local that is not initialized from
+        a loop to the next, so the jump is preceded by stores of 0 in the
+        locals of base types too.
+
+        Only the params of base types are rewritten (arrays are passed
+        by reference), and the calls of other functions are left to the
+        engines (see Interpreter._decode_tailcalls).
+    """
+
+    def __init__(self, code):
+        self.code = code
+        # number of tail calls rewritten, by function
+        self.eliminated = {}
+
+    def rewrite(self):
+        """ Return the code with the self tail calls rewritten. """
+        _code = []
+        _defines = [i for i, op in enumerate(self.code) if op[0] == 'define']
+        _bounds = _defines + [len(self.code)]
+        _code += self.code[:_bounds[0]]
+        for begin, end in zip(_bounds, _bounds[1:]):
+            _code += self._rewrite_function(self.code[begin:end])
+        return _code
+
+    def _rewrite_function(self, code):
+        _name = code[0][1]
+        # the vars that the params are stored in at the entry, by position
+        _i = 1
+        while _i < len(code) and code[_i][0].startswith('alloc'):
+            _i += 1
+        _vars = []
+        while (_i < len(code) and code[_i][0].startswith('store') and len(code[_i][0].split('_')) == 2 and
+               code[_i][1] == '%' + str(len(_vars))):
+            _vars.append((code[_i][0], code[_i][2]))
+            _i += 1
+        _prologue = _i
+        if _name == '@main' or not _vars:
+            return code
+
+        _labels = {op[0]: i for i, op in enumerate(code) if op[0].isdigit()}
+        _entry = '%' + str(1 + max(int(arg[1:]) for op in code for arg in op
+                                   if isinstance(arg, str) and arg[:1] == '%' and arg[1:].isdigit()))
+        _nparams = len(_vars)
+        _locals = [op for op in code[_prologue:] if op[0].startswith('alloc') and len(op[0].split('_')) == 2]
+        _temp = int(_entry[1:])
+        _code = []
+        _i = 0
+        while _i < len(code):
+            if self._is_tailcall(code, _i, _name, _nparams, _labels):
+                _params = _code[-_nparams:]
+                if all(param[1] not in [var for _, var in _vars] for param in _params):
+                    del _code[-_nparams:]
+                    for (store, var), param in zip(_vars, _params):
+                        _code.append((store, param[1], var))
+                    for alloc, var in _locals:
+                        _type = alloc.split('_')[1]
+                        _temp += 1
+                        _code.append(('literal_' + _type, 0.0 if _type == 'float' else 0, '%' + str(_temp)))
+                        _code.append(('store_' + _type, '%' + str(_temp), var))
+                    _code.append(('jump', _entry))
+                    self.eliminated[_name] = self.eliminated.get(_name, 0) + 1
+                    _i += 3
+                    continue
+            _code.append(code[_i])
+            _i += 1
+
+        if self.eliminated.get(_name):
+            _code.insert(_prologue, (_entry[1:],))
+        return _code
+
+    def _is_tailcall(self, code, i, name, nparams, labels):
+        # the call of the function itself, with nparams params of base
+        # types, whose value is stored in the register that is returned
+        if code[i][0] != 'call' or code[i][1] != name or i < nparams or i + 2 >= len(code):
+            return False
+        if any(not op[0].startswith('param') or len(op[0].split('_')) != 2 for op in code[i - nparams:i]):
+            return False
+        if i > nparams and code[i - nparams - 1][0].startswith('param'):
+            return False
+        _store, _jump = code[i + 1], code[i + 2]
+        if not _store[0].startswith('store') or _store[1] != code[i][2] or _jump[0] != 'jump':
+            return False
+        _label = labels.get(_jump[1][1:])
+        if _label is None or _label + 2 >= len(code):
+            return False
+        _load, _return = code[_label + 1], code[_label + 2]
+        return (_load[0].startswith('load') and _load[1] == _store[2] and
+                _return[0].startswith('return') and _return[1:] == (_load[2],))
+
+
+class PurityAnalysis:
+    """ Finds the pure functions of the uCIR: the functions whose result
+        depends only on the values of their params, and that have no
+        other effect, so a call can be replaced by the result of an
+        earlier call with the same params. A function is pure if:
+
+            .it returns a value, and it's not @main
+            .all its params are of int, char or bool types (the floats
+             are left out, since 0.0 & -0.0 are equal keys but print
+             differently)
+            .it doesn't print, read, take addresses or store through
+             pointers, nor store in a global
+            .it reads only the globals that are never written
+            .it calls only pure functions
+
+        The last rule is solved over the call graph: all the functions
+        that pass the other rules start as pure, and the ones that call
+        an impure function are removed until none is removed (so the
+        recursive functions stay pure).
+    """
+
+    def __init__(self, ir):
+        # the code as a list of Instructions (see uc_ir.compact)
+        self.ir = ir
+
+    def pure_functions(self):
+        """ Return the set of the names of the pure functions. """
+        _functions = {}
+        _name = None
+        for inst in self.ir:
+            if inst.opcode == DEFINE:
+                _name = inst.operands[0]
+                _functions[_name] = []
+            elif _name is not None and inst.opcode != LABEL:
+                _functions[_name].append(inst)
+        _mutable = self._mutable_globals()
+
+        _pure = set()
+        _callees = {}
+        for name, ir in _functions.items():
+            if name != '@main' and self._is_local_pure(ir, _mutable):
+                _pure.add(name)
+                _callees[name] = {inst.operands[0] for inst in ir if inst.opcode == CALL}
+        # the calls with params of other types make the callee impure
+        for ir in _functions.values():
+            for i, inst in enumerate(ir):
+                if inst.opcode == CALL:
+                    _j = i - 1
+                    while _j >= 0 and ir[_j].opcode == PARAM:
+                        if ir[_j].type not in (Type.INT, Type.CHAR, Type.BOOL) or ir[_j].dims or ir[_j].ptr:
+                            _pure.discard(inst.operands[0])
+                        _j -= 1
+
+        _changed = True
+        while _changed:
+            _changed = False
+            for name in list(_pure):
+                if not _callees[name] <= _pure:
+                    _pure.remove(name)
+                    _changed = True
+        return _pure
+
+    def _mutable_globals(self):
+        # the globals stored in, read into or whose address is taken, and
+        # the global arrays, if any store goes through a pointer
+        _mutable = set()
+        _arrays = set()
+        _pointers = False
+        for inst in self.ir:
+            if inst.opcode == STORE:
+                _mutable.add(inst.operands[1])
+                _pointers = _pointers or inst.ptr > 0
+            elif inst.opcode in (READ, GET):
+                _mutable.add(inst.operands[0])
+            elif inst.opcode == ELEM:
+                _arrays.add(inst.operands[0])
+        if _pointers:
+            _mutable |= _arrays
+        return {name for name in _mutable if isinstance(name, str) and name.startswith('@')}
+
+    def _is_local_pure(self, ir, mutable):
+        _returns = False
+        for inst in ir:
+            if inst.opcode in (PRINT, READ, GET):
+                return False
+            if inst.opcode == STORE and (inst.ptr or
+                                                str(inst.operands[1]).startswith('@')):
+                return False
+            if inst.opcode == RETURN and inst.type != Type.VOID:
+                _returns = True
+            if inst.opcode != CALL and any(arg in mutable for arg in inst.operands
+                                                  if isinstance(arg, str)):
+                return False
+        return _returns
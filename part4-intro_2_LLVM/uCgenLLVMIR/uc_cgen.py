@@ -0,0 +1,482 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_cgen.py
+#
+# CTranslator class: translates the uC intermediate representation into portable
+#                    C, compiles it with the system cc and runs the binary
+# ---------------------------------------------------------------------------------
+import hashlib
+import os
+import subprocess
+import sys
+from uc_analysis import TailCallEliminator
+from uc_translate import PythonTranslator
+from uc_interpreter import TimeLimit
+from uc_ir import compact, operand_name
+
+# Bump it when the generated C changes, so the cached binaries are rebuilt
+VERSION = 2
+
+# Runtime of the generated programs: the memory, the output of the values
+# (as Python prints them), the input and the errors that stop the program
+RUNTIME = r'''#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <float.h>
+
+typedef union { long long i; double f; } cell;
+
+#define MEMSIZE %(memsize)d
+#define STACK_LIMIT %(limit)d
+static cell M[MEMSIZE];
+static const cell zero;
+
+static void fail(const char *msg)
+{
+    fflush(stdout);
+    fprintf(stderr, "%%s\n", msg);
+    exit(1);
+}
+
+static void out_of_bounds(long long index, long long dim)
+{
+    fflush(stdout);
+    if (dim)
+        fprintf(stderr, "OutOfBounds: index %%lld out of the bounds of an array of %%lld\n", index, dim);
+    else
+        fprintf(stderr, "OutOfBounds: address %%lld out of the memory\n", index);
+    exit(1);
+}
+
+static void put_char(long long c)
+{
+    /* chars are unicode code points, written as UTF-8 */
+    if (c < 0x80) {
+        putchar((int) c);
+    } else if (c < 0x800) {
+        putchar(0xC0 | (int) (c >> 6));
+        putchar(0x80 | (int) (c & 0x3F));
+    } else if (c < 0x10000) {
+        putchar(0xE0 | (int) (c >> 12));
+        putchar(0x80 | (int) ((c >> 6) & 0x3F));
+        putchar(0x80 | (int) (c & 0x3F));
+    } else {
+        putchar(0xF0 | (int) (c >> 18));
+        putchar(0x80 | (int) ((c >> 12) & 0x3F));
+        putchar(0x80 | (int) ((c >> 6) & 0x3F));
+        putchar(0x80 | (int) (c & 0x3F));
+    }
+}
+
+static void print_float(double x)
+{
+    /* the shortest repr that round-trips, as Python prints a float */
+    char buf[64];
+    int p, e;
+    if (x != x) {
+        fputs("nan", stdout);
+        return;
+    }
+    if (x > DBL_MAX || x < -DBL_MAX) {
+        fputs(x > 0 ? "inf" : "-inf", stdout);
+        return;
+    }
+    if (x == 0) {
+        fputs(1 / x < 0 ? "-0.0" : "0.0", stdout);
+        return;
+    }
+    for (p = 1; p < 17; p++) {
+        snprintf(buf, sizeof buf, "%%.*e", p - 1, x);
+        if (strtod(buf, NULL) == x)
+            break;
+    }
+    snprintf(buf, sizeof buf, "%%.*e", p - 1, x);
+    e = atoi(strchr(buf, 'e') + 1);
+    if (e < -4 || e >= 16)
+        fputs(buf, stdout);
+    else
+        printf("%%.*f", p - 1 - e > 1 ? p - 1 - e : 1, x);
+}
+
+static char token[1024];
+
+static void read_token(void)
+{
+    fflush(stdout);
+    if (scanf("%%1023s", token) != 1) {
+        puts("Unexpected end of input file.");
+        exit(1);
+    }
+}
+
+static long long read_int(void)
+{
+    read_token();
+    return strtoll(token, NULL, 10);
+}
+
+static double read_float(void)
+{
+    read_token();
+    return strtod(token, NULL);
+}
+
+static long long read_char(void)
+{
+    read_token();
+    return (unsigned char) token[0];
+}
+
+static long long floordiv(long long a, long long b)
+{
+    if (b == 0)
+        fail("ZeroDivisionError: integer division or modulo by zero");
+    return a / b - (a %% b != 0 && (a < 0) != (b < 0));
+}
+
+static long long floormod(long long a, long long b)
+{
+    if (b == 0)
+        fail("ZeroDivisionError: integer division or modulo by zero");
+    return a %% b + (a %% b != 0 && (a < 0) != (b < 0)) * b;
+}
+
+static double divide(double a, double b)
+{
+    if (b == 0)
+        fail("ZeroDivisionError: float division by zero");
+    return a / b;
+}
+
+static void copy_str(long long address, const char *s, long long dim)
+{
+    /* spread the chars of a string constant over an array */
+    long long i;
+    for (i = 0; i < dim && s[i]; i++)
+        M[address + i].i = (unsigned char) s[i];
+}
+'''
+
+
+class BuildError(Exception):
+    """ Raised when the C of the program can't be compiled, or cached. """
+
+
+class CTranslator(PythonTranslator):
+    """
+    Translates the uC intermediate code into C, with the same memory
+    model of the PythonTranslator: temporaries are C locals, while the
+    globals, the arrays and the vars whose address is taken are in the
+    memory M, at the same addresses used by the Interpreter. Each value
+    is a cell (an union of a long long and a double), and the type of
+    the instruction tells which field to use:
+
+         ('add_int', '%3', '%4', '%5')      ->  v5.i = v3.i + v4.i;
+         ('load_float_*', '%7', '%8')       ->  v8 = M[v7.i];
+         ('cbranch', '%9', '%10', '%11')    ->  if (v9.i) goto L10; goto L11;
+
+    The C is compiled with the system cc, and the binaries are cached
+    in cache_dir by the hash of the uCIR, so running the same code again
+    costs nothing. The cache is private to the user (~/.cache/uc by
+    default, with mode 0700), since its binaries are run: a cache dir or
+    a binary of another user (or writable by others) is refused.
+
+    The Interpreter remains the reference implementation, but note that
+    chars are stored by their code here, so a literal char prints
+    without the quotes that the Interpreter keeps.
+    """
+
+    cc = os.environ.get('CC', 'cc')
+    cflags = ['-O2', '-w']
+    cache_dir = os.environ.get('UC_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'uc'))
+
+    def run(self, ircode):
+        """
+        Run intermediate code as a native binary, built (or got from
+        the cache) by build. Exits with the status of the binary, or
+        raises TimeLimit if it runs for more than max_time seconds.
+        """
+        self.check_options()
+        _binary = self.build(ircode)
+        # the binary reads the tokens of the input from a pipe, unless
+        # the input is the stdin, and the same for the output
+        _input = None
+        if self.input.source is not None:
+            _input = '\n'.join(self.input.rest()).encode() + b'\n'
+        _stdout = subprocess.PIPE if self.output is not None else None
+        sys.stdout.flush()
+        try:
+            _result = subprocess.run([_binary], input=_input, stdout=_stdout, timeout=self.max_time)
+        except subprocess.TimeoutExpired as e:
+            if self.output is not None and e.stdout:
+                self.output.write(e.stdout.decode(errors='replace'))
+                self.output.flush()
+            raise TimeLimit("the program ran for more than %gs" % self.max_time)
+        if self.output is not None:
+            self.output.write(_result.stdout.decode(errors='replace'))
+            self.output.flush()
+        _status = _result.returncode
+        sys.exit(_status if _status >= 0 else 128 - _status)
+
+    def check_options(self):
+        """
+        Raise ValueError if the run has limits of instructions or output,
+        or a cache: the binary is only limited in time, by its process.
+        """
+        if self.max_instructions is not None or self.max_output is not None:
+            raise ValueError("the binary can't limit the instructions or the output")
+        if self.memo_size:
+            raise ValueError("the binary can't cache the results of the calls")
+
+    def build(self, ircode):
+        """
+        Return the path of the binary of the intermediate code, that is
+        translated & compiled only if it is not in the cache yet. The
+        self tail calls are loops in the C, as in the PythonTranslator.
+        """
+        ircode = TailCallEliminator(ircode).rewrite()
+        _key = hashlib.sha256(repr((VERSION, self.cc, self.cflags, len(self.M), self.stack_size,
+                                    ircode)).encode()).hexdigest()
+        _binary = os.path.join(self.cache_dir, _key)
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        self._check_private(self.cache_dir)
+        if os.path.exists(_binary):
+            self._check_private(_binary)
+            return _binary
+        self.load(ircode)
+        self.source = self.translate(ircode)
+        with open(_binary + '.c', 'w') as file:
+            file.write(self.source)
+        # compile to a temporary name, so no one runs a half written binary
+        _tmp = '%s.%d.tmp' % (_binary, os.getpid())
+        try:
+            subprocess.run([self.cc] + self.cflags + ['-o', _tmp, _binary + '.c'], check=True)
+        except subprocess.CalledProcessError as e:
+            raise BuildError("%s failed with status %d on %s.c" % (self.cc, e.returncode, _binary))
+        except OSError as e:
+            raise BuildError("can't run %s: %s" % (self.cc, e))
+        os.replace(_tmp, _binary)
+        return _binary
+
+    def _check_private(self, path):
+        # the cache dir & its binaries must be owned by the user, and no
+        # one else may write them, or anyone could plant a binary there
+        _stat = os.stat(path)
+        if _stat.st_uid != os.getuid() or _stat.st_mode & 0o022:
+            raise BuildError("%s is not private to the user, so the cache is not used" % path)
+
+    def translate(self, ircode):
+        """
+        Translate the loaded intermediate code into a C program, one C
+        function for each uC function, and a main that initializes the
+        globals in the memory and calls the uC main.
+        """
+        M = self.M
+        _nparams = self._count_params(ircode)
+        _defines = [pc for pc, op in enumerate(ircode) if op[0] == 'define']
+        _functions = []
+        _source = [RUNTIME % {'memsize': len(M), 'limit': self.stack_limit}]
+        for begin, end in zip(_defines, _defines[1:] + [len(ircode)]):
+            _code = ircode[begin:end]
+            _functions.append(self._translate_function(_code, _nparams.get(_code[0][1], 0)))
+        _source += [lines[0] + ';' for lines in _functions] + ['']
+        for lines in _functions:
+            _source += lines
+
+        _source += ['int main(void)', '{', '    cell r;']
+        for address, value in enumerate(M[:self.offset]):
+            if isinstance(value, float):
+                _source.append('    M[%d].f = %r;' % (address, value))
+            elif isinstance(value, int):
+                _source.append('    M[%d].i = %d;' % (address, value))
+            elif isinstance(value, str) and len(value) == 1:
+                _source.append('    M[%d].i = %d;' % (address, ord(value)))
+        _source += ['    r = f_main(%d);' % self.offset,
+                    '    putchar(\'\\n\');',
+                    '    return (int) r.i;',
+                    '}']
+        return '\n'.join(_source) + '\n'
+
+    #
+    # Auxiliary methods
+    #
+    def _string(self, source):
+        # the C literal of a string constant, in UTF-8
+        _value = self.M[self.globals[source]]
+        _chars = []
+        for byte in _value.encode():
+            if 32 <= byte < 127 and chr(byte) not in '\\"?':
+                _chars.append(chr(byte))
+            else:
+                _chars.append('\\%03o' % byte)
+        return '"%s"' % ''.join(_chars)
+
+    def _is_string(self, source):
+        if not source.startswith('@'):
+            return False
+        _value = self.M[self.globals[source]]
+        return isinstance(_value, str) and len(_value) > 1
+
+    def _copy(self, dim, target, source):
+        if self._is_string(source):
+            return 'copy_str(%s, %s, %d);' % (self._address(target), self._string(source), dim)
+        return 'memmove(&M[%s], &M[%s], %d * sizeof(cell));' % (
+            self._address(target), self._address(source), dim)
+
+    def _translate_function(self, code, nparams):
+        _name = code[0][1]
+        self._slots, _size = self.frames[_name]
+        self._memory = self._memory_vars(code)
+        self._dims = dict(self.dims)
+        self._dims.update((operand_name(var), dim) for var, dim in self._array_dims(compact(code)).items())
+        self._labels = {'%' + op[0] for op in code if op[0].isdigit()}
+        self._main = _name == '@main'
+        _params = ['%' + str(i) for i in range(nparams)]
+        _locals = {arg for op in code[1:] if not op[0].isdigit() for arg in op[1:]
+                   if isinstance(arg, str) and arg.startswith('%')}
+        _locals = (_locals | {'%0', '%' + str(nparams)}) - self._labels - self._memory - set(_params)
+        _locals = sorted(_locals, key=lambda var: self._slots[var])
+
+        _lines = ['static cell f_%s(long long sp%s)' % (
+                      _name[1:], ''.join(', cell ' + self._local(p) for p in _params)),
+                  '{',
+                  '    long long fp = sp;',
+                  '    long long top = fp + %d;' % max(_size, nparams + 1)]
+        _lines += ['    cell %s = {0};' % self._local(var) for var in _locals]
+        _lines.append('    if (top > STACK_LIMIT)')
+        _lines.append('        fail("StackOverflow: the stack is full (%d cells)");'
+                      % (self.stack_limit - self.stack_base))
+        for var in _params:
+            if var in self._memory:
+                _lines.append('    M[fp + %d] = %s;' % (self._slots[var], self._local(var)))
+
+        _done = False
+        self._params = []
+        for op in code[1:]:
+            if op[0].isdigit():
+                _lines.append('L%s: ;' % op[0])
+                _done = False
+            elif not _done:
+                _lines += ['    ' + line for line in self._translate_op(op)]
+                _done = op[0] in ('jump', 'cbranch') or op[0].startswith('return')
+        if not _done:
+            if self._main:
+                # main ran past its end: stop without the return newline
+                _lines += ['    fflush(stdout);', '    exit(0);']
+            else:
+                _lines.append('    return zero;')
+        _lines += ['}', '']
+        return _lines
+
+    def _translate_op(self, op):
+        opcode, modifier = self._extract_operation(op[0])
+        if not hasattr(self, "run_" + opcode):
+            return ['puts("Warning: No run_%s() method");' % opcode]
+        _kind, _, _type = opcode.partition('_')
+        _field = '.f' if _type == 'float' else '.i'
+        _dim = 1
+        _ref = 0
+        for arg in modifier.values():
+            if arg.isdigit():
+                _dim *= int(arg)
+            elif arg == '*':
+                _ref += 1
+        _dims = modifier and _ref == 0
+
+        if _kind == 'alloc':
+            if _dims:
+                return ['memset(&M[%s], 0, %d * sizeof(cell));' % (self._address(op[1]), _dim)]
+            return [self._set(op[1], 'zero') + ';']
+        elif _kind == 'literal':
+            if _type == 'float':
+                return ['%s.f = %r;' % (self._value(op[2]), float(op[1]))]
+            elif _type == 'char':
+                _char = op[1].strip("'") if isinstance(op[1], str) else op[1]
+                return ['%s.i = %d;' % (self._value(op[2]), ord(_char) if _char else 0)]
+            return ['%s.i = %d;' % (self._value(op[2]), int(op[1]))]
+        elif _kind == 'load':
+            if _dims:
+                return [self._copy(_dim, op[2], op[1])]
+            elif _ref:
+                return [self._set(op[2], 'M[%s.i]' % self._value(op[1])) + ';']
+            return [self._set(op[2], self._value(op[1])) + ';']
+        elif _kind == 'store':
+            if _dims:
+                return [self._copy(_dim, op[2], op[1])]
+            elif _ref:
+                return ['M[%s.i] = %s;' % (self._value(op[2]), self._value(op[1]))]
+            return [self._set(op[2], self._value(op[1])) + ';']
+        elif _kind == 'elem':
+            _address = self._address(op[1])
+            _index = self._value(op[2]) + '.i'
+            _dim = self._dims.get(op[1], 0)
+            if _dim:
+                _check = '(unsigned long long) %s >= %d' % (_index, _dim)
+                _fault = 'out_of_bounds(%s, %d);' % (_index, _dim)
+            else:
+                _check = '(unsigned long long) (%s + %s) >= MEMSIZE' % (_address, _index)
+                _fault = 'out_of_bounds(%s + %s, 0);' % (_address, _index)
+            return ['if (%s)' % _check,
+                    '    ' + _fault,
+                    '%s.i = %s + %s;' % (self._value(op[3]), _address, _index)]
+        elif _kind == 'get':
+            if _ref:
+                return ['%s.i = %s;' % (self._value(op[2]), self._address(op[1]))]
+            return []
+        elif _kind in ('div', 'mod'):
+            if _type == 'float':
+                _fn = 'divide'
+            else:
+                _fn = 'floordiv' if _kind == 'div' else 'floormod'
+            return ['%s%s = %s(%s%s, %s%s);' % (self._value(op[3]), _field, _fn, self._value(op[1]),
+                                                _field, self._value(op[2]), _field)]
+        elif _kind in ('and', 'or'):
+            _op = '&&' if _kind == 'and' else '||'
+            return ['%s.i = %s.i %s %s.i;' % (self._value(op[3]), self._value(op[1]), _op,
+                                              self._value(op[2]))]
+        elif _kind in self.binary_ops:
+            # the result of a comparison is always a bool (in .i)
+            _result = _field if _kind in ('add', 'sub', 'mul') else '.i'
+            return ['%s%s = %s%s %s %s%s;' % (self._value(op[3]), _result, self._value(op[1]), _field,
+                                              self.binary_ops[_kind], self._value(op[2]), _field)]
+        elif _kind == 'not':
+            return ['%s.i = !%s.i;' % (self._value(op[2]), self._value(op[1]))]
+        elif _kind == 'sitofp':
+            return ['%s.f = (double) %s.i;' % (self._value(op[2]), self._value(op[1]))]
+        elif _kind == 'fptosi':
+            return ['%s.i = (long long) %s.f;' % (self._value(op[2]), self._value(op[1]))]
+        elif _kind == 'param':
+            self._params.append(self._value(op[1]))
+            return []
+        elif _kind == 'call':
+            _args = ''.join(', ' + arg for arg in self._params)
+            self._params = []
+            if op[1] not in self.frames:
+                return ['fail("KeyError: %s");' % op[1]]
+            return [self._set(op[2], 'f_%s(top%s)' % (op[1][1:], _args)) + ';']
+        elif _kind == 'return':
+            if _type == 'void':
+                return ['return zero;']
+            return ['return %s;' % self._value(op[1])]
+        elif _kind == 'print':
+            if self._is_string(op[1]):
+                return ['fputs(%s, stdout);' % self._string(op[1])]
+            elif _type == 'float':
+                return ['print_float(%s.f);' % self._value(op[1])]
+            elif _type == 'bool':
+                return ['fputs(%s.i ? "True" : "False", stdout);' % self._value(op[1])]
+            elif _type in ('char', 'string'):
+                return ['put_char(%s.i);' % self._value(op[1])]
+            return ['printf("%%lld", %s.i);' % self._value(op[1])]
+        elif _kind == 'read':
+            return ['%s%s = read_%s();' % (self._value(op[1]), _field, _type)]
+        elif _kind == 'jump':
+            if op[1] not in self._labels:
+                return ['fail("KeyError: %s");' % op[1]]
+            return ['goto L%s;' % op[1][1:]]
+        elif _kind == 'cbranch':
+            if op[2] not in self._labels or op[3] not in self._labels:
+                return ['fail("KeyError: cbranch");']
+            return ['if (%s.i)' % self._value(op[1]),
+                    '    goto L%s;' % op[2][1:],
+                    'goto L%s;' % op[3][1:]]
+        return []
@@ -0,0 +1,291 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_closure.py
+#
+# ClosureInterpreter class: runs the uC intermediate representation as threaded
+#                           code, i.e., as a list of closures, one per instruction
+# ---------------------------------------------------------------------------------
+from uc_interpreter import Interpreter, _Checkpoint
+
+
+class _Halt(Exception):
+    """ Raised when the program runs past its last instruction. """
+
+
+class ClosureInterpreter(Interpreter):
+    """
+    Runs the uC intermediate code with the same memory model (and the
+    same output & exit codes) of the Interpreter, but instead of
+    dispatching the (handler, args) records, each record is compiled
+    into a closure with its slots bound in. Every closure returns the
+    pc of the next instruction, so the main loop is just:
+
+             pc = ops[pc]()
+
+    Instructions without a closure_opcode method are compiled into a
+    closure that calls the run_opcode method of the Interpreter.
+    """
+
+    # the closures bind the slots of each instruction, so they don't fuse
+    fuse = False
+
+    def compile(self):
+        """
+        Compile the decoded program into a list of closures. The last
+        one stops the main loop when the program runs past its end.
+        """
+        ops = [self._compile(pc + 1, run, args)
+               for pc, (run, args) in enumerate(self.program)]
+
+        def halt():
+            raise _Halt()
+        ops.append(halt)
+        return ops
+
+    def _compile(self, nxt, run, args):
+        # nxt is the pc of the next instruction
+        if run.__name__ in self.operators:
+            return self._closure_binary(nxt, self.operators[run.__name__], *args)
+        _compile = getattr(self, 'closure' + run.__name__[3:], None)
+        if _compile is not None:
+            return _compile(nxt, *args)
+        return self._closure_generic(nxt, run, args)
+
+    def run(self, ircode):
+        """
+        Run intermediate code in the interpreter.  ircode is a list
+        of instruction tuples, that is loaded & decoded exactly as in
+        the Interpreter, and then compiled into closures.
+        """
+        self.load(ircode)
+        ops = self.compile()
+        pc = self.start
+        _steps = 0
+        self._start_limits()
+        try:
+            while True:
+                try:
+                    while True:
+                        _steps += 1
+                        pc = ops[pc]()
+                except _Checkpoint:
+                    # the checkpoint handler set the pc to resume from
+                    pc = self.pc
+                    self._check_limits(self.steps + _steps)
+        except _Halt:
+            # the halt closure is not an instruction
+            _steps -= 1
+        finally:
+            self.steps += _steps
+            self.flush()
+
+    #
+    # Closures for the instructions
+    #
+    def _closure_generic(self, nxt, run, args):
+        vm = self
+
+        def op():
+            vm.pc = nxt
+            run(*args)
+            return vm.pc
+        return op
+
+    def _closure_binary(self, nxt, fn, left, right, target):
+        M = self.M
+        vm = self
+
+        def op():
+            fp = vm.fp
+            M[fp + target] = fn(M[fp + left], M[fp + right])
+            return nxt
+        return op
+
+    def closure_alloc_int(self, nxt, varname):
+        M = self.M
+        vm = self
+
+        def op():
+            M[vm.fp + varname] = 0
+            return nxt
+        return op
+
+    def closure_call(self, nxt, source, target):
+        M = self.M
+        vm = self
+        calls = self.calls
+        if source < 0:
+            # the entry pc of the function never changes
+            entry = M[~source]
+
+            def op():
+                calls.append((vm.fp, vm.offset, target, nxt))
+                return entry
+            return op
+        return self._closure_generic(nxt, self.run_call, (source, target))
+
+    def closure_tailcall(self, nxt, source, target):
+        M = self.M
+        vm = self
+        if source < 0:
+            entry = M[~source]
+
+            def op():
+                vm.offset = vm.fp
+                return entry
+            return op
+        return self._closure_generic(nxt, self.run_tailcall, (source, target))
+
+    def closure_cbranch(self, nxt, expr_test, true_target, false_target):
+        M = self.M
+        vm = self
+
+        def op():
+            if M[vm.fp + expr_test]:
+                return true_target
+            return false_target
+        return op
+
+    def closure_define(self, nxt, source, size):
+        if source == '@main':
+            return self._closure_generic(nxt, self.run_define, (source, size))
+        M = self.M
+        vm = self
+
+        def op():
+            # the same as _push, with the size of the frame bound in
+            fp = vm.fp = vm.offset
+            params = vm.params
+            n = len(params)
+            top = fp + (size if size > n else n + 1)
+            if top > vm.stack_limit:
+                vm._check_frame(top)
+            M[fp:fp + n] = params
+            params.clear()
+            M[fp + n] = 0
+            vm.offset = top
+            if top > vm.peak:
+                vm.peak = top
+            return nxt
+        return op
+
+    def closure_elem_int(self, nxt, source, index, target, dim):
+        M = self.M
+        vm = self
+        if not dim:
+            # an array of unknown size is checked against the memory
+            return self._closure_generic(nxt, self.run_elem_int, (source, index, target, dim))
+        if source < 0:
+            address = ~source
+
+            def op():
+                fp = vm.fp
+                i = M[fp + index]
+                if not 0 <= i < dim:
+                    vm._check_index(address, i, dim)
+                M[fp + target] = address + i
+                return nxt
+        else:
+            def op():
+                fp = vm.fp
+                i = M[fp + index]
+                if not 0 <= i < dim:
+                    vm._check_index(fp + source, i, dim)
+                M[fp + target] = fp + source + i
+                return nxt
+        return op
+
+    def closure_jump(self, nxt, target):
+        def op():
+            return target
+        return op
+
+    def closure_literal_int(self, nxt, value, target):
+        M = self.M
+        vm = self
+
+        def op():
+            M[vm.fp + target] = value
+            return nxt
+        return op
+
+    def closure_load_int(self, nxt, varname, target):
+        M = self.M
+        vm = self
+        if varname < 0:
+            address = ~varname
+
+            def op():
+                M[vm.fp + target] = M[address]
+                return nxt
+        else:
+            def op():
+                fp = vm.fp
+                M[fp + target] = M[fp + varname]
+                return nxt
+        return op
+
+    def closure_load_int_(self, nxt, varname, target, dim, ref):
+        M = self.M
+        vm = self
+        if varname >= 0 and dim == 1 and ref == 1:
+            def op():
+                fp = vm.fp
+                M[fp + target] = M[M[fp + varname]]
+                return nxt
+            return op
+        return self._closure_generic(nxt, self.run_load_int_, (varname, target, dim, ref))
+
+    def closure_param_int(self, nxt, source):
+        M = self.M
+        vm = self
+
+        def op():
+            vm.params.append(M[vm.fp + source])
+            return nxt
+        return op
+
+    def closure_return_int(self, nxt, target):
+        M = self.M
+        vm = self
+        calls = self.calls
+
+        def op():
+            if calls:
+                # the same as _pop, returning to the caller
+                _value = M[vm.fp + target]
+                fp, vm.offset, register, pc = calls.pop()
+                vm.fp = fp
+                M[fp + register] = _value
+                return pc
+            vm._pop(vm.fp + target)
+            return vm.pc
+        return op
+
+    def closure_store_int(self, nxt, source, target):
+        M = self.M
+        vm = self
+        if source >= 0 and target >= 0:
+            def op():
+                fp = vm.fp
+                M[fp + target] = M[fp + source]
+                return nxt
+        elif source >= 0:
+            address = ~target
+
+            def op():
+                M[address] = M[vm.fp + source]
+                return nxt
+        else:
+            return self._closure_generic(nxt, self.run_store_int, (source, target))
+        return op
+
+    def closure_store_int_(self, nxt, source, target, dim, ref):
+        M = self.M
+        vm = self
+        if source >= 0 and target >= 0 and dim == 1 and ref == 1:
+            def op():
+                fp = vm.fp
+                M[M[fp + target]] = M[fp + source]
+                return nxt
+            return op
+        return self._closure_generic(nxt, self.run_store_int_, (source, target, dim, ref))
@@ -6,6 +6,34 @@
 from uc_sema import NodeVisitor, ScopedSymbolTable
 import uc_ast
 
+class IRWriter(object):
+    '''
+    Writes uCIR instructions to a text stream (e.g. the .ir or .opt
+    file), one per line. The lines are kept in a buffer of buffer_size
+    lines, that is written to the stream in one write when it's full
+    and by flush, so the text of the whole code is never built.
+    '''
+    def __init__(self, stream, buffer_size=1024):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.buffer = []
+
+    def write(self, inst):
+        self.buffer.append(f"{inst}\n")
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def write_code(self, code):
+        ''' Write all the instructions of code, and flush them. '''
+        for inst in code:
+            self.write(inst)
+        self.flush()
+
+    def flush(self):
+        self.stream.write(''.join(self.buffer))
+        self.buffer.clear()
+
+
 class GenerateCode(NodeVisitor):
     '''
     Node visitor class that creates 3-address encoded instruction sequences.
@@ -24,6 +52,8 @@ class GenerateCode(NodeVisitor):
 
         # string counter
         self.str_counter = 0
+        # constant pool: the global of each constant, by opcode & value
+        self.constants = {}
 
         # ops dictionary
         self.binaryop = {
@@ -53,6 +83,9 @@ class GenerateCode(NodeVisitor):
 
         # The generated code (list of tuples)
         self.code = []
+        # The global declarations & constants, emitted apart from the code
+        # of the functions and put before it at the end (see visit_Program)
+        self.data = []
 
 
     def new_temp(self):
@@ -65,6 +98,23 @@ class GenerateCode(NodeVisitor):
         self.versions[self.fname] += 1
         return name
 
+    def new_constant(self, opcode, value):
+        '''
+        Return the global of a constant (a string, or the initial values
+        of a char or array var), declared once for each opcode & value
+        in the whole program. The constants are never written, so the
+        same global serves every use: a program that prints " " twice
+        has a single @.str for it, where each print had its own before.
+        '''
+        _key = (opcode, repr(value))
+        _name = self.constants.get(_key)
+        if _name is None:
+            _name = '@.str.'+str(self.str_counter)
+            self.str_counter += 1
+            self.constants[_key] = _name
+            self.data.append((opcode, _name, value))
+        return _name
+
     ####################################
     #           AST visitors           #
     ####################################
@@ -83,6 +133,9 @@ class GenerateCode(NodeVisitor):
             self.visit(_decl)
 
         self.current_scope = self.current_scope.enclosing_scope
+        # the globals go first in the code flow
+        self.code = self.data + self.code
+        self.data = []
 
 
     def visit_GlobalDecl(self, node):
@@ -120,7 +173,7 @@ class GenerateCode(NodeVisitor):
         _tmp = None
         if self.current_scope.scope_name == "global":
             inst = ('global_'+ node.type.names[0], '@'+node.declname.name, node.value)
-            self.code.append(inst)
+            self.data.append(inst)
             self.globals[node.declname.name] = node.value
         else:
             
@@ -235,15 +288,7 @@ class GenerateCode(NodeVisitor):
          
     def visit_Constant(self, node):
         if node.type == "string":
-            _gen = '@.str.'+str(self.str_counter)
-            inst = ('global_string', _gen, node.value[1:-1])
-            self.str_counter += 1
-            # find where to declare in the code flow
-            _i = 0
-            while 'global' in self.code[_i][0]:
-                _i += 1
-                # insert in the right spot
-            self.code.insert(_i, inst)
+            _gen = self.new_constant('global_string', node.value[1:-1])
         else:
             # literal value
             _gen = self.new_temp()
@@ -264,7 +309,7 @@ class GenerateCode(NodeVisitor):
                 inst = ('global_'+ node.typeaux + _underdim, '@'+ node.name)
             else:
                 inst = ('global_'+ node.typeaux + _underdim, '@'+ node.name, node.values)
-            self.code.append(inst)   
+            self.data.append(inst)
         else:
             _tmp = self.new_temp()
 
@@ -280,15 +325,7 @@ class GenerateCode(NodeVisitor):
                     self.code.append(inst)  
                 else:
                     # process the string initialized
-                    _str = '@.str.'+str(self.str_counter)
-                    inst = ('global_'+ node.typeaux + _underdim, _str , node.values)
-                    self.str_counter += 1
-                    # find where to declare in the code flow
-                    _i = 0
-                    while 'global' in self.code[_i][0]:
-                        _i += 1
-                    # insert in the right spot
-                    self.code.insert(_i, inst)
+                    _str = self.new_constant('global_'+ node.typeaux + _underdim, node.values)
 
                     # store in the declared temporary
                     inst = ('store_'+ node.typeaux + _underdim, _str, _tmp)
@@ -353,16 +390,8 @@ class GenerateCode(NodeVisitor):
                 inst = ('print_'+_type, _printTmp)
                 self.code.append(inst)
         else:
-            # empty print (creates a \n string and print it)
-            _str = '@.str.'+str(self.str_counter)
-            inst = ('global_char', _str, '\n')
-            self.str_counter += 1
-            # find where to declare in the code flow
-            _i = 0
-            while 'global' in self.code[_i][0]:
-                _i += 1
-                # insert in the right spot
-            self.code.insert(_i, inst)
+            # empty print (prints the \n constant)
+            _str = self.new_constant('global_char', '\n')
             inst = ('print_char', _str)
             self.code.append(inst)
 
@@ -541,23 +570,15 @@ class GenerateCode(NodeVisitor):
         self.code.append(inst)
         inst = (_false0[1:],)
         self.code.append(inst)
-        inst = ('print_string', '@.str.'+str(self.str_counter))
+        # assertion fail str
+        _str = self.new_constant('global_string', 'assertion_fail on '+str(node.coord.line)+':'+str(node.coord.column))
+        inst = ('print_string', _str)
         self.code.append(inst)
         inst = ('jump', self.temps.get('label1'))
         self.code.append(inst)
         inst = (_true1[1:],)
         self.code.append(inst)
 
-        # assertion fail str
-        inst = ('global_string', '@.str.'+str(self.str_counter), 'assertion_fail on '+str(node.coord.line)+':'+str(node.coord.column))
-        self.str_counter += 1
-        # find where to declare in the code flow
-        _i = 0
-        while 'global' in self.code[_i][0]:
-            _i += 1
-        # insert assertion fail in the top of code flow
-        self.code.insert(_i, inst)
-
     def visit_Cast(self, node):
         _src = self.visit(node.expr)   
         _target = self.new_temp()
@@ -711,7 +732,7 @@ class GenerateCode(NodeVisitor):
 
     def visit_Return(self, node):
         if node.expr:
-            if isinstance(node.expr, uc_ast.BinaryOp):
+            if isinstance(node.expr, (uc_ast.BinaryOp, uc_ast.FuncCall)):
                 _return = self.visit(node.expr)
                 inst = ('store_'+node.expr.type, _return, self.temps.get('return'))
                 self.code.append(inst)
@@ -744,9 +765,9 @@ class GenerateCode(NodeVisitor):
         
         # if has a return value
         if node.expr:
-            if isinstance(node.expr, uc_ast.BinaryOp):
+            if isinstance(node.expr, (uc_ast.BinaryOp, uc_ast.FuncCall)):
                 _target = self.new_temp()
-                # check here, node.expr.type works when its a binary operation
+                # check here, node.expr.type works when its a binary operation or a call
                 inst = ('load_'+node.expr.type, self.temps.get('return'), _target)
                 self.code.append(inst)
                 inst = ('return_'+node.expr.type, _target)
@@ -10,7 +10,145 @@
 # Redistribution and use in source form with or without modification are
 # permitted but the source code must retain the above copyright notice.
 # ---------------------------------------------------------------------------------
+import io
+import operator
 import sys
+import time
+from collections import OrderedDict
+from uc_analysis import PurityAnalysis
+from uc_ir import (ALLOC, CBRANCH, DEFINE, ELEM, GET, GLOBAL, JUMP, LABEL, LITERAL, LOAD,
+                   compact, operand_name)
+
+
+class MemoryFault(Exception):
+    """ Raised when the program accesses the memory out of its bounds. """
+    status = 'memory'
+
+
+class StackOverflow(MemoryFault):
+    """ Raised when the frame of a call doesn't fit in the stack region. """
+
+
+class OutOfBounds(MemoryFault):
+    """ Raised when an array is indexed out of its bounds. """
+    status = 'bounds'
+
+
+class MissingMain(Exception):
+    """ Raised when the program has no main function to run. """
+    status = 'error'
+
+
+class LimitExceeded(Exception):
+    """ Raised when the run of a program exceeds one of its limits. """
+    status = 'limit'
+
+
+class InstructionLimit(LimitExceeded):
+    """ Raised when the program executes more instructions than allowed. """
+    status = 'instructions'
+
+
+class TimeLimit(LimitExceeded):
+    """ Raised when the program runs for longer than allowed. """
+    status = 'time'
+
+
+class OutputLimit(LimitExceeded):
+    """ Raised when the program writes more output than allowed. """
+    status = 'output'
+
+
+class _Checkpoint(Exception):
+    """ Raised at a backward jump or call to check the limits of the run. """
+
+
+class Result(object):
+    """
+    The result of a program run by Interpreter.execute: the exit code,
+    the output (None if it was written to a given stream), the counters
+    of the run (e.g. instructions executed), the error that stopped
+    the program, if any, and the status of the run: 'exit' if the
+    program exited, 'error' if it failed, or the status of the fault
+    or limit that stopped it (e.g. 'memory', 'instructions', 'time').
+    """
+
+    def __init__(self, exit_code, output, counters, error=None, status='exit'):
+        self.exit_code = exit_code
+        self.output = output
+        self.counters = counters
+        self.error = error
+        self.status = status
+
+    def __repr__(self):
+        return 'Result(exit_code=%r, status=%r, counters=%r, error=%r)' % (self.exit_code, self.status,
+                                                                         self.counters, self.error)
+
+
+class Input(object):
+    """
+    The input of a program, as a list of tokens (split by whitespace)
+    that are read in bulk from a source, and consumed by advancing an
+    index. The source may be a file object (read in chunks of
+    chunk_size chars, or by lines if it is a terminal), a str, bytes,
+    or a list of tokens. None is the current sys.stdin.
+    """
+
+    def __init__(self, source=None, chunk_size=65536):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.tokens = []        # Tokens read from the source
+        self.index = 0          # Index of the next token to read
+        self.partial = ''       # Start of a token cut at the end of a chunk
+        self.done = False       # True when the source has no more data
+        if isinstance(source, bytes):
+            source = source.decode()
+        if isinstance(source, str):
+            self.tokens = source.split()
+            self.done = True
+        elif isinstance(source, (list, tuple)):
+            self.tokens = [str(token) for token in source]
+            self.done = True
+
+    def next(self):
+        """ Return the next token, or raise EOFError at the end of the input. """
+        while self.index >= len(self.tokens):
+            if not self._fill():
+                raise EOFError
+        _token = self.tokens[self.index]
+        self.index += 1
+        return _token
+
+    def rest(self):
+        """ Return all the tokens not read yet. """
+        while self._fill():
+            pass
+        _tokens = self.tokens[self.index:]
+        self.index = len(self.tokens)
+        return _tokens
+
+    def _fill(self):
+        # read more tokens from the source, dropping the ones already read
+        if self.done:
+            return False
+        _source = self.source if self.source is not None else sys.stdin
+        if _source.isatty():
+            _data = _source.readline()
+        else:
+            _data = _source.read(self.chunk_size)
+        if not _data:
+            self.done = True
+            _data = ''
+        if isinstance(_data, bytes):
+            _data = _data.decode()
+        _data = self.partial + _data
+        self.partial = ''
+        _tokens = _data.split()
+        if _tokens and not self.done and not _data[-1].isspace():
+            self.partial = _tokens.pop()
+        self.tokens = self.tokens[self.index:] + _tokens
+        self.index = 0
+        return bool(_tokens) or not self.done
 
 
 class Interpreter(object):
@@ -29,10 +167,50 @@ class Interpreter(object):
 
     The class executes methods self.run_opcode(args).  For example:
 
-             self.run_literal_int(1, '%1')
-             self.run_literal_int(2, '%2')
-             self.run_add_int('%1', '%2', '%3')
-             self.run_print_int('%3')
+             self.run_literal_int(1, 1)
+             self.run_literal_int(2, 2)
+             self.run_add_int(1, 2, 3)
+             self.run_print_int(3)
+
+    where the names of the temporaries were replaced, when the code
+    was loaded, by their slots in the frame of the function (see
+    _frame_layout), and the names of globals by ~address.
+
+    The output of the program is kept in a buffer, that is written to
+    the output stream (sys.stdout by default) when the program exits,
+    before each read (so prompts still appear) or when it holds more
+    than buffer_size chars. The input is read from an Input, whose
+    source is given by input (sys.stdin by default).
+
+    The memory has memory_size cells: the globals are stored first,
+    and the frames of the calls are stacked after them, up to the
+    stack_size cells of the stack region (by default, the rest of the
+    memory). A call whose frame doesn't fit raises StackOverflow, and
+    an array indexed out of its bounds (or out of the memory, when
+    its size is unknown) raises OutOfBounds.
+
+    The run may be limited to max_instructions instructions, max_time
+    seconds and max_output chars of output, raising InstructionLimit,
+    TimeLimit or OutputLimit. The instructions & time are checked only
+    at the backward jumps & calls, that are decoded into checking
+    handlers when there are limits, so runs without limits don't pay
+    for them. The output is checked when the buffer is flushed.
+
+    The most executed sequences of instructions (the superinstructions
+    table) are fused by load into a single record, so they run in one
+    dispatch (see _fuse).
+
+    A call whose value is returned right away by the caller (a tail
+    call) reuses the frame of the caller, and the callee returns
+    straight to the caller of the caller, so tail recursive functions
+    run in constant memory (see _decode_tailcalls).
+
+    If memo_size is given, the results of the calls of the pure
+    functions (see PurityAnalysis) are kept in a cache of memo_size
+    results, by function & params, and a call whose result is in the
+    cache is not run again. The least recently used result is dropped
+    when the cache is full. The hits & misses of the cache are reported
+    with the counters.
 
     Instructions for use:
         1. Instantiate an object of the Interpreter class
@@ -40,28 +218,107 @@ class Interpreter(object):
            code as a parameter
     """
 
-    def __init__(self):
-        global inputline, M
-        inputline = []
-        M = 10000 * [None]      # Memory for global & local vars
+    # binary, relational & logical ops by the name of their run_ method
+    operators = {
+        'run_add_int': operator.add,
+        'run_sub_int': operator.sub,
+        'run_mul_int': operator.mul,
+        'run_mod_int': operator.mod,
+        'run_div_int': operator.floordiv,
+        'run_div_float': operator.truediv,
+        'run_lt_int': operator.lt,
+        'run_le_int': operator.le,
+        'run_gt_int': operator.gt,
+        'run_ge_int': operator.ge,
+        'run_eq_int': operator.eq,
+        'run_ne_int': operator.ne,
+        'run_and_bool': lambda left, right: left and right,
+        'run_or_bool': lambda left, right: left or right,
+    }
+
+    # kinds of the instructions that can be fused, by the name of their run_
+    # method, besides the binary ops of operators
+    kinds = {
+        'run_alloc_int': 'alloc',
+        'run_literal_int': 'literal',
+        'run_load_int': 'load',
+        'run_store_int': 'store',
+        'run_jump': 'jump',
+        'run_cbranch': 'cbranch',
+    }
+
+    # Superinstructions: the sequences of instructions that run the most in
+    # the profiles of the programs (see uc_profile.py), and the handlers that
+    # run each of them at once. The first pattern that matches is fused.
+    superinstructions = [
+        (('load', 'literal', 'binary', 'store'), 'run_load_literal_binary_store'),
+        (('load', 'load', 'binary', 'store'), 'run_load_load_binary_store'),
+        (('load', 'literal', 'binary', 'cbranch'), 'run_load_literal_binary_cbranch'),
+        (('load', 'load', 'binary', 'cbranch'), 'run_load_load_binary_cbranch'),
+        (('load', 'literal', 'binary'), 'run_load_literal_binary'),
+        (('load', 'load', 'binary'), 'run_load_load_binary'),
+        (('alloc', 'literal', 'store'), 'run_alloc_literal_store'),
+        (('literal', 'store'), 'run_literal_store'),
+        (('load', 'store'), 'run_load_store'),
+        (('store', 'jump'), 'run_store_jump'),
+    ]
+    fuse = True
+
+    def __init__(self, output=None, buffer_size=8192, input=None, memory_size=10000, stack_size=None,
+                 max_instructions=None, max_time=None, max_output=None, memo_size=None):
+        self.M = memory_size * [None]   # Memory for global & local vars
+        self.stack_size = stack_size    # Max size of the stack region (None is the rest of M)
+        self.stack_base = 0             # Address of the start of the stack region
+        self.stack_limit = memory_size  # Address of the end of the stack region
+        self.dims = {}          # Dictionary of the sizes of the global arrays
 
         self.globals = {}       # Dictionary of address of global vars & constants
-        self.vars = {}          # Dictionary of address of local vars relative to sp
-
-        self.offset = 0         # offset (index) of local & global vars. Note that
-                                # each instance of var has absolute address in Memory
-        self.stack = []         # Stack to save address of vars between calls
-        self.sp = []            # Stack to save & restore the last offset
-
-        self.params = []        # List of parameters from caller (address)
+        self.frames = {}        # Dictionary of frame layouts ({var: slot}, size) of
+                                # each function, where slot is relative to fp
+        self.handlers = {}      # Dictionary of the handler of each opcode string
+        self.labels = {}        # Dictionary of label tables ({label: pc}, where label is
+                                # n for %n) of each function, built once when the code
+                                # is loaded
+
+        self.fp = 0             # Frame pointer: address of the frame of the running
+                                # function. Each var is stored at M[fp + slot]
+        self.offset = 0         # offset (index) of the first free position in Memory
+        self.peak = 0           # Highest offset reached by the stack
+        self.calls = []         # Stack of the activations of the callers, as records
+                                # (fp, offset, register of the return value, return pc)
+
+        self.params = []        # List of parameters from caller (values)
         self.result = None      # Result Value (address) from the callee
 
-        self.registers = []     # Stack of register names (in the caller) to return value
-        self.returns = []       # Stack of return addresses (program counters)
-
         self.pc = 0             # Program Counter
         self.start = 0          # PC of the main function
         self.code = None
+        self.steps = 0          # Number of instructions executed
+
+        self.output = output    # Stream of the program output (None is sys.stdout)
+        self.buffer = []        # Output of the program not written to the stream yet
+        self.buffered = 0       # Number of chars in the buffer
+        self.buffer_size = buffer_size
+        self.input = input if isinstance(input, Input) else Input(input)
+
+        self.max_instructions = max_instructions
+        self.max_time = max_time
+        self.max_output = max_output
+        if max_output is not None:
+            # flush as soon as the output may pass the limit
+            self.buffer_size = min(buffer_size, max_output)
+        self.written = 0        # Number of chars written to the output stream
+        self.ticks = 0          # Number of checkpoints to pass before checking the limits
+        self.deadline = None    # Time (time.monotonic) to stop the program
+        self.tierups = []       # Functions promoted to a faster tier (see TieredInterpreter)
+
+        self.memo_size = memo_size  # Max number of results in the cache (None is no cache)
+        self.memo = OrderedDict()   # Results of the pure functions by (function, *params),
+                                    # from the least recently used
+        self.pending = []       # Calls that missed the cache, as (record of the call, key)
+        self.hits = 0           # Number of calls served by the cache
+        self.misses = 0         # Number of calls of pure functions that ran
+        self.evictions = 0      # Number of results dropped from the full cache
 
     def _extract_operation(self, source):
         _modifier = {}
@@ -78,6 +335,21 @@ class Interpreter(object):
             _opcode = _aux[0]
         return (_opcode, _modifier)
 
+    def _array_dims(self, ir):
+        # the sizes of the arrays allocated by a function, by operand
+        _dims = {}
+        for inst in ir:
+            if inst.opcode == ALLOC and inst.dims and not inst.ptr:
+                _dims[inst.operands[0]] = self._product(inst.dims)
+        return _dims
+
+    @staticmethod
+    def _product(dims):
+        _dim = 1
+        for dim in dims:
+            _dim *= dim
+        return _dim
+
     def _copy_data(self, address, size, value):
         if isinstance(value, str):
             _value = list(value)
@@ -85,249 +357,619 @@ class Interpreter(object):
             _value = [item for sublist in value for item in sublist]
         else:
             _value = value
-        M[address:address+size] = _value
-
-    def run(self, ircode):
+        self.M[address:address+size] = _value
+
+    def _frame_layout(self, ir):
+        # Assign a fixed slot (relative to fp) to each var & temporary of a
+        # function. The temporaries are numbered from %0 by the code generator
+        # and the parameters are the first ones, so %n gets the slot n, moved
+        # up by the extra cells of the arrays with lower numbers. Labels don't
+        # go to memory, so they take no cells. The slots are keyed by the ids
+        # of the compact IR: n for %n, and the name for the other vars.
+        _sizes = {}
+        for inst in ir:
+            if inst.opcode == LABEL:
+                _sizes[inst.operands[0]] = 0
+                continue
+            _operands = inst.operands
+            if inst.opcode == LITERAL:
+                # the value is not a var
+                _operands = _operands[1:]
+            for arg in _operands:
+                if type(arg) is int or isinstance(arg, str) and arg[:1] == '%':
+                    _sizes.setdefault(arg, 1)
+            if inst.dims and not inst.ptr and inst.opcode in (ALLOC, LOAD):
+                _sizes[inst.operands[-1]] = self._product(inst.dims)
+
+        _numbered = [var for var in _sizes if type(var) is int]
+        _names = list(range(max(_numbered, default=0) + 1))
+        _names += sorted(var for var in _sizes if type(var) is not int)
+        _slots = {}
+        _size = 0
+        for var in _names:
+            _slots[var] = _size
+            _size += _sizes.get(var, 1)
+        return (_slots, _size)
+
+    def _label_table(self, ir, pc):
+        # Map the labels of a function to the pc of the instruction that
+        # follows them. Labels don't go to the decoded program, so only
+        # the other instructions move the pc.
+        _labels = {}
+        for inst in ir:
+            if inst.opcode == LABEL:
+                _labels[inst.operands[0]] = pc
+            else:
+                pc += 1
+        return _labels
+
+    def _resolve(self, source, slots):
+        # Globals are referenced by ~address (always < 0), so they can be
+        # told apart from the slots of the frame (always >= 0)
+        if type(source) is int:
+            return slots[source]
+        if isinstance(source, str):
+            if source.startswith('@'):
+                return ~self.globals[source]
+            elif source.startswith('%'):
+                return slots[source]
+        return source
+
+    def _decode(self, inst, frame, labels, dims):
+        # Decode one Instruction into a (handler, args) record. The dim/ptr
+        # modifiers are folded into the handler arguments, the vars are
+        # resolved to slots and the labels to pc's, so the main loop never
+        # has to look at the opcode string or at a name again.
+        try:
+            run = self.handlers[inst.name]
+        except KeyError:
+            run = self.handlers[inst.name] = self._handler(inst)
+        if run is None:
+            return (self._run_missing, (inst.operation,))
+        slots, size = frame
+        _opcode = inst.opcode
+        _operands = inst.operands
+        if _opcode == DEFINE:
+            _args = (_operands[0], size)
+        elif _opcode == JUMP:
+            _args = (labels.get(_operands[0]),)
+        elif _opcode == CBRANCH:
+            _args = (slots[_operands[0]], labels.get(_operands[1]), labels.get(_operands[2]))
+        elif _opcode == LITERAL:
+            _args = (_operands[0], slots[_operands[1]])
+        else:
+            _args = tuple([slots[arg] if type(arg) is int else self._resolve(arg, slots) for arg in _operands])
+            if _opcode == ELEM:
+                # the size of the array, if known, to check the index
+                _args += (dims.get(_operands[0], 0),)
+        if inst.dims or inst.ptr:
+            return (run, _args + (self._product(inst.dims), inst.ptr))
+        return (run, _args)
+
+    def _handler(self, inst):
+        # the run_ method of the opcode of an Instruction, or None
+        if not hasattr(self, "run_" + inst.operation):
+            return None
+        if inst.dims or inst.ptr:
+            return getattr(self, "run_" + inst.operation + '_')
+        return getattr(self, "run_" + inst.operation)
+
+    def load(self, ircode):
         """
-        Run intermediate code in the interpreter.  ircode is a list
-        of instruction tuples.  Each instruction (opcode, *args) is
-        dispatched to a method self.run_opcode(*args)
+        Load intermediate code in the interpreter: store the global
+        vars & constants in the memory, and decode the code of the
+        functions into self.program, a list of (handler, args) records.
+        The code is read as the compact IR of uc_ir (kept in self.ir),
+        so each opcode string is parsed only once. Raises MissingMain if
+        the code has no main function.
         """
 
+        M = self.M
+
         # First, store the global vars & constants
         # Also, set the start pc to the main function entry
         self.code = ircode
+        self.ir = compact(ircode)
         self.pc = 0
         self.offset = 0
-        while True:
-            try:
-                op = ircode[self.pc]
-            except IndexError:
-                break
-            if not op[0].isdigit():
-                opcode, modifier = self._extract_operation(op[0])
-                if opcode.startswith('global'):
-                    self.globals[op[1]] = self.offset
-                    # get the size of global var
-                    if not modifier:
-                        # size equals 1 or is a constant, so we use only
-                        # one slot in the memory to make it simple.
-                        if len(op) == 3:
-                            M[self.offset] = op[2]
-                        self.offset += 1
-                    else:
-                        _len = 1
-                        for args in modifier.values():
-                            if args.isdigit():
-                                _len *= int(args)
-                        if len(op) == 3:
-                            self._copy_data(self.offset, _len, op[2])
-                        self.offset += _len
-                elif opcode == 'define':
-                        self.globals[op[1]] = self.offset
-                        M[self.offset] = self.pc
-                        self.offset += 1
-                        if op[1] == '@main':
-                            self.start = self.pc
+        _defines = []
+        for inst in self.ir:
+            if inst.opcode == GLOBAL:
+                _name = inst.operands[0]
+                self.globals[_name] = self.offset
+                # get the size of global var
+                if not inst.dims and not inst.ptr:
+                    # size equals 1 or is a constant, so we use only
+                    # one slot in the memory to make it simple.
+                    self._check_globals(1)
+                    if len(inst.operands) == 2:
+                        M[self.offset] = inst.operands[1]
+                    self.offset += 1
+                else:
+                    _len = self._product(inst.dims)
+                    self._check_globals(_len)
+                    self.dims[_name] = _len
+                    if len(inst.operands) == 2:
+                        self._copy_data(self.offset, _len, inst.operands[1])
+                    self.offset += _len
+            elif inst.opcode == DEFINE:
+                self._check_globals(1)
+                self.globals[inst.operands[0]] = self.offset
+                self.offset += 1
+                _defines.append(self.pc)
             self.pc += 1
 
+        # every engine loads the code before running (or translating) it,
+        # so a program without main fails here, the same way in all of them
+        if not any(self.ir[pc].operands[0] == '@main' for pc in _defines):
+            raise MissingMain("the program has no main function")
+
+        # The stack region starts after the globals
+        self.stack_base = self.offset
+        self.peak = self.offset
+        if self.stack_size is not None:
+            self.stack_limit = min(len(M), self.offset + self.stack_size)
+
+        # Then, lay out the frame & the labels of each function and decode
+        # its code. The entry pc of the function is stored in its global.
+        self.program = []
+        _bounds = _defines + [len(self.ir)]
+        for begin, end in zip(_bounds, _bounds[1:]):
+            _ir = self.ir[begin:end]
+            _name = _ir[0].operands[0]
+            _frame = self._frame_layout(_ir)
+            _labels = self._label_table(_ir, len(self.program))
+            # the frames are kept by the names of the vars, as in the uCIR
+            self.frames[_name] = ({operand_name(var): slot for var, slot in _frame[0].items()}, _frame[1])
+            self.labels[_name] = _labels
+            M[self.globals[_name]] = len(self.program)
+            if _name == '@main':
+                self.start = len(self.program)
+            _dims = dict(self.dims)
+            _dims.update(self._array_dims(_ir))
+            _entry = len(self.program)
+            self.program += [self._decode(inst, _frame, _labels, _dims)
+                             for inst in _ir if inst.opcode != LABEL]
+            if self._frame_is_private(_ir):
+                self._decode_tailcalls(_entry, len(self.program))
+        self._decode_checkpoints()
+        if self.memo_size:
+            self._decode_memo()
+        if self.fuse:
+            self._fuse()
+
+    def run(self, ircode):
+        """
+        Run intermediate code in the interpreter.  ircode is a list
+        of instruction tuples.  The code is decoded once into a list
+        of (handler, args) records, and then each record is dispatched
+        as handler(*args).
+        """
+        self.load(ircode)
+
         # Now, running the program starting from the main function
+        program = self.program
         self.pc = self.start
-        while True:
-            try:
-                op = ircode[self.pc]
-            except IndexError:
-                break
-            self.pc += 1
-            if not op[0].isdigit():
-                opcode, modifier = self._extract_operation(op[0])
-                if hasattr(self, "run_" + opcode):
-                    if not modifier:
-                        getattr(self, "run_" + opcode)(*op[1:])
-                    else:
-                        getattr(self, "run_" + opcode + '_')(*op[1:], **modifier)
-                else:
-                    print("Warning: No run_" + opcode + "() method", flush=True)
+        _steps = 0
+        self._start_limits()
+        try:
+            while True:
+                try:
+                    while True:
+                        try:
+                            run, args = program[self.pc]
+                        except IndexError:
+                            break
+                        self.pc += 1
+                        _steps += 1
+                        run(*args)
+                    break
+                except _Checkpoint:
+                    self._check_limits(self.steps + _steps)
+        finally:
+            self.steps += _steps
+            self.flush()
+
+    def execute(self, ircode):
+        """
+        Run intermediate code in-process, and return a Result instead
+        of exiting the process when the program ends. The output is
+        captured in the result, unless an output stream was given.
+        A runtime error of the program (e.g. a division by zero) ends
+        it with exit code 1, and is reported in the result.
+        """
+        _output = self.output
+        if _output is None:
+            self.output = io.StringIO()
+        _error = None
+        _status = 'exit'
+        try:
+            self.run(ircode)
+            _code = 0
+        except SystemExit as e:
+            _code = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except (MemoryFault, LimitExceeded, MissingMain) as e:
+            _code = 1
+            _status = e.status
+            _error = '%s: %s' % (type(e).__name__, e)
+        except Exception as e:
+            _code = 1
+            _status = 'error'
+            _error = '%s: %s' % (type(e).__name__, e)
+        finally:
+            _captured = self.output
+            self.output = _output
+        _text = _captured.getvalue() if _output is None else None
+        return Result(_code, _text, self._counters(), _error, _status)
+
+    def _counters(self):
+        # the counters of the run reported by execute: the instructions
+        # executed & the peak size of the stack, in cells
+        _counters = {'instructions': self.steps, 'memory': self.peak - self.stack_base}
+        if self.memo_size:
+            _counters['memo'] = {'hits': self.hits, 'misses': self.misses,
+                                 'evictions': self.evictions, 'size': len(self.memo)}
+        return _counters
+
+    def check_options(self):
+        """
+        Raise ValueError if the engine can't run with the limits & the
+        cache it was given. The Interpreter runs with all of them.
+        """
+
+    def flush(self):
+        """ Write the buffered output of the program to the output stream. """
+        _output = self.output if self.output is not None else sys.stdout
+        _data = ''.join(self.buffer)
+        self.buffer.clear()
+        self.buffered = 0
+        if self.max_output is not None and self.written + len(_data) > self.max_output:
+            # write the output up to the limit, and stop the program
+            _output.write(_data[:self.max_output - self.written])
+            _output.flush()
+            self.written = self.max_output
+            raise OutputLimit("the output exceeds %d chars" % self.max_output)
+        _output.write(_data)
+        _output.flush()
+        self.written += len(_data)
 
     #
     # Auxiliary methods
     #
-    def _alloc_labels(self):
-        # Alloc labels for current function definition. Due to the uCIR and due to
-        # the chosen memory model, this is done every time we enter a function.
-        _lpc = self.pc
-        while True:
-            try:
-                _opcode = self.code[_lpc][0]
-                _lpc += 1
-                if _opcode == 'define':
+    def _check_globals(self, size):
+        if self.offset + size > len(self.M):
+            raise MemoryFault("the globals don't fit in a memory of %d cells" % len(self.M))
+
+    def _check_frame(self, top):
+        if top > self.stack_limit:
+            raise StackOverflow("the stack is full (%d cells)" % (self.stack_limit - self.stack_base))
+
+    def _check_index(self, address, index, dim):
+        # the index of an array of known size, or an address in the memory
+        if dim:
+            if not 0 <= index < dim:
+                raise OutOfBounds("index %s out of the bounds of an array of %d" % (index, dim))
+        elif not 0 <= address + index < len(self.M):
+            raise OutOfBounds("address %s out of the memory" % (address + index))
+
+    def _decode_checkpoints(self):
+        # replace the backward jumps & the calls of the decoded program by
+        # handlers that count the checkpoints, to check the limits
+        if self.max_instructions is None and self.max_time is None:
+            return
+        for pc, (run, args) in enumerate(self.program):
+            if run == self.run_jump and args[0] is not None and args[0] <= pc:
+                self.program[pc] = (self.run_jump_back, args)
+            elif run == self.run_cbranch and any(arg is not None and arg <= pc for arg in args[1:]):
+                self.program[pc] = (self.run_cbranch_back, args)
+            elif run == self.run_call:
+                self.program[pc] = (self.run_call_back, args)
+            elif run == self.run_tailcall:
+                self.program[pc] = (self.run_tailcall_back, args)
+
+    def _frame_is_private(self, ir):
+        # the frame of a function can be reused by its tail calls only if
+        # no address into it escapes: no arrays & no pointers in the frame
+        for inst in ir:
+            if inst.dims or inst.ptr or inst.opcode == GET:
+                return False
+        return True
+
+    def _decode_tailcalls(self, begin, end):
+        # Replace the calls of the function decoded in program[begin:end]
+        # whose value is stored in the return register and then loaded &
+        # returned (as GenerateCode does for return f(...)) by tail calls.
+        # The return register is not read by anyone else after the call,
+        # so the callee can return its value to the caller directly.
+        program = self.program
+        for pc in range(begin, end - 2):
+            run, args = program[pc]
+            if run != self.run_call:
+                continue
+            (store, store_args), (jump, jump_args) = program[pc + 1:pc + 3]
+            if store != self.run_store_int or store_args[0] != args[1] or jump != self.run_jump:
+                continue
+            _label = jump_args[0]
+            if _label is None or not begin <= _label < end - 1:
+                continue
+            (load, load_args), (ret, ret_args) = program[_label:_label + 2]
+            if (load == self.run_load_int and load_args[0] == store_args[1] and
+                    ret == self.run_return_int and ret_args == (load_args[1],)):
+                program[pc] = (self.run_tailcall, args)
+
+    def _decode_memo(self):
+        # wrap the calls of the pure functions in handlers that look up
+        # the cache, and replace their returns by handlers that fill it
+        _pure = PurityAnalysis(self.ir).pure_functions()
+        _names = {~self.globals[name]: name for name in _pure}
+        _entries = sorted((self.M[self.globals[name]], name) for name in self.frames)
+        _ends = [pc for pc, _ in _entries[1:]] + [len(self.program)]
+        for (begin, name), end in zip(_entries, _ends):
+            for pc in range(begin, end):
+                run, args = self.program[pc]
+                if run.__name__.startswith('run_call') and args[0] in _names:
+                    self.program[pc] = (self.run_call_memo, (run, _names[args[0]]) + args)
+                elif name in _pure and run == self.run_return_int:
+                    self.program[pc] = (self.run_return_memo, args)
+
+    def _remember(self, key, value):
+        self.memo[key] = value
+        if len(self.memo) > self.memo_size:
+            self.memo.popitem(last=False)
+            self.evictions += 1
+
+    def _memo_return(self, value):
+        # the running call returns value: if it missed the cache, its
+        # record is on the top of pending, and the value is its result
+        _pending = self.pending
+        if _pending and self.calls and _pending[-1][0] is self.calls[-1]:
+            self._remember(_pending.pop()[1], value)
+
+    def _fuse(self):
+        # Replace the first record of each sequence that matches one of the
+        # superinstructions by a record of its handler, whose args are the
+        # pc that follows the sequence & the args of its records (with the
+        # function of the binary ops). The sequence can't have a label in
+        # the middle, so the other records are never run.
+        program = self.program
+        _targets = {pc for labels in self.labels.values() for pc in labels.values()}
+        _kinds = [self.kinds.get(run.__name__, 'binary' if run.__name__ in self.operators else None)
+                  for run, _ in program]
+        pc = 0
+        while pc < len(program):
+            for pattern, name in self.superinstructions:
+                _end = pc + len(pattern)
+                if tuple(_kinds[pc:_end]) == pattern and _targets.isdisjoint(range(pc + 1, _end)):
+                    _args = (_end,)
+                    for run, args in program[pc:_end]:
+                        if run.__name__ in self.operators:
+                            _args += (self.operators[run.__name__],)
+                        _args += args
+                    program[pc] = (getattr(self, name), _args)
+                    pc = _end - 1
                     break
-                elif _opcode.isdigit():
-                    # labels don't go to memory, just in the dictionary
-                    self.vars['%' + _opcode] = _lpc
-            except IndexError:
-                break
-
-    def _alloc_reg(self, target):
-        # Alloc space in memory and save the offset in the dictionary
-        # for new vars or tempraries, only.
-        if target not in self.vars:
-            self.vars[target] = self.offset
-            self.offset += 1
+            pc += 1
+
+    def _start_limits(self):
+        self.ticks = 0
+        if self.max_time is not None:
+            self.deadline = time.monotonic() + self.max_time
+
+    def _check_limits(self, steps):
+        # steps is the number of instructions executed so far
+        if self.max_instructions is not None and steps >= self.max_instructions:
+            raise InstructionLimit("the program executed %d instructions" % steps)
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise TimeLimit("the program ran for more than %gs" % self.max_time)
+        # the code between two checkpoints runs at most once, so the limit
+        # of instructions isn't passed by more than the size of the program
+        self.ticks = 10000
+        if self.max_instructions is not None:
+            self.ticks = min(self.ticks, (self.max_instructions - steps) // max(len(self.program), 1))
 
     def _get_address(self, source):
-        if source.startswith('@'):
-            return self.globals[source]
+        if source < 0:
+            return ~source
         else:
-            return self.vars[source]
+            return self.fp + source
 
     def _get_input(self):
-        global inputline
-        while True:
-            if len(inputline) > 0:
-                break
-            inputline = sys.stdin.readline()
-            if not inputline:
-                print("Unexpected end of input file.", flush=True)
-            inputline = inputline[:-1].strip().split()
+        # the output is flushed first, so the prompts appear before
+        # the program waits for the input. The program stops at the
+        # end of the input.
+        self.flush()
+        try:
+            return self.input.next()
+        except EOFError:
+            self._print("Unexpected end of input file.\n")
+            self.flush()
+            sys.exit(1)
 
     def _get_value(self, source):
-        if source.startswith('@'):
-            return M[self.globals[source]]
+        M = self.M
+        if source < 0:
+            return M[~source]
         else:
-            return M[self.vars[source]]
-
-    def _load_multiple_values(self, size, varname, target):
-        self.vars[target] = self.offset
-        self.offset += size
-        self._store_multiple_values(size, target, varname)
-
-    def _push(self):
-        # save the addresses of the vars from caller & their last offset
-        self.stack.append(self.vars)
-        self.sp.append(self.offset)
-
-        # clear the dictionary of caller local vars and their offsets in memory
-        # and copy the parameters passed to the callee in their local vars.
-        # Finally, cleanup the parameters list used to transfer these vars
-        self.vars = {}
-        idx = -1
-        
-        for idx, val in enumerate(self.params):
-            # Note that arrays (size >=1) are passed by reference only.
-            self.vars['%' + str(idx)] = self.offset
-            M[self.offset] = M[val]
-            self.offset += 1
-        self.params = []
-
-        # alloc register to the return value & initialize it with 0.
-        self.vars['%' + str(idx+1)] = self.offset
-        M[self.offset] = 0
-        self.offset += 1
-
-        self._alloc_labels()
+            return M[self.fp + source]
+
+    def _push(self, size):
+        M = self.M
+        # the frame of the callee starts at the first free position (the
+        # caller was saved by the call), and the parameters passed to the
+        # callee are copied as a block in its first slots. Finally, cleanup
+        # the parameters list used to transfer these vars, to reuse it.
+        self.fp = self.offset
+        _nparams = len(self.params)
+        _top = self.fp + max(size, _nparams + 1)
+        self._check_frame(_top)
+        # Note that arrays (size >=1) are passed by reference only.
+        M[self.fp:self.fp + _nparams] = self.params
+        self.params.clear()
+
+        # initialize the register of the return value with 0.
+        M[self.fp + _nparams] = 0
+        self.offset = _top
+        if _top > self.peak:
+            self.peak = _top
 
     def _pop(self, target):
-        if self.returns:
+        M = self.M
+        if self.calls:
             # get the return value
             _value = M[target]
-            # restore the vars of the caller
-            self.vars = self.stack.pop()
+            # restore the frame & the last offset of the caller, and jump
+            # to the return point in the caller
+            self.fp, self.offset, _register, self.pc = self.calls.pop()
             # store in the caller return register the _value
-            M[self.vars[self.registers.pop()]] = _value
-            # restore the last offset from the caller
-            self.offset = self.sp.pop()
-            # jump to the return point in the caller
-            self.pc = self.returns.pop()
+            M[self.fp + _register] = _value
         else:
             # We reach the end of main function, so return to system
             # with the code returned by main in the return register.
-            print(flush=True)
             if target is None:
                 # void main () was defined, so exit with value 0
-                sys.exit(0)
+                self._exit(0)
             else:
-                sys.exit(M[target])
+                self._exit(M[target])
+
+    def _exit(self, value):
+        self._print('\n')
+        self.flush()
+        sys.exit(value)
 
     def _store_deref(self, target, value):
-        if target.startswith('@'):
-            M[M[self.globals[target]]] = value
+        self.M[self._get_value(target)] = value
+
+    def _copy_cells(self, dim, left, right, constant):
+        M = self.M
+        if constant and isinstance(M[right], str) and len(M[right]) > 1:
+            # a string constant uses only one slot in the memory, so
+            # spread its chars over the target array.
+            _value = list(M[right])[:dim]
+            dim = len(_value)
         else:
-            M[M[self.vars[target]]] = value
+            _value = M[right:right+dim]
+        # a slice out of the memory would resize it, instead of failing
+        if left < 0 or right < 0 or left + dim > len(M) or len(_value) < dim:
+            raise OutOfBounds("copy of %d cells out of the memory" % dim)
+        M[left:left+dim] = _value
 
     def _store_multiple_values(self, dim, target, value):
         _left = self._get_address(target)
         _right = self._get_address(value)
-        if value.startswith('@'):
-            if isinstance(M[_right], str):
-                _value = list(M[_right])
-                M[_left:_left+dim] = _value
-                return
-        M[_left:_left+dim] = M[_right:_right+dim]
+        self._copy_cells(dim, _left, _right, value < 0)
 
     def _store_value(self, target, value):
-        if target.startswith('@'):
-            M[self.globals[target]] = value
+        M = self.M
+        if target < 0:
+            M[~target] = value
         else:
-            M[self.vars[target]] = value
+            M[self.fp + target] = value
 
     #
     # Run Operations, except Binary, Relational & Cast
     #
+    def _run_missing(self, opcode):
+        self._print("Warning: No run_" + opcode + "() method\n")
+
     def run_alloc_int(self, varname):
-        self._alloc_reg(varname)
-        M[self.vars[varname]] = 0
+        self.M[self.fp + varname] = 0
 
     run_alloc_float = run_alloc_int
     run_alloc_char = run_alloc_int
 
-    def run_alloc_int_(self, varname, **kwargs):
-        _dim = 1
-        for arg in kwargs.values():
-            if arg.isdigit():
-                _dim *= int(arg)
-        self.vars[varname] = self.offset
-        M[self.offset:self.offset + _dim] = _dim * [0]
-        self.offset += _dim
+    def run_alloc_int_(self, varname, dim, ref):
+        _address = self.fp + varname
+        self.M[_address:_address + dim] = dim * [0]
 
     run_alloc_float_ = run_alloc_int_
     run_alloc_char_ = run_alloc_int_
 
     def run_call(self, source, target):
-        # alloc register to return and append it to register stack
-        self._alloc_reg(target)
-        self.registers.append(target)
-        # save the return pc in the return stack
-        self.returns.append(self.pc)
-        # jump to the calle function
-        if source.startswith('@'):
-            self.pc = M[self.globals[source]]
+        # save the caller: its frame, its last offset, the register to
+        # return to & the return pc, and jump to the callee function
+        self.calls.append((self.fp, self.offset, target, self.pc))
+        self.pc = self._get_value(source)
+
+    def run_tailcall(self, source, target):
+        # the caller is done, so the frame of the callee starts at the
+        # frame of the caller, and the callee returns to the caller saved
+        # by the last call
+        self.offset = self.fp
+        self.pc = self._get_value(source)
+
+    def run_call_memo(self, run, name, source, target, *args):
+        # run is the handler of the call, that takes the other args
+        _key = (name,) + tuple(self.params)
+        if _key in self.memo:
+            self.memo.move_to_end(_key)
+            self.hits += 1
+            self.params.clear()
+            self.M[self.fp + target] = self.memo[_key]
+            return
+        self.misses += 1
+        _depth = len(self.calls)
+        run(source, target, *args)
+        if len(self.calls) > _depth:
+            # the return of the callee fills the cache. Note that the
+            # record is kept alive by pending, so it can be told apart
+            self.pending.append((self.calls[-1], _key))
         else:
-            self.pc = M[self.vars[source]]
+            # the callee already returned (from a faster tier)
+            self._remember(_key, self.M[self.fp + target])
 
     def run_cbranch(self, expr_test, true_target, false_target):
-        if M[self.vars[expr_test]]:
-            self.pc = self.vars[true_target]
+        if self.M[self.fp + expr_test]:
+            self.pc = true_target
+        else:
+            self.pc = false_target
+
+    # Backward jumps & calls, when the run has limits
+    def run_jump_back(self, target):
+        self.pc = target
+        self.ticks -= 1
+        if self.ticks < 0:
+            raise _Checkpoint()
+
+    def run_cbranch_back(self, expr_test, true_target, false_target):
+        if self.M[self.fp + expr_test]:
+            self.pc = true_target
         else:
-            self.pc = self.vars[false_target]
+            self.pc = false_target
+        self.ticks -= 1
+        if self.ticks < 0:
+            raise _Checkpoint()
+
+    def run_call_back(self, source, target):
+        self.run_call(source, target)
+        self.ticks -= 1
+        if self.ticks < 0:
+            raise _Checkpoint()
+
+    def run_tailcall_back(self, source, target):
+        self.run_tailcall(source, target)
+        self.ticks -= 1
+        if self.ticks < 0:
+            raise _Checkpoint()
 
     # Enter the function
-    def run_define(self, source):
+    def run_define(self, source, size):
         if source == '@main':
-            # alloc register to the return value but not initialize it.
-            # We use the "None" value to check if main function returns void.
-            self._alloc_reg('%0')
-            # alloc the labels with respective pc's
-            self._alloc_labels()
+            # alloc the frame, with the register to the return value (%0),
+            # but not initialize it. We use the "None" value to check if main
+            # function returns void.
+            self._check_frame(self.offset + size)
+            self.fp = self.offset
+            self.offset += size
+            self.peak = max(self.peak, self.offset)
         else:
-            self._push()
+            self._push(size)
 
-    def run_elem_int(self, source, index, target):
-        self._alloc_reg(target)
+    def run_elem_int(self, source, index, target, dim):
+        M = self.M
         _aux = self._get_address(source)
-        _idx = self._get_value(index)
-        _address = _aux + _idx
-        self._store_value(target, _address)
+        _idx = M[self.fp + index]
+        self._check_index(_aux, _idx, dim)
+        M[self.fp + target] = _aux + _idx
 
     run_elem_float = run_elem_int
     run_elem_char = run_elem_int
@@ -337,115 +979,103 @@ class Interpreter(object):
         # but we need to define it
         pass
 
-    def run_get_int_(self, source, target, **kwargs):
-        # kwargs always contain * (ref), so we ignore it.
+    def run_get_int_(self, source, target, dim, ref):
+        # the modifier is always * (ref), so we ignore it.
         self._store_value(target, self._get_address(source))
 
     run_get_float_ = run_get_int_
     run_get_char_ = run_get_int_
 
     def run_jump(self, target):
-        self.pc = self.vars[target]
+        self.pc = target
 
     # load literals into registers
     def run_literal_int(self, value, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = value
+        self.M[self.fp + target] = value
 
     run_literal_float = run_literal_int
     run_literal_char = run_literal_int
 
     # Load/stores
     def run_load_int(self, varname, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = self._get_value(varname)
+        self.M[self.fp + target] = self._get_value(varname)
 
     run_load_float = run_load_int
     run_load_char = run_load_int
     run_load_bool = run_load_int
 
-    def run_load_int_(self, varname, target, **kwargs):
-        _ref = 0
-        _dim = 1
-        for arg in kwargs.values():
-            if arg.isdigit():
-                _dim *= int(arg)
-            elif arg == '*':
-                _ref += 1
-        if _ref == 0:
-            self._load_multiple_values(_dim, varname, target)
-        elif _dim == 1 and _ref == 1:
-            self._alloc_reg(target)
-            M[self.vars[target]] = M[self._get_value(varname)]
+    def run_load_int_(self, varname, target, dim, ref):
+        M = self.M
+        if ref == 0:
+            self._store_multiple_values(dim, target, varname)
+        elif dim == 1 and ref == 1:
+            M[self.fp + target] = M[self._get_value(varname)]
 
     run_load_float_ = run_load_int_
     run_load_char_ = run_load_int_
 
     def run_param_int(self, source):
-        
-        self.params.append(self.vars[source])
+        self.params.append(self.M[self.fp + source])
 
     run_param_float = run_param_int
     run_param_char = run_param_int
 
+    def _print(self, value):
+        _text = str(value)
+        self.buffer.append(_text)
+        self.buffered += len(_text)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
     def run_print_string(self, source):
-        _res = list(self._get_value((source)))
-        for c in _res:
-            print(c, end="", flush=True)
+        self._print(self._get_value(source))
 
     def run_print_int(self, source):
-        print(self._get_value(source), end="", flush=True)
+        self._print(self._get_value(source))
 
     run_print_float = run_print_int
     run_print_char = run_print_int
     run_print_bool = run_print_int
 
-    def run_read_int(self, source):
-        global inputline
-        self._get_input()
+    def _read_int(self):
+        _token = self._get_input()
         try:
-            v1 = inputline[0]
-            inputline = inputline[1:]
-            try:
-                v2 = int(v1)
-            except:
-                v2 = v1
-        except:
-            print("Illegal input value.", flush=True)
-        self._alloc_reg(source)
-        self._store_value(source, v2)
+            return int(_token)
+        except ValueError:
+            return _token
 
-    def run_read_float(self, source):
-        global inputline
-        self._get_input()
+    def _read_float(self):
+        _token = self._get_input()
         try:
-            v1 = inputline[0]
-            inputline = inputline[1:]
-            try:
-                v2 = float(v1)
-            except:
-                v2 = v1
-        except:
-            print("Illegal input value.", flush=True)
-        self._alloc_reg(source)
-        self._store_value(source, v2)
+            return float(_token)
+        except ValueError:
+            return _token
+
+    def _read_char(self):
+        return self._get_input()
+
+    def run_read_int(self, source):
+        self._store_value(source, self._read_int())
+
+    def run_read_float(self, source):
+        self._store_value(source, self._read_float())
 
     def run_read_char(self, source):
-        global inputline
-        self._get_input()
-        v1 = inputline[0]
-        inputline = inputline[1:]
-        self._alloc_reg(source)
-        self._store_value(source, v1)
+        self._store_value(source, self._read_char())
 
     def run_return_int(self, target):
-        self._pop(self.vars[target])
+        self._pop(self.fp + target)
 
     run_return_float = run_return_int
     run_return_char = run_return_int
 
+    def run_return_memo(self, target):
+        self._memo_return(self.M[self.fp + target])
+        self._pop(self.fp + target)
+
     def run_return_void(self):
-        self._pop(M[self.vars['%0']])
+        # %0 is always in the first slot of the frame
+        self._pop(self.M[self.fp])
 
     def run_store_int(self, source, target):
         self._store_value(target, self._get_value(source))
@@ -454,48 +1084,161 @@ class Interpreter(object):
     run_store_char = run_store_int
     run_store_bool = run_store_int
 
-    def run_store_int_(self, source, target, **kwargs):
-        _ref = 0
-        _dim = 1
-        for arg in kwargs.values():
-            if arg.isdigit():
-                _dim *= int(arg)
-            elif arg == '*':
-                _ref += 1
-        if _ref == 0:
-            self._store_multiple_values(_dim, target, source)
-        elif _dim == 1 and _ref == 1:
+    def run_store_int_(self, source, target, dim, ref):
+        if ref == 0:
+            self._store_multiple_values(dim, target, source)
+        elif dim == 1 and ref == 1:
             self._store_deref(target, self._get_value(source))
 
     run_store_float_ = run_store_int_
     run_store_char_ = run_store_int_
 
+    #
+    # Superinstructions: each one runs its sequence of instructions in one
+    # dispatch, and counts the other instructions in steps. See _fuse.
+    #
+    def run_load_literal_binary_store(self, nxt, varname, temp, value, literal, fn, left, right, result,
+                                      source, target):
+        M = self.M
+        fp = self.fp
+        M[fp + temp] = M[~varname] if varname < 0 else M[fp + varname]
+        M[fp + literal] = value
+        M[fp + result] = fn(M[fp + left], M[fp + right])
+        _value = M[~source] if source < 0 else M[fp + source]
+        if target < 0:
+            M[~target] = _value
+        else:
+            M[fp + target] = _value
+        self.steps += 3
+        self.pc = nxt
+
+    def run_load_load_binary_store(self, nxt, varname1, temp1, varname2, temp2, fn, left, right, result,
+                                   source, target):
+        M = self.M
+        fp = self.fp
+        M[fp + temp1] = M[~varname1] if varname1 < 0 else M[fp + varname1]
+        M[fp + temp2] = M[~varname2] if varname2 < 0 else M[fp + varname2]
+        M[fp + result] = fn(M[fp + left], M[fp + right])
+        _value = M[~source] if source < 0 else M[fp + source]
+        if target < 0:
+            M[~target] = _value
+        else:
+            M[fp + target] = _value
+        self.steps += 3
+        self.pc = nxt
+
+    def run_load_literal_binary_cbranch(self, nxt, varname, temp, value, literal, fn, left, right, result,
+                                        expr_test, true_target, false_target):
+        M = self.M
+        fp = self.fp
+        M[fp + temp] = M[~varname] if varname < 0 else M[fp + varname]
+        M[fp + literal] = value
+        M[fp + result] = fn(M[fp + left], M[fp + right])
+        self.steps += 3
+        self.pc = true_target if M[fp + expr_test] else false_target
+
+    def run_load_load_binary_cbranch(self, nxt, varname1, temp1, varname2, temp2, fn, left, right, result,
+                                     expr_test, true_target, false_target):
+        M = self.M
+        fp = self.fp
+        M[fp + temp1] = M[~varname1] if varname1 < 0 else M[fp + varname1]
+        M[fp + temp2] = M[~varname2] if varname2 < 0 else M[fp + varname2]
+        M[fp + result] = fn(M[fp + left], M[fp + right])
+        self.steps += 3
+        self.pc = true_target if M[fp + expr_test] else false_target
+
+    def run_load_literal_binary(self, nxt, varname, temp, value, literal, fn, left, right, result):
+        M = self.M
+        fp = self.fp
+        M[fp + temp] = M[~varname] if varname < 0 else M[fp + varname]
+        M[fp + literal] = value
+        M[fp + result] = fn(M[fp + left], M[fp + right])
+        self.steps += 2
+        self.pc = nxt
+
+    def run_load_load_binary(self, nxt, varname1, temp1, varname2, temp2, fn, left, right, result):
+        M = self.M
+        fp = self.fp
+        M[fp + temp1] = M[~varname1] if varname1 < 0 else M[fp + varname1]
+        M[fp + temp2] = M[~varname2] if varname2 < 0 else M[fp + varname2]
+        M[fp + result] = fn(M[fp + left], M[fp + right])
+        self.steps += 2
+        self.pc = nxt
+
+    def run_alloc_literal_store(self, nxt, varname, value, literal, source, target):
+        M = self.M
+        fp = self.fp
+        M[fp + varname] = 0
+        M[fp + literal] = value
+        _value = M[~source] if source < 0 else M[fp + source]
+        if target < 0:
+            M[~target] = _value
+        else:
+            M[fp + target] = _value
+        self.steps += 2
+        self.pc = nxt
+
+    def run_literal_store(self, nxt, value, literal, source, target):
+        M = self.M
+        fp = self.fp
+        M[fp + literal] = value
+        _value = M[~source] if source < 0 else M[fp + source]
+        if target < 0:
+            M[~target] = _value
+        else:
+            M[fp + target] = _value
+        self.steps += 1
+        self.pc = nxt
+
+    def run_load_store(self, nxt, varname, temp, source, target):
+        M = self.M
+        fp = self.fp
+        M[fp + temp] = M[~varname] if varname < 0 else M[fp + varname]
+        _value = M[~source] if source < 0 else M[fp + source]
+        if target < 0:
+            M[~target] = _value
+        else:
+            M[fp + target] = _value
+        self.steps += 1
+        self.pc = nxt
+
+    def run_store_jump(self, nxt, source, target, jump_target):
+        self._store_value(target, self._get_value(source))
+        self.steps += 1
+        self.pc = jump_target
+
     #
     # perform binary, relational & cast operations
     #
     def run_add_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] + M[self.vars[right]]
+        M = self.M
+        fp = self.fp
+        M[fp + target] = M[fp + left] + M[fp + right]
 
     def run_sub_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] - M[self.vars[right]]
+        M = self.M
+        fp = self.fp
+        M[fp + target] = M[fp + left] - M[fp + right]
 
     def run_mul_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] * M[self.vars[right]]
+        M = self.M
+        fp = self.fp
+        M[fp + target] = M[fp + left] * M[fp + right]
 
     def run_mod_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] % M[self.vars[right]]
+        M = self.M
+        fp = self.fp
+        M[fp + target] = M[fp + left] % M[fp + right]
 
     def run_div_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] // M[self.vars[right]]
+        M = self.M
+        fp = self.fp
+        M[fp + target] = M[fp + left] // M[fp + right]
 
     def run_div_float(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] / M[self.vars[right]]
+        M = self.M
+        fp = self.fp
+        M[fp + target] = M[fp + left] / M[fp + right]
 
     # Floating point ops (same as int)
     run_add_float = run_add_int
@@ -504,28 +1247,34 @@ class Interpreter(object):
 
     # Integer comparisons
     def run_lt_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] < M[self.vars[right]]
+        M = self.M
+        fp = self.fp
+        M[fp + target] = M[fp + left] < M[fp + right]
 
     def run_le_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] <= M[self.vars[right]]
+        M = self.M
+        fp = self.fp
+        M[fp + target] = M[fp + left] <= M[fp + right]
 
     def run_gt_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] > M[self.vars[right]]
+        M = self.M
+        fp = self.fp
+        M[fp + target] = M[fp + left] > M[fp + right]
 
     def run_ge_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] >= M[self.vars[right]]
+        M = self.M
+        fp = self.fp
+        M[fp + target] = M[fp + left] >= M[fp + right]
 
     def run_eq_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] == M[self.vars[right]]
+        M = self.M
+        fp = self.fp
+        M[fp + target] = M[fp + left] == M[fp + right]
 
     def run_ne_int(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] != M[self.vars[right]]
+        M = self.M
+        fp = self.fp
+        M[fp + target] = M[fp + left] != M[fp + right]
 
     # Float comparisons
     run_lt_float = run_lt_int
@@ -548,21 +1297,20 @@ class Interpreter(object):
     run_ne_bool = run_ne_int
 
     def run_and_bool(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] and M[self.vars[right]]
+        M = self.M
+        fp = self.fp
+        M[fp + target] = M[fp + left] and M[fp + right]
 
     def run_or_bool(self, left, right, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = M[self.vars[left]] or M[self.vars[right]]
+        M = self.M
+        fp = self.fp
+        M[fp + target] = M[fp + left] or M[fp + right]
 
     def run_not_bool(self, source, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = not self._get_value(source)
+        self.M[self.fp + target] = not self._get_value(source)
 
     def run_sitofp(self, source, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = float(self._get_value(source))
+        self.M[self.fp + target] = float(self._get_value(source))
 
     def run_fptosi(self, source, target):
-        self._alloc_reg(target)
-        M[self.vars[target]] = int(self._get_value(source))
+        self.M[self.fp + target] = int(self._get_value(source))
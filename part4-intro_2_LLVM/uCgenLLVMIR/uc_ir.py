@@ -0,0 +1,196 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_ir.py
+#
+# Compact representation of the uC intermediate representation: the instructions
+# as objects with an integer opcode, a type tag, dims/ptr modifiers & operand ids
+#
+# It is read by the Interpreter (and so by the engines built on it) and by the
+# PurityAnalysis. The BlockGenerator & the AnalyzeOptimaze still read the tuples:
+# they edit the instructions in place as [line, tuple] pairs, and the output of
+# -opt depends on how they match the opcode strings, so they are left as they are.
+# ---------------------------------------------------------------------------------
+from enum import IntEnum
+from functools import lru_cache
+
+
+class Opcode(IntEnum):
+    """ The operations of the uCIR, without their types & modifiers. """
+    UNKNOWN = 0
+    LABEL = 1
+    DEFINE = 2
+    GLOBAL = 3
+    ALLOC = 4
+    LOAD = 5
+    STORE = 6
+    LITERAL = 7
+    ELEM = 8
+    GET = 9
+    PARAM = 10
+    CALL = 11
+    RETURN = 12
+    JUMP = 13
+    CBRANCH = 14
+    READ = 15
+    PRINT = 16
+    SITOFP = 17
+    FPTOSI = 18
+    ADD = 19
+    SUB = 20
+    MUL = 21
+    DIV = 22
+    MOD = 23
+    LT = 24
+    LE = 25
+    GT = 26
+    GE = 27
+    EQ = 28
+    NE = 29
+    AND = 30
+    OR = 31
+    NOT = 32
+
+
+# the opcodes as constants of the module (as re does with its flags), since
+# the members of an enum are slower to look up than the globals
+(UNKNOWN, LABEL, DEFINE, GLOBAL, ALLOC, LOAD, STORE, LITERAL, ELEM, GET, PARAM, CALL, RETURN, JUMP,
+ CBRANCH, READ, PRINT, SITOFP, FPTOSI, ADD, SUB, MUL, DIV, MOD, LT, LE, GT, GE, EQ, NE, AND, OR,
+ NOT) = Opcode
+
+
+class Type(IntEnum):
+    """ The type tags of the uCIR instructions. """
+    NONE = 0
+    INT = 1
+    FLOAT = 2
+    CHAR = 3
+    BOOL = 4
+    STRING = 5
+    VOID = 6
+
+
+# the opcodes written without a type, whose modifiers follow the name
+_untyped = {DEFINE, CALL, JUMP, CBRANCH, SITOFP, FPTOSI}
+
+# the operand that is a value, not a temporary, by opcode (e.g. the 1 of
+# ('literal_int', 1, '%2') or the initial values of a global)
+_values = {LITERAL: 0, GLOBAL: 1}
+
+
+class _Ids(dict):
+    # the id of each operand string, parsed once: n for '%n', and the
+    # string itself for the other operands. A compact call has its own,
+    # so the strings of a program are not kept after it is compacted
+    def __missing__(self, arg):
+        _id = int(arg[1:]) if arg[:1] == '%' and arg[1:].isdigit() else arg
+        self[arg] = _id
+        return _id
+
+
+@lru_cache(maxsize=None)
+def parse_opcode(name):
+    """
+    Return (opcode, type, dims, ptr, operation) of the opcode string of
+    an uCIR instruction, where operation is the string without the
+    modifiers: for example, 'load_int_*' is (LOAD, INT, (), 1, 'load_int')
+    and 'alloc_int_3_2' is (ALLOC, INT, (3, 2), 0, 'alloc_int'). Each
+    distinct string is parsed once.
+    """
+    if name.isdigit():
+        return (LABEL, Type.NONE, (), 0, name)
+    _parts = name.split('_')
+    _opcode = Opcode.__members__.get(_parts[0].upper(), UNKNOWN)
+    if _opcode in _untyped:
+        _type = Type.NONE
+        _operation = _parts[0]
+        _modifiers = _parts[1:]
+    else:
+        _type = Type.__members__.get(_parts[1].upper(), Type.NONE) if len(_parts) > 1 else Type.NONE
+        _operation = '_'.join(_parts[:2])
+        _modifiers = _parts[2:]
+    _dims = tuple(int(part) for part in _modifiers if part.isdigit())
+    return (_opcode, _type, _dims, _modifiers.count('*'), _operation)
+
+
+class Instruction(object):
+    """
+    An uCIR instruction, e.g. ('load_int_*', '%3', '%4'), as:
+
+        name:      the opcode string, 'load_int_*'
+        operation: the opcode string without the modifiers, 'load_int'
+        opcode:    LOAD
+        type:      Type.INT
+        dims:      the dims of the array modifiers, ()
+        ptr:       the number of pointer modifiers, 1
+        operands:  the operands, with the temporaries & labels as
+                   their integer ids, (3, 4)
+
+    The globals ('@name'), the values of literals & globals and any
+    operand that is not a numbered temporary are kept as they are, so
+    the tuple of the instruction is rebuilt exactly by to_tuple.
+    """
+
+    __slots__ = ('name', 'operation', 'opcode', 'type', 'dims', 'ptr', 'operands')
+
+    def __init__(self, name, operation, opcode, type, dims, ptr, operands):
+        self.name = name
+        self.operation = operation
+        self.opcode = opcode
+        self.type = type
+        self.dims = dims
+        self.ptr = ptr
+        self.operands = operands
+
+    @classmethod
+    def from_tuple(cls, op, ids=None):
+        """
+        Return the Instruction of an instruction tuple. The ids of the
+        operand strings are taken from ids, that compact shares among
+        the instructions of a program.
+        """
+        if ids is None:
+            ids = _Ids()
+        _opcode, _type, _dims, _ptr, _operation = parse_opcode(op[0])
+        if _opcode == LABEL:
+            return cls(op[0], _operation, _opcode, _type, _dims, _ptr, (int(op[0]),))
+        _value = _values.get(_opcode)
+        if _value is None:
+            _operands = tuple([ids[arg] if type(arg) is str else arg for arg in op[1:]])
+        else:
+            # the value is kept as it is, and not given an id
+            _operands = tuple([arg if i == _value or type(arg) is not str else ids[arg]
+                               for i, arg in enumerate(op[1:])])
+        return cls(op[0], _operation, _opcode, _type, _dims, _ptr, _operands)
+
+    def to_tuple(self):
+        """ Return the instruction tuple of the Instruction. """
+        if self.opcode == LABEL:
+            return (self.name,)
+        _value = _values.get(self.opcode)
+        return (self.name,) + tuple('%' + str(arg) if i != _value and type(arg) is int else arg
+                                    for i, arg in enumerate(self.operands))
+
+    def temps(self):
+        """ Return the ids of the temporaries & labels of the operands. """
+        _value = _values.get(self.opcode)
+        return [arg for i, arg in enumerate(self.operands) if i != _value and type(arg) is int]
+
+    def __repr__(self):
+        return 'Instruction%r' % (self.to_tuple(),)
+
+
+def operand_name(arg):
+    """ Return the name of an operand id, as written in the uCIR. """
+    if type(arg) is int:
+        return '%' + str(arg)
+    return arg
+
+
+def compact(code):
+    """ Return the list of Instructions of a list of instruction tuples. """
+    _ids = _Ids()
+    return [Instruction.from_tuple(op, _ids) for op in code]
+
+
+def expand(ir):
+    """ Return the list of instruction tuples of a list of Instructions. """
+    return [inst.to_tuple() for inst in ir]
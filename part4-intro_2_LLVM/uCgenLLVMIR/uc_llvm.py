@@ -0,0 +1,791 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_llvm.py
+#
+# LLVMGenerator class: walks the CFG of the uC intermediate representation and
+#                      writes it as a textual LLVM IR module (.ll)
+# ---------------------------------------------------------------------------------
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+from uc_analysis import TailCallEliminator
+from uc_block import BlockGenerator
+from uc_cgen import BuildError
+from uc_interpreter import MissingMain
+
+# Runtime of the module: the C library functions it uses, and helpers that
+# print & read the values as the Interpreter does
+RUNTIME = r'''declare i32 @printf(i8*, ...)
+declare i32 @scanf(i8*, ...)
+declare i32 @putchar(i32)
+declare i32 @puts(i8*)
+declare i32 @fputs(i8*, i8*)
+declare i32 @fprintf(i8*, i8*, ...)
+declare i32 @fflush(i8*)
+declare i32 @snprintf(i8*, i64, i8*, ...)
+declare double @strtod(i8*, i8**)
+declare i8* @strchr(i8*, i32)
+declare i32 @atoi(i8*)
+declare void @exit(i32)
+declare void @llvm.memcpy.p0i8.p0i8.i64(i8*, i8*, i64, i1)
+
+@stderr = external global i8*
+
+@.uc.d = private constant [5 x i8] c"%lld\00"
+@.uc.s = private constant [3 x i8] c"%s\00"
+@.uc.ns = private constant [5 x i8] c"%.*s\00"
+@.uc.e = private constant [5 x i8] c"%.*e\00"
+@.uc.f = private constant [5 x i8] c"%.*f\00"
+@.uc.lf = private constant [4 x i8] c"%lf\00"
+@.uc.c = private constant [4 x i8] c" %c\00"
+@.uc.true = private constant [5 x i8] c"True\00"
+@.uc.false = private constant [6 x i8] c"False\00"
+@.uc.eof = private constant [30 x i8] c"Unexpected end of input file.\00"
+@.uc.zerodiv = private constant [55 x i8] c"ZeroDivisionError: integer division or modulo by zero\0A\00"
+@.uc.fzerodiv = private constant [43 x i8] c"ZeroDivisionError: float division by zero\0A\00"
+@.uc.bounds = private constant [63 x i8] c"OutOfBounds: index %lld out of the bounds of an array of %lld\0A\00"
+
+define private void @.uc.fail(i8* %msg) {
+  %flushed = call i32 @fflush(i8* null)
+  %stderr = load i8*, i8** @stderr
+  %written = call i32 @fputs(i8* %msg, i8* %stderr)
+  call void @exit(i32 1)
+  unreachable
+}
+
+define private void @.uc.out_of_bounds(i64 %index, i64 %dim) {
+  %flushed = call i32 @fflush(i8* null)
+  %stderr = load i8*, i8** @stderr
+  %written = call i32 (i8*, i8*, ...) @fprintf(i8* %stderr, i8* getelementptr ([63 x i8], [63 x i8]* @.uc.bounds, i64 0, i64 0), i64 %index, i64 %dim)
+  call void @exit(i32 1)
+  unreachable
+}
+
+define private i64 @.uc.floordiv(i64 %a, i64 %b) {
+entry:
+  %zero = icmp eq i64 %b, 0
+  br i1 %zero, label %fail, label %ok
+fail:
+  call void @.uc.fail(i8* getelementptr ([55 x i8], [55 x i8]* @.uc.zerodiv, i64 0, i64 0))
+  unreachable
+ok:
+  %q = sdiv i64 %a, %b
+  %r = srem i64 %a, %b
+  %nz = icmp ne i64 %r, 0
+  %x = xor i64 %r, %b
+  %neg = icmp slt i64 %x, 0
+  %adjust = and i1 %nz, %neg
+  %d = zext i1 %adjust to i64
+  %res = sub i64 %q, %d
+  ret i64 %res
+}
+
+define private i64 @.uc.floormod(i64 %a, i64 %b) {
+entry:
+  %zero = icmp eq i64 %b, 0
+  br i1 %zero, label %fail, label %ok
+fail:
+  call void @.uc.fail(i8* getelementptr ([55 x i8], [55 x i8]* @.uc.zerodiv, i64 0, i64 0))
+  unreachable
+ok:
+  %r = srem i64 %a, %b
+  %nz = icmp ne i64 %r, 0
+  %x = xor i64 %r, %b
+  %neg = icmp slt i64 %x, 0
+  %adjust = and i1 %nz, %neg
+  %rb = add i64 %r, %b
+  %res = select i1 %adjust, i64 %rb, i64 %r
+  ret i64 %res
+}
+
+define private double @.uc.fdiv(double %a, double %b) {
+entry:
+  %zero = fcmp oeq double %b, 0.0
+  br i1 %zero, label %fail, label %ok
+fail:
+  call void @.uc.fail(i8* getelementptr ([43 x i8], [43 x i8]* @.uc.fzerodiv, i64 0, i64 0))
+  unreachable
+ok:
+  %res = fdiv double %a, %b
+  ret double %res
+}
+
+; the shortest repr that round-trips, as Python prints a float
+define private void @.uc.print_float(double %x) {
+entry:
+  %buf = alloca [32 x i8]
+  %b = getelementptr [32 x i8], [32 x i8]* %buf, i64 0, i64 0
+  br label %loop
+loop:
+  %p = phi i32 [ 1, %entry ], [ %p1, %next ]
+  %prec = sub i32 %p, 1
+  %size = call i32 (i8*, i64, i8*, ...) @snprintf(i8* %b, i64 32, i8* getelementptr ([5 x i8], [5 x i8]* @.uc.e, i64 0, i64 0), i32 %prec, double %x)
+  %y = call double @strtod(i8* %b, i8** null)
+  %same = fcmp oeq double %y, %x
+  %last = icmp sge i32 %p, 17
+  %stop = or i1 %same, %last
+  br i1 %stop, label %done, label %next
+next:
+  %p1 = add i32 %p, 1
+  br label %loop
+done:
+  %e = call i8* @strchr(i8* %b, i32 101)
+  %special = icmp eq i8* %e, null
+  br i1 %special, label %sci, label %exp
+exp:
+  %ep = getelementptr i8, i8* %e, i64 1
+  %ev = call i32 @atoi(i8* %ep)
+  %small = icmp slt i32 %ev, -4
+  %big = icmp sge i32 %ev, 16
+  %far = or i1 %small, %big
+  br i1 %far, label %sci, label %fixed
+sci:
+  %sci.n = call i32 (i8*, ...) @printf(i8* getelementptr ([3 x i8], [3 x i8]* @.uc.s, i64 0, i64 0), i8* %b)
+  ret void
+fixed:
+  %d = sub i32 %prec, %ev
+  %one = icmp slt i32 %d, 1
+  %digits = select i1 %one, i32 1, i32 %d
+  %fixed.n = call i32 (i8*, ...) @printf(i8* getelementptr ([5 x i8], [5 x i8]* @.uc.f, i64 0, i64 0), i32 %digits, double %x)
+  ret void
+}
+
+define private void @.uc.unexpected_eof() {
+  %written = call i32 @puts(i8* getelementptr ([30 x i8], [30 x i8]* @.uc.eof, i64 0, i64 0))
+  call void @exit(i32 1)
+  unreachable
+}
+
+define private i64 @.uc.read_int() {
+entry:
+  %v = alloca i64
+  %n = call i32 (i8*, ...) @scanf(i8* getelementptr ([5 x i8], [5 x i8]* @.uc.d, i64 0, i64 0), i64* %v)
+  %ok = icmp eq i32 %n, 1
+  br i1 %ok, label %done, label %eof
+eof:
+  call void @.uc.unexpected_eof()
+  unreachable
+done:
+  %r = load i64, i64* %v
+  ret i64 %r
+}
+
+define private double @.uc.read_float() {
+entry:
+  %v = alloca double
+  %n = call i32 (i8*, ...) @scanf(i8* getelementptr ([4 x i8], [4 x i8]* @.uc.lf, i64 0, i64 0), double* %v)
+  %ok = icmp eq i32 %n, 1
+  br i1 %ok, label %done, label %eof
+eof:
+  call void @.uc.unexpected_eof()
+  unreachable
+done:
+  %r = load double, double* %v
+  ret double %r
+}
+
+define private i8 @.uc.read_char() {
+entry:
+  %v = alloca i8
+  %n = call i32 (i8*, ...) @scanf(i8* getelementptr ([4 x i8], [4 x i8]* @.uc.c, i64 0, i64 0), i8* %v)
+  %ok = icmp eq i32 %n, 1
+  br i1 %ok, label %done, label %eof
+eof:
+  call void @.uc.unexpected_eof()
+  unreachable
+done:
+  %r = load i8, i8* %v
+  ret i8 %r
+}
+'''
+
+
+class LLVMGenerator(object):
+    """
+    Generates a textual LLVM IR module from the uC intermediate code,
+    walking the CFG built by BlockGenerator.get_blocks: each basic block
+    becomes an LLVM block, named by its label. As clang does without
+    optimizations, each var & temporary gets an alloca in the entry
+    block, and the instructions load their operands from & store their
+    result to them (mem2reg turns them back into registers):
+
+         ('add_int', '%3', '%4', '%5')    ->  %t1 = load i64, i64* %v3
+                                              %t2 = load i64, i64* %v4
+                                              %t3 = add i64 %t1, %t2
+                                              store i64 %t3, i64* %v5
+
+    The types of the vars come from the instructions that use them, and
+    the globals are typed LLVM globals. The ints are i64, as the long
+    longs of the CTranslator, and the elements are checked against the
+    size of their array, as in the Interpreter (the arrays got by a
+    pointer have no known size, so they are not checked). The output &
+    input are done by printf/scanf, so the module needs no library but
+    the C one. The program can be run by lli, or compiled by clang, if
+    installed.
+    """
+
+    types = {
+        'int': 'i64',
+        'float': 'double',
+        'char': 'i8',
+        'bool': 'i1',
+        'string': 'i8',
+        'void': 'void',
+    }
+    sizes = {
+        'i64': 8,
+        'i32': 4,
+        'double': 8,
+        'i8': 1,
+        'i1': 1,
+    }
+    int_ops = {
+        'add': 'add',
+        'sub': 'sub',
+        'mul': 'mul',
+        'lt': 'icmp slt',
+        'le': 'icmp sle',
+        'gt': 'icmp sgt',
+        'ge': 'icmp sge',
+        'eq': 'icmp eq',
+        'ne': 'icmp ne',
+        'and': 'and',
+        'or': 'or',
+    }
+    float_ops = {
+        'add': 'fadd',
+        'sub': 'fsub',
+        'mul': 'fmul',
+        'mod': 'frem',
+        'lt': 'fcmp olt',
+        'le': 'fcmp ole',
+        'gt': 'fcmp ogt',
+        'ge': 'fcmp oge',
+        'eq': 'fcmp oeq',
+        'ne': 'fcmp one',
+    }
+    escapes = {'n': '\n', 't': '\t', '0': '\0', '\\': '\\', "'": "'", '"': '"'}
+
+    def generate(self, code):
+        """
+        Generate the LLVM module of the intermediate code, and return
+        it as a string.
+        """
+        self.code = code
+        self.globals = {}
+        self.functions = {}
+        self.strings = {}
+        _cfg = BlockGenerator(code).get_blocks(printf=False)
+
+        _module = ['; ModuleID = \'uc\'', '']
+        _module += [self._global(inst) for _, inst in _cfg[0].instructions]
+
+        # the signatures first, as a function may call the ones after it:
+        # the result type comes from its returns, and the parameters are
+        # the first temporaries, as many as the params of its calls
+        _functions = [self._instructions(block) for block in _cfg[1:]]
+        for _code in _functions:
+            _returns = [op[0][7:] for op in _code if op[0].startswith('return_')]
+            _result = self.types.get(_returns[0], 'i64') if _returns else 'void'
+            self.functions[_code[0][1]] = ('i32' if _code[0][1] == '@main' else _result, [], {})
+        _nparams = self._count_params(code)
+        for _code in _functions:
+            _name = _code[0][1]
+            _types = self._infer_types(_code)
+            _params = [_types.get('%%%d' % i, 'i64') for i in range(_nparams.get(_name, 0))]
+            self.functions[_name] = (self.functions[_name][0], _params, _types)
+
+        for block in _cfg[1:]:
+            _module += [''] + self._function(block)
+        _module += ['', RUNTIME]
+        return '\n'.join(_module)
+
+    def run(self, code):
+        """
+        Run intermediate code as LLVM: generate the module and run it
+        with lli, or build it with clang and run the binary. Exits with
+        the status of the program, or raises BuildError if clang fails
+        (and MissingMain if there is no main, as in the Interpreter).
+        The self tail calls are rewritten into loops first, as in the
+        PythonTranslator, since lli doesn't promise to reuse the frames.
+        """
+        _lli = shutil.which('lli')
+        _clang = shutil.which('clang')
+        if not _lli and not _clang:
+            print("Error: running the LLVM IR needs lli or clang.", file=sys.stderr)
+            sys.exit(1)
+        _module = self.generate(TailCallEliminator(code).rewrite())
+        if '@main' not in self.functions:
+            raise MissingMain("the program has no main function")
+        _dir = tempfile.mkdtemp(prefix='uc-')
+        try:
+            _path = os.path.join(_dir, 'program.ll')
+            with open(_path, 'w') as file:
+                file.write(_module)
+            sys.stdout.flush()
+            if _lli:
+                _status = subprocess.call([_lli, '-O2', _path])
+            else:
+                _binary = os.path.join(_dir, 'program')
+                try:
+                    subprocess.run([_clang, '-O2', '-w', '-o', _binary, _path], check=True)
+                except subprocess.CalledProcessError as e:
+                    raise BuildError("%s failed with status %d on the LLVM IR" % (_clang, e.returncode))
+                except OSError as e:
+                    raise BuildError("can't run %s: %s" % (_clang, e))
+                _status = subprocess.call([_binary])
+        finally:
+            shutil.rmtree(_dir, ignore_errors=True)
+        sys.exit(_status if _status >= 0 else 128 - _status)
+
+    #
+    # Auxiliary methods
+    #
+    def _extract_operation(self, source):
+        # the opcode and the list of modifiers (dims or *) of an operation
+        _parts = source.split('_')
+        if _parts[0] in ('global', 'alloc', 'load', 'store', 'elem', 'get', 'param', 'return',
+                         'literal', 'print', 'read') or len(_parts) > 1 and _parts[1] in self.types:
+            return '_'.join(_parts[:2]), _parts[2:]
+        return source, []
+
+    def _count_params(self, code):
+        # the number of parameters of each function, got from its calls
+        _nparams = {}
+        _count = 0
+        for op in code:
+            if op[0].startswith('param'):
+                _count += 1
+            elif op[0] == 'call':
+                _nparams.setdefault(op[1], _count)
+                _count = 0
+        return _nparams
+
+    def _instructions(self, head):
+        # the instructions of the function that starts at the head block
+        _code = []
+        while head:
+            _code += [inst for _, inst in head.instructions]
+            head = head.next_block
+        return _code
+
+    def _dim(self, modifier):
+        _dim = 1
+        for arg in modifier:
+            _dim *= int(arg)
+        return _dim
+
+    def _char(self, value):
+        # chars are kept with their quotes by the code generator
+        if isinstance(value, str) and len(value) > 2 and value[0] == value[-1] == "'":
+            value = value[1:-1]
+        if isinstance(value, str) and value.startswith('\\') and len(value) > 1:
+            value = self.escapes.get(value[1], value[1])
+        return ord(value[0]) if value else 0
+
+    def _constant(self, ty, value):
+        if value is None:
+            return 'zeroinitializer'
+        elif ty == 'double':
+            # doubles are written in hex, so no digit is lost
+            return '0x%016X' % struct.unpack('<Q', struct.pack('<d', float(value)))[0]
+        elif ty == 'i8' and isinstance(value, str):
+            return str(self._char(value))
+        elif ty == 'i1':
+            return 'true' if value else 'false'
+        return str(int(value))
+
+    def _bytes(self, data):
+        # an LLVM string constant
+        return 'c"%s"' % ''.join(chr(b) if 32 <= b < 127 and b not in (34, 92) else '\\%02X' % b
+                                 for b in data)
+
+    def _global(self, inst):
+        opcode, modifier = self._extract_operation(inst[0])
+        _name = inst[1]
+        _value = inst[2] if len(inst) > 2 else None
+        if opcode == 'global_string':
+            _data = str(_value).encode() + b'\0'
+            self.globals[_name] = ('[%d x i8]' % len(_data), 'i8', len(_data))
+            self.strings[_name] = len(_data) - 1
+            return '%s = private constant [%d x i8] %s' % (_name, len(_data), self._bytes(_data))
+
+        _ty = self.types[opcode[7:]]
+        if not modifier:
+            self.globals[_name] = (_ty, _ty, None)
+            return '%s = global %s %s' % (_name, _ty, self._constant(_ty, _value))
+
+        # arrays are flat, as the elem instructions index them by a single offset
+        _dim = self._dim(modifier)
+        _array = '[%d x %s]' % (_dim, _ty)
+        self.globals[_name] = (_array, _ty, _dim)
+        if _value is None:
+            return '%s = global %s zeroinitializer' % (_name, _array)
+        elif isinstance(_value, str):
+            _data = _value.encode()[:_dim]
+            self.strings[_name] = len(_data)
+            return '%s = global %s %s' % (_name, _array, self._bytes(_data + bytes(_dim - len(_data))))
+        _flat = [item for sublist in _value for item in sublist] \
+            if any(isinstance(item, list) for item in _value) else list(_value)
+        _flat += [0] * (_dim - len(_flat))
+        _items = ', '.join('%s %s' % (_ty, self._constant(_ty, v)) for v in _flat[:_dim])
+        return '%s = global %s [%s]' % (_name, _array, _items)
+
+    def _infer_types(self, code):
+        # The LLVM type of each var of a function: the instruction that
+        # defines a var gives its type, and if it has none (e.g. it is a
+        # parameter) the first instruction that uses it does.
+        _types = {}
+        _uses = {}
+        for op in code[1:]:
+            if op[0].isdigit():
+                continue
+            opcode, modifier = self._extract_operation(op[0])
+            _kind, _, _type = opcode.partition('_')
+            _ty = self.types.get(_type, 'i64')
+            if _kind == 'alloc':
+                if modifier == ['*']:
+                    _types[op[1]] = _ty + '*'
+                elif modifier:
+                    _types[op[1]] = '[%d x %s]' % (self._dim(modifier), _ty)
+                else:
+                    _types[op[1]] = _ty
+            elif _kind == 'load' and modifier and modifier != ['*']:
+                _types.setdefault(op[2], '[%d x %s]' % (self._dim(modifier), _ty))
+            elif _kind in ('literal', 'elem', 'get', 'load'):
+                _types.setdefault(op[-1], _ty + '*' if _kind in ('elem', 'get') else _ty)
+                if _kind == 'load' and modifier == ['*']:
+                    _uses.setdefault(op[1], _ty + '*')
+                elif _kind == 'load' and not modifier:
+                    _uses.setdefault(op[1], _ty)
+                elif _kind == 'elem':
+                    _uses.setdefault(op[2], 'i64')
+            elif _kind == 'store' and not modifier:
+                _uses.setdefault(op[1], _ty)
+                _uses.setdefault(op[2], _ty)
+            elif _kind == 'store' and modifier == ['*']:
+                _uses.setdefault(op[1], _ty)
+                _uses.setdefault(op[2], _ty + '*')
+            elif _kind in ('add', 'sub', 'mul', 'div', 'mod', 'lt', 'le', 'gt', 'ge', 'eq', 'ne', 'and', 'or'):
+                _uses.setdefault(op[1], _ty)
+                _uses.setdefault(op[2], _ty)
+                _types[op[3]] = _ty if _kind in ('add', 'sub', 'mul', 'div', 'mod') else 'i1'
+            elif _kind == 'not':
+                _uses.setdefault(op[1], _ty)
+                _types[op[2]] = 'i1'
+            elif opcode == 'sitofp':
+                _uses.setdefault(op[1], 'i64')
+                _types[op[2]] = 'double'
+            elif opcode == 'fptosi':
+                _uses.setdefault(op[1], 'double')
+                _types[op[2]] = 'i64'
+            elif _kind == 'read':
+                _types[op[1]] = _ty
+            elif _kind in ('param', 'print', 'return') and len(op) > 1:
+                _uses.setdefault(op[1], _ty)
+            elif opcode == 'cbranch':
+                _uses.setdefault(op[1], 'i1')
+            elif opcode == 'call' and op[1] in self.functions:
+                _types[op[2]] = self.functions[op[1]][0]
+        for var, ty in _uses.items():
+            _types.setdefault(var, ty)
+        return {var: ty for var, ty in _types.items() if var.startswith('%') and ty != 'void'}
+
+    def _pointer(self, var):
+        # the type and the pointer of the memory of a var
+        if var.startswith('@'):
+            return self.globals[var][0], var
+        return self._types.get(var, 'i64'), '%v' + var[1:]
+
+    def _temp(self):
+        self._count += 1
+        return '%%t%d' % self._count
+
+    def _load(self, var):
+        # load the value of a var into a new temporary
+        _ty, _ptr = self._pointer(var)
+        _tmp = self._temp()
+        self._lines.append('  %s = load %s, %s* %s' % (_tmp, _ty, _ty, _ptr))
+        return _ty, _tmp
+
+    def _store(self, var, ty, value):
+        _ty, _ptr = self._pointer(var)
+        if _ty != ty:
+            value = self._convert(ty, _ty, value)
+        self._lines.append('  store %s %s, %s* %s' % (_ty, value, _ty, _ptr))
+
+    def _convert(self, src, dst, value):
+        # convert a value between the scalar types, as needed
+        if src == dst:
+            return value
+        _tmp = self._temp()
+        if dst == 'i1':
+            _zero = '0.0' if src == 'double' else '0'
+            _cmp = 'fcmp one' if src == 'double' else 'icmp ne'
+            self._lines.append('  %s = %s %s %s, %s' % (_tmp, _cmp, src, value, _zero))
+        elif src == 'double':
+            self._lines.append('  %s = fptosi double %s to %s' % (_tmp, value, dst))
+        elif dst == 'double':
+            self._lines.append('  %s = sitofp %s %s to double' % (_tmp, src, value))
+        elif dst.endswith('*') or src.endswith('*'):
+            self._lines.append('  %s = bitcast %s %s to %s' % (_tmp, src, value, dst))
+        elif self.sizes.get(src, 4) < self.sizes.get(dst, 4) or src == 'i1':
+            self._lines.append('  %s = %s %s %s to %s' % (_tmp, 'zext' if src in ('i1', 'i8') else 'sext',
+                                                          src, value, dst))
+        else:
+            self._lines.append('  %s = trunc %s %s to %s' % (_tmp, src, value, dst))
+        return _tmp
+
+    def _value(self, var, ty):
+        # the value of a var, as the type ty
+        _ty, _value = self._load(var)
+        return self._convert(_ty, ty, _value)
+
+    def _element(self, var):
+        # the pointer to the first element of an array (or of a pointer)
+        _ty, _ptr = self._pointer(var)
+        _tmp = self._temp()
+        if _ty.endswith('*'):
+            self._lines.append('  %s = load %s, %s* %s' % (_tmp, _ty, _ty, _ptr))
+            return _ty[:-1], _tmp
+        elif _ty.startswith('['):
+            _elem = _ty[_ty.index('x') + 2:-1]
+            self._lines.append('  %s = getelementptr %s, %s* %s, i32 0, i32 0' % (_tmp, _ty, _ty, _ptr))
+            return _elem, _tmp
+        self._lines.append('  %s = bitcast %s* %s to %s*' % (_tmp, _ty, _ptr, _ty))
+        return _ty, _tmp
+
+    def _check_index(self, var, index):
+        # branch to the failure if the index is out of the bounds of the
+        # array (negative indexes are big unsigned ones), and go on in a
+        # new block if not
+        _ty, _ = self._pointer(var)
+        if not _ty.startswith('['):
+            return
+        _dim = int(_ty[1:_ty.index(' ')])
+        _test = self._temp()
+        _fail, _ok = 'bounds%s' % _test[2:], 'inbounds%s' % _test[2:]
+        self._lines += ['  %s = icmp ult i64 %s, %d' % (_test, index, _dim),
+                        '  br i1 %s, label %%%s, label %%%s' % (_test, _ok, _fail),
+                        _fail + ':',
+                        '  call void @.uc.out_of_bounds(i64 %s, i64 %d)' % (index, _dim),
+                        '  unreachable',
+                        _ok + ':']
+
+    def _copy(self, dim, ty, source, target):
+        # copy dim elements of an array (or string constant) to another
+        _size = dim * self.sizes.get(ty, 4)
+        if source in self.strings:
+            _size = min(_size, self.strings[source])
+        _ptrs = []
+        for var in (target, source):
+            _elem, _ptr = self._element(var)
+            _tmp = self._temp()
+            self._lines.append('  %s = bitcast %s* %s to i8*' % (_tmp, _elem, _ptr))
+            _ptrs.append(_tmp)
+        self._lines.append('  call void @llvm.memcpy.p0i8.p0i8.i64(i8* %s, i8* %s, i64 %d, i1 false)'
+                           % (_ptrs[0], _ptrs[1], _size))
+
+    def _function(self, head):
+        # walk the blocks of a function, naming each one by its label (the
+        # last one wins when a label is repeated, as in the Interpreter)
+        _code = self._instructions(head)
+        _name = _code[0][1]
+        _result, _params, self._types = self.functions[_name]
+        self._main = _name == '@main'
+        self._result = _result
+        self._count = 0
+        self._labels = {}
+        _names = {}
+        _block = head
+        while _block:
+            _first = _block.instructions[0][1]
+            if _block is head:
+                _names[id(_block)] = 'entry'
+            else:
+                _label = 'L' + _first[0]
+                while _label in _names.values():
+                    _label += '.'
+                _names[id(_block)] = _label
+                self._labels['%' + _first[0]] = _label
+            _block = _block.next_block
+
+        self._lines = ['define %s %s(%s) {' % (_result, _name, ', '.join(
+            '%s %%a%d' % (ty, i) for i, ty in enumerate(_params))), 'entry:']
+        for var, ty in sorted(self._types.items(), key=lambda item: int(item[0][1:])
+                              if item[0][1:].isdigit() else 0):
+            self._lines.append('  %%v%s = alloca %s' % (var[1:], ty))
+        # the frame starts with 0s, as in Interpreter._push, so a jump to
+        # the return (e.g. from a failed assert) returns 0, even when the
+        # optimizer dropped the return register
+        for var, ty in sorted(self._types.items()):
+            if not var[1:].isdigit() or int(var[1:]) >= len(_params):
+                _zero = 'null' if ty.endswith('*') else 'zeroinitializer'
+                self._lines.append('  store %s %s, %s* %%v%s' % (ty, _zero, ty, var[1:]))
+        for i, ty in enumerate(_params):
+            self._lines.append('  store %s %%a%d, %s* %%v%d' % (ty, i, ty, i))
+
+        _block = head
+        while _block:
+            if _block is not head:
+                self._lines.append(_names[id(_block)] + ':')
+            self._params = []
+            _done = False
+            for _, inst in _block.instructions:
+                if inst[0].isdigit() or inst[0] == 'define':
+                    continue
+                if self._instruction(inst):
+                    # the instructions after a branch are never executed
+                    _done = True
+                    break
+            if not _done:
+                if _block.next_block:
+                    self._lines.append('  br label %%%s' % _names[id(_block.next_block)])
+                elif self._main:
+                    # main ran past its end: stop without the return newline
+                    self._lines.append('  ret i32 0')
+                elif _result == 'void':
+                    self._lines.append('  ret void')
+                else:
+                    self._lines.append('  ret %s %s' % (_result, '0.0' if _result == 'double' else '0'))
+            _block = _block.next_block
+        self._lines.append('}')
+        return self._lines
+
+    def _instruction(self, op):
+        # translate an instruction, and tell if it ends the block
+        opcode, modifier = self._extract_operation(op[0])
+        _kind, _, _type = opcode.partition('_')
+        _ty = self.types.get(_type, 'i64')
+        _lines = self._lines
+
+        if _type and _type not in self.types or any(not arg.isdigit() and arg != '*' for arg in modifier):
+            _lines.append('  ; unsupported instruction %s' % (op,))
+        elif _kind == 'alloc':
+            # vars start with 0, as in the Interpreter
+            _vty, _ptr = self._pointer(op[1])
+            _zero = 'null' if _vty.endswith('*') else 'zeroinitializer'
+            _lines.append('  store %s %s, %s* %s' % (_vty, _zero, _vty, _ptr))
+        elif _kind == 'literal':
+            _value = self._char(op[1]) if _ty == 'i8' else op[1]
+            self._store(op[2], _ty, self._constant(_ty, _value))
+        elif _kind in ('load', 'store') and modifier and modifier != ['*']:
+            _source, _target = (op[1], op[2])
+            self._copy(self._dim(modifier), _ty, _source, _target)
+        elif _kind == 'load' and modifier:
+            _, _ptr = self._load(op[1])
+            _tmp = self._temp()
+            _lines.append('  %s = load %s, %s* %s' % (_tmp, _ty, _ty, _ptr))
+            self._store(op[2], _ty, _tmp)
+        elif _kind == 'store' and modifier:
+            _value = self._value(op[1], _ty)
+            _, _ptr = self._load(op[2])
+            _lines.append('  store %s %s, %s* %s' % (_ty, _value, _ty, _ptr))
+        elif _kind in ('load', 'store'):
+            self._store(op[2], _ty, self._value(op[1], _ty))
+        elif _kind == 'elem':
+            _elem, _base = self._element(op[1])
+            _index = self._value(op[2], 'i64')
+            self._check_index(op[1], _index)
+            _tmp = self._temp()
+            _lines.append('  %s = getelementptr %s, %s* %s, i64 %s' % (_tmp, _elem, _elem, _base, _index))
+            self._store(op[3], _elem + '*', _tmp)
+        elif _kind == 'get':
+            _vty, _ptr = self._pointer(op[1])
+            self._store(op[2], _vty + '*', _ptr)
+        elif _kind in ('div', 'mod') and _ty != 'double':
+            _left, _right = self._value(op[1], _ty), self._value(op[2], _ty)
+            _tmp = self._temp()
+            _lines.append('  %s = call i64 @.uc.floor%s(i64 %s, i64 %s)' % (_tmp, _kind, _left, _right))
+            self._store(op[3], 'i64', _tmp)
+        elif _kind == 'div':
+            _left, _right = self._value(op[1], _ty), self._value(op[2], _ty)
+            _tmp = self._temp()
+            _lines.append('  %s = call double @.uc.fdiv(double %s, double %s)' % (_tmp, _left, _right))
+            self._store(op[3], 'double', _tmp)
+        elif _kind in self.int_ops:
+            _ops = self.float_ops if _ty == 'double' else self.int_ops
+            _left, _right = self._value(op[1], _ty), self._value(op[2], _ty)
+            _tmp = self._temp()
+            _lines.append('  %s = %s %s %s, %s' % (_tmp, _ops[_kind], _ty, _left, _right))
+            self._store(op[3], _ty if _kind in ('add', 'sub', 'mul') else 'i1', _tmp)
+        elif _kind == 'not':
+            _value = self._value(op[1], 'i1')
+            _tmp = self._temp()
+            _lines.append('  %s = xor i1 %s, true' % (_tmp, _value))
+            self._store(op[2], 'i1', _tmp)
+        elif opcode == 'sitofp':
+            self._store(op[2], 'double', self._value(op[1], 'double'))
+        elif opcode == 'fptosi':
+            self._store(op[2], 'i64', self._value(op[1], 'i64'))
+        elif _kind == 'param':
+            self._params.append(op[1])
+        elif opcode == 'call':
+            if op[1] not in self.functions:
+                _lines.append('  call void @exit(i32 1)  ; undefined function %s' % op[1])
+                _lines.append('  unreachable')
+                return True
+            _result, _params, _ = self.functions[op[1]]
+            _args = ', '.join('%s %s' % (ty, self._value(var, ty)) for ty, var in zip(_params, self._params))
+            self._params = []
+            if _result == 'void':
+                _lines.append('  call void %s(%s)' % (op[1], _args))
+            else:
+                _tmp = self._temp()
+                _lines.append('  %s = call %s %s(%s)' % (_tmp, _result, op[1], _args))
+                self._store(op[2], _result, _tmp)
+        elif _kind == 'return':
+            _value = self._value(op[1], self._result) if _type != 'void' else None
+            if self._main:
+                # as in the Interpreter, main prints a newline when it returns
+                _lines.append('  %s = call i32 @putchar(i32 10)' % self._temp())
+                _lines.append('  ret i32 %s' % (_value or '0'))
+            elif self._result == 'void':
+                _lines.append('  ret void')
+            else:
+                _lines.append('  ret %s %s' % (self._result, _value or 'zeroinitializer'))
+            return True
+        elif _kind == 'print':
+            self._print(_type, op[1])
+        elif _kind == 'read':
+            _tmp = self._temp()
+            _lines.append('  %s = call %s @.uc.read_%s()' % (_tmp, _ty, _type))
+            self._store(op[1], _ty, _tmp)
+        elif opcode == 'jump':
+            _lines.append('  br label %%%s' % self._labels[op[1]])
+            return True
+        elif opcode == 'cbranch':
+            _test = self._value(op[1], 'i1')
+            _lines.append('  br i1 %s, label %%%s, label %%%s' % (_test, self._labels[op[2]],
+                                                                   self._labels[op[3]]))
+            return True
+        else:
+            _lines.append('  ; unsupported instruction %s' % (op,))
+        return False
+
+    def _print(self, type, var):
+        _lines = self._lines
+        _ty, _ = self._pointer(var)
+        _tmp = self._temp()
+        if _ty.startswith('['):
+            # a string or a char array: print its chars, up to a \0
+            _, _ptr = self._element(var)
+            _size = _ty[1:_ty.index(' ')]
+            _lines.append('  %s = call i32 (i8*, ...) @printf(i8* getelementptr ([5 x i8], [5 x i8]* '
+                          '@.uc.ns, i64 0, i64 0), i32 %s, i8* %s)' % (_tmp, _size, _ptr))
+        elif type == 'float':
+            _lines.append('  call void @.uc.print_float(double %s)' % self._value(var, 'double'))
+        elif type == 'bool':
+            _value = self._value(var, 'i1')
+            _lines.append('  %s = select i1 %s, i8* getelementptr ([5 x i8], [5 x i8]* @.uc.true, i64 0, '
+                          'i64 0), i8* getelementptr ([6 x i8], [6 x i8]* @.uc.false, i64 0, i64 0)'
+                          % (_tmp, _value))
+            _lines.append('  %s = call i32 (i8*, ...) @printf(i8* getelementptr ([3 x i8], [3 x i8]* '
+                          '@.uc.s, i64 0, i64 0), i8* %s)' % (self._temp(), _tmp))
+        elif type in ('char', 'string'):
+            _lines.append('  %s = call i32 @putchar(i32 %s)' % (_tmp, self._value(var, 'i32')))
+        else:
+            _lines.append('  %s = call i32 (i8*, ...) @printf(i8* getelementptr ([5 x i8], [5 x i8]* '
+                          '@.uc.d, i64 0, i64 0), i64 %s)' % (_tmp, self._value(var, 'i64')))
@@ -0,0 +1,224 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_profile.py
+#
+# Profiler class: runs the uC intermediate representation as the Interpreter does,
+#                 counting the instructions executed and timing the functions
+# ---------------------------------------------------------------------------------
+import json
+import time
+from uc_interpreter import Interpreter, _Checkpoint
+from uc_block import BlockGenerator
+
+
+class Profiler(Interpreter):
+    """
+    Runs the uC intermediate code exactly as the Interpreter, with an
+    instrumented main loop that counts the executions of each decoded
+    instruction. After the run, the counts are added up by opcode, by
+    function and by basic block (the blocks of BlockGenerator, named
+    as @function:%label, or @function:entry for the first one).
+
+    The calls to each function are counted when its define runs, and
+    timed until its return, so each function gets its inclusive time
+    (with the calls it makes, counted once for recursive calls) and
+    its exclusive time (without them).
+
+    The Interpreter & the other engines don't pay for the profiling,
+    since only this class has the instrumented loop. The instructions
+    are not fused, so each one is counted.
+    """
+
+    fuse = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the profile is empty until the code is loaded, so a run that
+        # fails to load (e.g. its globals don't fit) still reports one
+        self.opcodes = []
+        self.functions = []
+        self.blocks = []
+        self.marks = []
+        self._clear()
+
+    def load(self, ircode):
+        """
+        Load intermediate code as the Interpreter, and map each pc of
+        the decoded program to its opcode, function & basic block.
+        """
+        super().load(ircode)
+        self.opcodes = []       # Opcode of each pc, as written in the uCIR
+        self.functions = []     # Function of each pc
+        self.blocks = []        # Basic block of each pc
+        self.marks = []         # 1 for define, 2 for return & 0 otherwise
+        for block in BlockGenerator(ircode).get_blocks(False)[1:]:
+            _name = block.instructions[0][1][1]
+            while block:
+                _first = block.instructions[0][1][0]
+                if _first.isdigit():
+                    _block = '%s:%%%s' % (_name, _first)
+                else:
+                    _block = _name + ':entry'
+                for _, op in block.instructions:
+                    if op[0].isdigit():
+                        continue
+                    opcode, modifier = self._extract_operation(op[0])
+                    for arg in modifier.values():
+                        opcode += '_*' if arg == '*' else '_N'
+                    self.opcodes.append(opcode)
+                    self.functions.append(_name)
+                    self.blocks.append(_block)
+                    if op[0] == 'define':
+                        self.marks.append(1)
+                    elif op[0].startswith('return'):
+                        self.marks.append(2)
+                    else:
+                        self.marks.append(0)
+                block = block.next_block
+        for pc, (run, _) in enumerate(self.program):
+            # a tail call leaves the caller, before the callee enters
+            if run.__name__.startswith('run_tailcall'):
+                self.marks[pc] = 2
+
+        self._clear()
+
+    def run(self, ircode):
+        """
+        Run intermediate code in the interpreter, counting & timing
+        the instructions.
+        """
+        self.load(ircode)
+
+        program = self.program
+        counts = self.counts
+        marks = self.marks
+        self.pc = self.start
+        _start = time.perf_counter()
+        self._start_limits()
+        try:
+            while True:
+                try:
+                    while True:
+                        pc = self.pc
+                        try:
+                            run, args = program[pc]
+                        except IndexError:
+                            break
+                        self.pc = pc + 1
+                        counts[pc] += 1
+                        if marks[pc] == 1:
+                            self._enter(self.functions[pc])
+                        elif marks[pc] == 2:
+                            self._leave()
+                        run(*args)
+                    break
+                except _Checkpoint:
+                    self._check_limits(self.steps + sum(counts))
+        finally:
+            while self.calling:
+                self._leave()
+            self.elapsed += time.perf_counter() - _start
+            self.steps += sum(counts)
+            self.flush()
+
+    def profile(self):
+        """
+        Return the profile of the run as a dict, with the counts of
+        the opcodes, functions & blocks sorted from the most executed.
+        """
+        _opcodes = {}
+        _functions = {}
+        _blocks = {}
+        _entries = {}
+        for pc, count in enumerate(self.counts):
+            _opcodes[self.opcodes[pc]] = _opcodes.get(self.opcodes[pc], 0) + count
+            _functions[self.functions[pc]] = _functions.get(self.functions[pc], 0) + count
+            _blocks[self.blocks[pc]] = _blocks.get(self.blocks[pc], 0) + count
+            # a block is entered as many times as its first instruction runs
+            _entries.setdefault(self.blocks[pc], count)
+
+        def _sorted(counts):
+            return sorted(counts, key=lambda name: (-counts[name], name))
+
+        return {
+            'instructions': self.steps,
+            'time': self.elapsed,
+            'opcodes': {name: _opcodes[name] for name in _sorted(_opcodes)},
+            'functions': {name: {'calls': self.call_counts.get(name, 0),
+                                 'instructions': _functions[name],
+                                 'inclusive': self.inclusive.get(name, 0.0),
+                                 'exclusive': self.exclusive.get(name, 0.0)}
+                          for name in _sorted(_functions)},
+            'blocks': {name: {'entries': _entries[name], 'instructions': _blocks[name]}
+                       for name in _sorted(_blocks)},
+            'tierups': list(self.tierups),
+        }
+
+    def report(self, limit=20):
+        """
+        Return the profile of the run as a text report, with the limit
+        most executed opcodes & blocks.
+        """
+        _profile = self.profile()
+        _total = max(_profile['instructions'], 1)
+        _lines = ['Profile: %d instructions in %.3fs' % (_profile['instructions'], _profile['time']),
+                  '',
+                  '%12s %7s  %s' % ('count', '%', 'opcode')]
+        for name, count in list(_profile['opcodes'].items())[:limit]:
+            _lines.append('%12d %6.2f%%  %s' % (count, 100.0 * count / _total, name))
+        _lines += ['',
+                   '%8s %12s %12s %12s  %s' % ('calls', 'count', 'inclusive', 'exclusive', 'function')]
+        for name, info in _profile['functions'].items():
+            _lines.append('%8d %12d %11.3fs %11.3fs  %s' % (info['calls'], info['instructions'],
+                                                            info['inclusive'], info['exclusive'], name))
+        _lines += ['',
+                   '%12s %12s  %s' % ('entries', 'count', 'block')]
+        for name, info in list(_profile['blocks'].items())[:limit]:
+            _lines.append('%12d %12d  %s' % (info['entries'], info['instructions'], name))
+        if _profile['tierups']:
+            # the promoted functions run out of the counts from then on
+            _lines += ['', '%12s  %-24s %s' % ('count', 'reason', 'tier-up')]
+            for event in _profile['tierups']:
+                _lines.append('%12d  %-24s %s' % (event['count'], event['reason'], event['function']))
+        return '\n'.join(_lines) + '\n'
+
+    def dump(self, file):
+        """ Write the profile of the run to file, as JSON. """
+        json.dump(self.profile(), file, indent=2)
+        file.write('\n')
+
+    #
+    # Auxiliary methods
+    #
+    def _clear(self):
+        # the counts & times of the loaded program, all 0
+        self.counts = len(self.opcodes) * [0]
+        self.call_counts = {}   # Number of calls of each function
+        self.inclusive = {}     # Inclusive time of each function
+        self.exclusive = {}     # Exclusive time of each function
+        self.active = {}        # Number of running calls of each function
+        self.calling = []       # Stack of [function, start time, time of the callees]
+        self.elapsed = 0.0
+
+    def _counters(self):
+        # the profile goes with the counters of the run
+        _counters = super()._counters()
+        _counters['profile'] = self.profile()
+        return _counters
+
+    def _enter(self, name):
+        self.call_counts[name] = self.call_counts.get(name, 0) + 1
+        self.active[name] = self.active.get(name, 0) + 1
+        self.calling.append([name, time.perf_counter(), 0.0])
+
+    def _leave(self):
+        if not self.calling:
+            return
+        name, start, callees = self.calling.pop()
+        _elapsed = time.perf_counter() - start
+        self.exclusive[name] = self.exclusive.get(name, 0.0) + _elapsed - callees
+        self.active[name] -= 1
+        if not self.active[name]:
+            # a recursive call is already in the time of the outer call
+            self.inclusive[name] = self.inclusive.get(name, 0.0) + _elapsed
+        if self.calling:
+            self.calling[-1][2] += _elapsed
@@ -0,0 +1,193 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_tiered.py
+#
+# TieredInterpreter class: runs the uC intermediate representation in the Interpreter,
+#                          and promotes the hot functions to translated Python code
+# ---------------------------------------------------------------------------------
+from uc_analysis import TailCallEliminator
+from uc_interpreter import Interpreter
+from uc_translate import PythonTranslator, _End
+from uc_profile import Profiler
+
+
+class TieredInterpreter(PythonTranslator):
+    """
+    Runs the uC intermediate code in the Interpreter (the first tier),
+    counting the calls (tail calls too) & the backward branches of each
+    function. When the count of a function reaches threshold (1000 by
+    default, or -tier-threshold=N), the function and the ones it may
+    call are translated as in the PythonTranslator (the second tier).
+    From then on, the calls to the function are Python calls to its
+    translation, and a call still running in the first tier moves to
+    the translation at its next backward branch, by resuming it at the
+    label of the branch (see _resume).
+
+    So short programs never pay for the translation, and long ones run
+    most of their time in the fast tier. Each promotion is recorded in
+    tierups, that is reported with the counters and by the Profiler.
+
+    The translated code doesn't count its instructions, so a run with
+    limits on the instructions or the time stays in the first tier.
+    """
+
+    def __init__(self, *args, threshold=1000, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threshold = threshold
+        self.heat = {}          # Count of the calls & backward branches of each function
+        self.tiers = {}         # Translation of each promoted function
+        self.namespace = None   # Globals of the translated code
+        self.codes = {}         # Intermediate code of each function
+        self.resumes = {}       # Label of the pc of each label, to resume a call
+
+    def run(self, ircode):
+        """
+        Run intermediate code in the Interpreter, that promotes the
+        hot functions to the translated code. The self tail calls are
+        loops in both tiers (see PythonTranslator).
+        """
+        with self._recursion_limit():
+            Interpreter.run(self, TailCallEliminator(ircode).rewrite())
+
+    def check_options(self):
+        """
+        The Interpreter runs with the limits & the cache, and no function
+        is promoted when there are limits (see _decode_checkpoints).
+        """
+        Interpreter.check_options(self)
+
+    #
+    # Auxiliary methods
+    #
+    def _counters(self):
+        _counters = Interpreter._counters(self)
+        _counters['tierups'] = list(self.tierups)
+        return _counters
+
+    def _decode_checkpoints(self):
+        # replace the calls & the backward branches of each function by
+        # handlers that count them, unless the run has limits
+        if self.max_instructions is not None or self.max_time is not None:
+            return super()._decode_checkpoints()
+        self.namespace = self._namespace()
+        self.nparams = self._count_params(self.code)
+        _defines = [pc for pc, op in enumerate(self.code) if op[0] == 'define']
+        for begin, end in zip(_defines, _defines[1:] + [len(self.code)]):
+            self.codes[self.code[begin][1]] = self.code[begin:end]
+        _names = {~self.globals[name]: name for name in self.frames}
+        _entries = sorted((self.M[self.globals[name]], name) for name in self.frames)
+        _ends = [pc for pc, _ in _entries[1:]] + [len(self.program)]
+        for (begin, name), end in zip(_entries, _ends):
+            self.heat[name] = 0
+            for label, pc in self.labels[name].items():
+                self.resumes[pc] = label
+            for pc in range(begin, end):
+                run, args = self.program[pc]
+                if run == self.run_call and args[0] in _names:
+                    self.program[pc] = (self.run_call_tiered, args + (_names[args[0]],))
+                elif run == self.run_tailcall and args[0] in _names:
+                    self.program[pc] = (self.run_tailcall_tiered, args + (_names[args[0]],))
+                elif run == self.run_jump and args[0] is not None and args[0] <= pc:
+                    self.program[pc] = (self.run_jump_tiered, args + (name,))
+                elif run == self.run_cbranch and any(arg is not None and arg <= pc for arg in args[1:]):
+                    self.program[pc] = (self.run_cbranch_tiered, args + (name,))
+
+    def _tier_up(self, name, reason):
+        # translate & compile the function and the functions it may call,
+        # if they were not promoted yet, and return its translation
+        _pending = [name]
+        while _pending:
+            _name = _pending.pop()
+            if _name in self.tiers or _name not in self.codes:
+                continue
+            _code = self.codes[_name]
+            _nparams = self.nparams.get(_name, 0)
+            _source = (self._translate_function(_code, _nparams) +
+                       self._translate_function(_code, _nparams, resume=True))
+            exec(compile('\n'.join(_source) + '\n', '<uCIR %s>' % _name, 'exec'), self.namespace)
+            self.tiers[_name] = self.namespace['f_' + _name[1:]]
+            self.tierups.append({'function': _name,
+                                 'reason': reason if _name == name else 'called by ' + name,
+                                 'count': self.heat[_name]})
+            _pending += [op[1] for op in _code if op[0] == 'call']
+        return self.tiers[name]
+
+    def _resume(self, name, pc):
+        # move the running call of the function to its translation, from
+        # the label at pc, and return from it as its return would do
+        if name not in self.tiers:
+            self._tier_up(name, 'loops')
+        self._return(self.namespace['r_' + name[1:]](self.fp, self.resumes[pc]))
+
+    def _return(self, value):
+        # return the value of the running call, got from a translation,
+        # as its return would do
+        if value is _End:
+            # the function ran past its last instruction
+            self.pc = len(self.program)
+        elif self.calls:
+            self._memo_return(value)
+            self.M[self.fp] = value
+            self._pop(self.fp)
+        else:
+            self._exit(0 if value is None else value)
+
+    #
+    # Calls & backward branches, that count the heat of the functions
+    #
+    def run_call_tiered(self, source, target, name):
+        _function = self.tiers.get(name)
+        if _function is None:
+            self.heat[name] += 1
+            if self.heat[name] < self.threshold:
+                self.run_call(source, target)
+                return
+            _function = self._tier_up(name, 'calls')
+        _params = self.params
+        self.params = []
+        self.M[self.fp + target] = _function(self.offset, *_params)
+
+    def run_tailcall_tiered(self, source, target, name):
+        _function = self.tiers.get(name)
+        if _function is None:
+            self.heat[name] += 1
+            if self.heat[name] < self.threshold:
+                self.run_tailcall(source, target)
+                return
+            _function = self._tier_up(name, 'calls')
+        # the frame of the caller is not used anymore, so the callee runs
+        # in its place, and its value is the value of the caller
+        _params = self.params
+        self.params = []
+        self._return(_function(self.fp, *_params))
+
+    def run_jump_tiered(self, target, name):
+        self.pc = target
+        self.heat[name] += 1
+        if self.heat[name] >= self.threshold:
+            self._resume(name, target)
+
+    def run_cbranch_tiered(self, expr_test, true_target, false_target, name):
+        if self.M[self.fp + expr_test]:
+            self.pc = true_target
+        else:
+            self.pc = false_target
+        self.heat[name] += 1
+        if self.heat[name] >= self.threshold:
+            self._resume(name, self.pc)
+
+
+class TieredProfiler(Profiler, TieredInterpreter):
+    """
+    Profiles the TieredInterpreter: the instructions & calls are counted
+    in the first tier only, and the report lists the promotions.
+    """
+
+    def run(self, ircode):
+        """ Run intermediate code in the Profiler, see the class. """
+        with self._recursion_limit():
+            Profiler.run(self, ircode)
+
+    def _resume(self, name, pc):
+        super()._resume(name, pc)
+        # the call returned from its translation, not from its return
+        self._leave()
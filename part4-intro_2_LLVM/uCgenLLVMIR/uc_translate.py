@@ -0,0 +1,400 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_translate.py
+#
+# PythonTranslator class: translates the uC intermediate representation into
+#                         Python functions, that are compiled & run in-process
+# ---------------------------------------------------------------------------------
+import hashlib
+import sys
+from collections import OrderedDict
+from contextlib import contextmanager
+from uc_analysis import TailCallEliminator
+from uc_interpreter import Interpreter
+from uc_ir import compact, operand_name
+
+# Code objects of the translated programs, by the hash of their uCIR, from
+# the least recently used, up to _cache_size programs
+_cache = OrderedDict()
+_cache_size = 64
+
+
+class _End(object):
+    """ Returned by a function that runs past its last instruction. """
+
+
+class PythonTranslator(Interpreter):
+    """
+    Translates each function of the uC intermediate code into a Python
+    function, which is compiled with compile() and run in-process, so
+    the CPython bytecode loop does the work of the dispatch loop. For
+    example, the function:
+
+         ('define', '@inc'),
+         ('alloc_int', '%2'),
+         ('store_int', '%0', '%2'),
+         ('load_int', '%2', '%3'),
+         ('literal_int', 1, '%4'),
+         ('add_int', '%3', '%4', '%5'),
+         ('return_int', '%5')
+
+    becomes:
+
+         def f_inc(sp, v0):
+             fp = sp
+             top = fp + 6
+             if top > LIMIT:
+                 check_frame(top)
+             v2 = v3 = v4 = v5 = None
+             v1 = 0
+             L = 0
+             while True:
+                 if L == 0:
+                     v2 = 0
+                     v2 = v0
+                     v3 = v2
+                     v4 = 1
+                     v5 = v3 + v4
+                     return v5
+
+    The temporaries become Python locals, and the basic blocks become
+    the branches of a dispatch loop on the number of the block L, that
+    are found by a binary search (see _dispatch). The globals, the
+    arrays and the vars whose address is taken stay in the memory, at
+    the same addresses used by the Interpreter, which also provides the
+    output, input & exit of the program. Calls are Python calls, that
+    get the first free position of the memory (top) to place the frame
+    of the callee.
+
+    A function can also be translated to resume a call that is running
+    in the Interpreter, at one of its labels: r_inc(fp, L) loads the
+    vars of the frame at fp from the memory, and jumps to L.
+
+    Since a Python call can't reuse the frame of its caller, the self
+    tail calls are rewritten into loops by the TailCallEliminator before
+    the code is loaded, as -opt does. The tail calls of other functions
+    (e.g. mutual recursion) are still calls here, so they may fill the
+    stack where the Interpreter runs them in constant memory.
+    """
+
+    binary_ops = {
+        'add': '+',
+        'sub': '-',
+        'mul': '*',
+        'mod': '%',
+        'lt': '<',
+        'le': '<=',
+        'gt': '>',
+        'ge': '>=',
+        'eq': '==',
+        'ne': '!=',
+        'and': 'and',
+        'or': 'or',
+    }
+
+    def run(self, ircode):
+        """
+        Run intermediate code: load it as the Interpreter does, then
+        translate it (or get it from the cache) and call the main
+        function with the first free position of the memory.
+        """
+        self.check_options()
+        ircode = TailCallEliminator(ircode).rewrite()
+        self.load(ircode)
+        _key = hashlib.sha1(repr(ircode).encode()).hexdigest()
+        if _key in _cache:
+            _cache.move_to_end(_key)
+        else:
+            self.source = self.translate(ircode)
+            _cache[_key] = compile(self.source, '<uCIR>', 'exec')
+            if len(_cache) > _cache_size:
+                _cache.popitem(last=False)
+        _namespace = self._namespace()
+        exec(_cache[_key], _namespace)
+
+        try:
+            with self._recursion_limit():
+                _value = _namespace['f_main'](self.offset)
+        finally:
+            self.flush()
+        if _value is not _End:
+            self._exit(_value)
+
+    def check_options(self):
+        """
+        Raise ValueError if the run has limits of instructions or time,
+        or a cache, since the translated code has no checkpoints (only
+        the output is limited) and calls the functions directly.
+        """
+        if self.max_instructions is not None or self.max_time is not None:
+            raise ValueError("the translated code can't limit the instructions or the time")
+        if self.memo_size:
+            raise ValueError("the translated code can't cache the results of the calls")
+
+    def translate(self, ircode):
+        """
+        Translate the loaded intermediate code into Python source code,
+        one Python function for each uC function.
+        """
+        _nparams = self._count_params(ircode)
+        _defines = [pc for pc, op in enumerate(ircode) if op[0] == 'define']
+        _source = []
+        for begin, end in zip(_defines, _defines[1:] + [len(ircode)]):
+            _code = ircode[begin:end]
+            _source += self._translate_function(_code, _nparams.get(_code[0][1], 0))
+        return '\n'.join(_source) + '\n'
+
+    #
+    # Auxiliary methods
+    #
+    def _counters(self):
+        # the translated code runs without counting the instructions
+        return {}
+
+    def _namespace(self):
+        # the globals of the translated code
+        return {
+            'M': self.M,
+            'SIZE': len(self.M),
+            'LIMIT': self.stack_limit,
+            'END': _End,
+            'check_frame': self._check_frame,
+            'check_index': self._check_index,
+            'copy': self._copy_cells,
+            'out': self._print,
+            'read_int': self._read_int,
+            'read_float': self._read_float,
+            'read_char': self._read_char,
+        }
+
+    @contextmanager
+    def _recursion_limit(self):
+        # each uC call is a Python call, and the calls are only limited by
+        # the size of the memory, as in the Interpreter
+        _limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(_limit, len(self.M) + 1000))
+        try:
+            yield
+        finally:
+            sys.setrecursionlimit(_limit)
+
+    def _count_params(self, ircode):
+        # the number of parameters of each function, got from its calls
+        _nparams = {}
+        _count = 0
+        for op in ircode:
+            if op[0].startswith('param'):
+                _count += 1
+            elif op[0] == 'call':
+                _nparams.setdefault(op[1], _count)
+                _count = 0
+        return _nparams
+
+    def _memory_vars(self, code):
+        # vars that must stay in the memory: arrays and vars whose address
+        # is taken by elem, get or by a copy of multiple values.
+        _memory = set()
+        for op in code:
+            if op[0].isdigit():
+                continue
+            opcode, modifier = self._extract_operation(op[0])
+            _dims = modifier and 'ptr0' not in modifier
+            if opcode.startswith(('elem', 'get')):
+                _memory.add(op[1])
+            elif opcode.startswith('alloc') and _dims:
+                _memory.add(op[1])
+            elif opcode.startswith(('load', 'store')) and _dims:
+                _memory.update(op[1:])
+        return {var for var in _memory if var.startswith('%')}
+
+    def _local(self, var):
+        if var[1:].isdigit():
+            return 'v' + var[1:]
+        return 'w%d' % self._slots[var]
+
+    def _value(self, source):
+        if source.startswith('@'):
+            return 'M[%d]' % self.globals[source]
+        elif source in self._memory:
+            return 'M[fp + %d]' % self._slots[source]
+        return self._local(source)
+
+    def _address(self, source):
+        if source.startswith('@'):
+            return '%d' % self.globals[source]
+        return 'fp + %d' % self._slots[source]
+
+    def _set(self, target, expr):
+        if target.startswith('@') or target in self._memory:
+            return '%s = %s' % (self._value(target), expr)
+        return '%s = %s' % (self._local(target), expr)
+
+    def _translate_function(self, code, nparams, resume=False):
+        _name = code[0][1]
+        self._slots, _size = self.frames[_name]
+        self._memory = self._memory_vars(code)
+        self._dims = dict(self.dims)
+        self._dims.update((operand_name(var), dim) for var, dim in self._array_dims(compact(code)).items())
+        self._labels = {'%' + op[0] for op in code if op[0].isdigit()}
+        # the blocks are numbered in the order of the code, from 0 for the
+        # entry, and L holds the number of the block to run
+        self._blocks = {'%' + op[0]: i + 1 for i, op in enumerate(op for op in code if op[0].isdigit())}
+        _params = ['%' + str(i) for i in range(nparams)]
+        _locals = {arg for op in code[1:] if not op[0].isdigit() for arg in op[1:]
+                   if isinstance(arg, str) and arg.startswith('%')}
+        _locals = (_locals | {'%0'}) - self._labels - self._memory - set(_params)
+        _locals = sorted(_locals, key=lambda var: self._slots[var])
+
+        if resume:
+            # the frame is in the memory, with the vars of the running call
+            _lines = ['def r_%s(fp, L):' % _name[1:],
+                      '    top = fp + %d' % max(_size, nparams + 1)]
+            for var in [p for p in _params if p not in self._memory] + _locals:
+                _lines.append('    %s = M[fp + %d]' % (self._local(var), self._slots[var]))
+            # the call resumes at a label, so at the block it starts
+            _lines.append('    L = %r[L]' % {int(label[1:]): block for label, block in self._blocks.items()})
+        else:
+            _lines = ['def f_%s(sp%s):' % (_name[1:], ''.join(', ' + self._local(p) for p in _params)),
+                      '    fp = sp',
+                      '    top = fp + %d' % max(_size, nparams + 1),
+                      '    if top > LIMIT:',
+                      '        check_frame(top)']
+            if _locals:
+                _lines.append('    %s = None' % ' = '.join(self._local(var) for var in _locals))
+            for var in _params:
+                if var in self._memory:
+                    _lines.append('    M[fp + %d] = %s' % (self._slots[var], self._local(var)))
+            if _name != '@main':
+                # the register of the return value is initialized with 0
+                _lines.append('    ' + self._set('%' + str(nparams), '0'))
+            _lines.append('    L = 0')
+        _lines.append('    while True:')
+
+        _bodies = []
+        _body = []
+        _done = False
+        self._params = []
+        for op in code[1:]:
+            if op[0].isdigit():
+                if not _done:
+                    # fall through to the next block
+                    _body.append('L = %d' % (len(_bodies) + 1))
+                _bodies.append(_body or ['pass'])
+                _body = []
+                _done = False
+            elif not _done:
+                _body += self._translate_op(op)
+                _done = op[0] in ('jump', 'cbranch') or op[0].startswith('return')
+        if not _done:
+            _body.append('return END')
+        _bodies.append(_body)
+        _lines += self._dispatch(_bodies, 0, len(_bodies), '        ')
+        _lines.append('')
+        return _lines
+
+    def _dispatch(self, bodies, begin, end, indent):
+        # Dispatch L to the blocks numbered from begin to end by a binary
+        # search, so a jump costs log(number of blocks) tests instead of a
+        # test for each block before it. The blocks stay in the order of
+        # the code, so a block that falls through to the next one (L + 1)
+        # reaches it without going back to the top of the loop.
+        if end - begin <= 4:
+            _lines = []
+            for block in range(begin, end):
+                _lines.append('%sif L == %d:' % (indent, block))
+                _lines += [indent + '    ' + line for line in bodies[block]]
+            return _lines
+        _middle = (begin + end) // 2
+        return (['%sif L < %d:' % (indent, _middle)] +
+                self._dispatch(bodies, begin, _middle, indent + '    ') +
+                self._dispatch(bodies, _middle, end, indent))
+
+    def _translate_op(self, op):
+        opcode, modifier = self._extract_operation(op[0])
+        if not hasattr(self, "run_" + opcode):
+            return ['out(%r)' % ("Warning: No run_" + opcode + "() method\n")]
+        _kind, _, _type = opcode.partition('_')
+        _dim = 1
+        _ref = 0
+        for arg in modifier.values():
+            if arg.isdigit():
+                _dim *= int(arg)
+            elif arg == '*':
+                _ref += 1
+        _dims = modifier and _ref == 0
+
+        if _kind == 'alloc':
+            if _dims:
+                _address = self._address(op[1])
+                return ['M[%s:%s + %d] = %d * [0]' % (_address, _address, _dim, _dim)]
+            return [self._set(op[1], '0')]
+        elif _kind == 'literal':
+            return [self._set(op[2], repr(op[1]))]
+        elif _kind == 'load':
+            if _dims:
+                return ['copy(%d, %s, %s, %s)' % (_dim, self._address(op[2]), self._address(op[1]),
+                                                  op[1].startswith('@'))]
+            elif _ref:
+                return [self._set(op[2], 'M[%s]' % self._value(op[1]))]
+            return [self._set(op[2], self._value(op[1]))]
+        elif _kind == 'store':
+            if _dims:
+                return ['copy(%d, %s, %s, %s)' % (_dim, self._address(op[2]), self._address(op[1]),
+                                                  op[1].startswith('@'))]
+            elif _ref:
+                return ['M[%s] = %s' % (self._value(op[2]), self._value(op[1]))]
+            return [self._set(op[2], self._value(op[1]))]
+        elif _kind == 'elem':
+            # the index is checked against the size of the array, or
+            # against the memory if the size is unknown
+            _address = self._address(op[1])
+            _dim = self._dims.get(op[1], 0)
+            _check = ('0 <= i < %d' % _dim) if _dim else ('0 <= %s + i < SIZE' % _address)
+            return ['i = ' + self._value(op[2]),
+                    'if not %s:' % _check,
+                    '    check_index(%s, i, %d)' % (_address, _dim),
+                    self._set(op[3], '%s + i' % _address)]
+        elif _kind == 'get':
+            if _ref:
+                return [self._set(op[2], self._address(op[1]))]
+            return []
+        elif _kind == 'div':
+            _op = '//' if _type == 'int' else '/'
+            return [self._set(op[3], '%s %s %s' % (self._value(op[1]), _op, self._value(op[2])))]
+        elif _kind in self.binary_ops:
+            _op = self.binary_ops[_kind]
+            return [self._set(op[3], '%s %s %s' % (self._value(op[1]), _op, self._value(op[2])))]
+        elif _kind == 'not':
+            return [self._set(op[2], 'not ' + self._value(op[1]))]
+        elif _kind == 'sitofp':
+            return [self._set(op[2], 'float(%s)' % self._value(op[1]))]
+        elif _kind == 'fptosi':
+            return [self._set(op[2], 'int(%s)' % self._value(op[1]))]
+        elif _kind == 'param':
+            self._params.append(self._value(op[1]))
+            return []
+        elif _kind == 'call':
+            _args = ''.join(', ' + arg for arg in self._params)
+            self._params = []
+            if op[1] not in self.frames:
+                return ['raise KeyError(%r)' % op[1]]
+            return [self._set(op[2], 'f_%s(top%s)' % (op[1][1:], _args))]
+        elif _kind == 'return':
+            if _type == 'void':
+                # the value of %0 is the address of the value to return
+                _v0 = self._value('%0')
+                return ['return None if %s is None else M[%s]' % (_v0, _v0)]
+            return ['return ' + self._value(op[1])]
+        elif _kind == 'print':
+            return ['out(%s)' % self._value(op[1])]
+        elif _kind == 'read':
+            return [self._set(op[1], 'read_%s()' % _type)]
+        elif _kind == 'jump':
+            if op[1] not in self._labels:
+                return ['raise KeyError(%r)' % op[1]]
+            return ['L = %d' % self._blocks[op[1]], 'continue']
+        elif _kind == 'cbranch':
+            if op[2] not in self._labels or op[3] not in self._labels:
+                return ['raise KeyError(%r)' % op[0]]
+            return ['L = %d if %s else %d' % (self._blocks[op[2]], self._value(op[1]), self._blocks[op[3]]),
+                    'continue']
+        return []
@@ -0,0 +1,211 @@
+# ---------------------------------------------------------------------------------
+# uc: uc_ucb.py
+#
+# Precompiled programs: the uCIR of a program saved in a compact binary file (.ucb),
+#                       that is loaded without running the front end again
+# ---------------------------------------------------------------------------------
+import hashlib
+import os
+import struct
+import sys
+from array import array
+
+# Bump it when the format of the files changes, so the old files are compiled again
+VERSION = 1
+
+MAGIC = b'\x7fUCB'
+
+# magic, version, flags & the sha256 of the source, then the sizes of the
+# constant pool & of the code
+_header = struct.Struct('<4sHH32sII')
+
+# flags of the header
+OPTIMIZED = 1
+
+
+class StaleProgram(Exception):
+    """ Raised when a .ucb file can't be used for the source being run. """
+
+
+def source_hash(source):
+    """ Return the sha256 digest of the source code string. """
+    return hashlib.sha256(source.encode()).digest()
+
+
+def dump(code, file, source, opt=False):
+    """
+    Write the uCIR code (a list of instruction tuples) to the binary
+    file, for the source code string. The file has a header, with the
+    version of the format, the flags of the code (if it was optimized)
+    and the hash of the source, followed by:
+
+        .the constant pool: each distinct opcode & operand of the code,
+         as a tag byte and its value (see _dump_value)
+        .the code: for each instruction, the number of its operands and
+         the pool ids of its opcode & operands, as 32-bit words
+
+    So the names of the temporaries, labels & globals are stored once.
+    """
+    _pool = []
+    _ids = {}
+    _words = array('i')
+    for op in code:
+        _words.append(len(op) - 1)
+        for arg in op:
+            # 1 & True are equal keys (and so are 0.0 & -0.0), so the type is part of
+            # the key, and the other values are kept by their repr
+            _key = (type(arg), arg if isinstance(arg, (str, int)) else repr(arg))
+            _id = _ids.get(_key)
+            if _id is None:
+                _id = _ids[_key] = len(_pool)
+                _pool.append(arg)
+            _words.append(_id)
+
+    _data = bytearray()
+    for value in _pool:
+        _dump_value(value, _data)
+    if sys.byteorder != 'little':
+        _words.byteswap()
+    file.write(_header.pack(MAGIC, VERSION, OPTIMIZED if opt else 0, source_hash(source),
+                            len(_pool), len(_words)))
+    file.write(_data)
+    file.write(_words.tobytes())
+
+
+def load(file, source, opt=False):
+    """
+    Read the uCIR code of the binary file, as a list of instruction
+    tuples. Raises StaleProgram if the file was not written by dump for
+    the same source & opt, or by the same version of the format.
+    """
+    _data = file.read()
+    try:
+        magic, version, flags, digest, npool, nwords = _header.unpack_from(_data)
+    except struct.error:
+        raise StaleProgram("not a precompiled uCIR file")
+    if magic != MAGIC:
+        raise StaleProgram("not a precompiled uCIR file")
+    if version != VERSION:
+        raise StaleProgram("format version %d, expected %d" % (version, VERSION))
+    if bool(flags & OPTIMIZED) != opt:
+        raise StaleProgram("compiled %s -opt" % ('with' if flags & OPTIMIZED else 'without'))
+    if digest != source_hash(source):
+        raise StaleProgram("the source changed")
+
+    try:
+        _pool = []
+        _offset = _header.size
+        for _ in range(npool):
+            value, _offset = _load_value(_data, _offset)
+            _pool.append(value)
+        _words = array('i')
+        _words.frombytes(_data[_offset:_offset + 4 * nwords])
+    except (struct.error, ValueError, IndexError):
+        raise StaleProgram("the file is truncated")
+    if len(_words) != nwords or _offset + 4 * nwords != len(_data):
+        raise StaleProgram("the file is truncated")
+    if sys.byteorder != 'little':
+        _words.byteswap()
+
+    # each instruction is the count of its operands & the pool ids of
+    # its opcode and operands, all checked, as the file may be corrupted
+    _code = []
+    _pc = 0
+    _ids = range(len(_pool))
+    while _pc < nwords:
+        _end = _pc + _words[_pc] + 2
+        if _words[_pc] < 0 or _end > nwords:
+            raise StaleProgram("the file is corrupted")
+        _inst = _words[_pc + 1:_end]
+        if not all(i in _ids for i in _inst):
+            raise StaleProgram("the file is corrupted")
+        _code.append(tuple([_pool[i] for i in _inst]))
+        _pc = _end
+    return _code
+
+
+def write(code, filename, source, opt=False):
+    """
+    Write the uCIR code to filename (see dump). The file is written
+    to a temporary name first, so no one loads a half written file.
+    """
+    _tmp = '%s.%d.tmp' % (filename, os.getpid())
+    with open(_tmp, 'wb') as file:
+        dump(code, file, source, opt)
+    os.replace(_tmp, filename)
+
+
+def read(filename, source, opt=False):
+    """
+    Read the uCIR code of filename (see load). Raises StaleProgram if
+    there is no such file.
+    """
+    try:
+        with open(filename, 'rb') as file:
+            return load(file, source, opt)
+    except FileNotFoundError:
+        raise StaleProgram("no precompiled uCIR")
+
+
+#
+# Values of the constant pool
+#
+_int = struct.Struct('<q')
+_float = struct.Struct('<d')
+_size = struct.Struct('<I')
+
+
+def _dump_value(value, data):
+    # a tag byte & the value: the ints that don't fit in 64 bits, as the
+    # strings, by their utf-8 bytes, and the lists item by item
+    if value is None:
+        data += b'N'
+    elif isinstance(value, bool):
+        data += b'T' if value else b'F'
+    elif isinstance(value, int):
+        if -2 ** 63 <= value < 2 ** 63:
+            data += b'i' + _int.pack(value)
+        else:
+            _text = str(value).encode()
+            data += b'I' + _size.pack(len(_text)) + _text
+    elif isinstance(value, float):
+        data += b'f' + _float.pack(value)
+    elif isinstance(value, str):
+        _text = value.encode()
+        data += b's' + _size.pack(len(_text)) + _text
+    elif isinstance(value, (list, tuple)):
+        data += (b'l' if isinstance(value, list) else b't') + _size.pack(len(value))
+        for item in value:
+            _dump_value(item, data)
+    else:
+        raise ValueError("can't store %r in a precompiled uCIR file" % (value,))
+
+
+def _load_value(data, offset):
+    # the value at offset, and the offset of the next one
+    _tag = data[offset:offset + 1]
+    offset += 1
+    if _tag == b'N':
+        return (None, offset)
+    elif _tag == b'T':
+        return (True, offset)
+    elif _tag == b'F':
+        return (False, offset)
+    elif _tag == b'i':
+        return (_int.unpack_from(data, offset)[0], offset + _int.size)
+    elif _tag == b'f':
+        return (_float.unpack_from(data, offset)[0], offset + _float.size)
+    elif _tag in (b's', b'I'):
+        _len = _size.unpack_from(data, offset)[0]
+        offset += _size.size
+        _text = data[offset:offset + _len].decode()
+        return (_text if _tag == b's' else int(_text), offset + _len)
+    elif _tag in (b'l', b't'):
+        _len = _size.unpack_from(data, offset)[0]
+        offset += _size.size
+        _items = []
+        for _ in range(_len):
+            item, offset = _load_value(data, offset)
+            _items.append(item)
+        return (_items if _tag == b'l' else tuple(_items), offset)
+    raise ValueError("unknown tag %r" % _tag)